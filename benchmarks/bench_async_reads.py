@@ -0,0 +1,165 @@
+"""
+Async read path benchmark
+Serves the app with uvicorn and compares the async read endpoints against the previous
+threadpool versions (mounted under /sync) at 50, 200 and 1000 concurrent clients
+
+    python -m benchmarks.bench_async_reads [seconds] [mode ...]
+
+Modes are "sync" and "async"; both run by default.
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+CONCURRENCY = (50, 200, 1000)
+USERS = 200
+PRODUCTS = 50
+
+
+def create_app():
+    # Factory for the uvicorn child process: the real app plus the old sync handlers under /sync
+    from fastapi import Depends
+    from sqlalchemy import text
+    from sqlalchemy.orm import Session
+
+    from cache import catalog_cache
+    from db import Order, get_db
+    from main import app
+
+    @app.get("/sync/check-purchase")
+    def check_purchase_sync(user_id: int, product_id: int, db: Session = Depends(get_db)):
+        count = db.query(Order).filter(Order.c_id == user_id, Order.p_id == product_id, Order.payment_status.in_(["PAID", "COD"])).count()
+        return {"purchase_count": count, "user_id": user_id, "product_id": product_id}
+
+    @app.get("/sync/check-email-log")
+    def check_email_log_sync(user_id: int, db: Session = Depends(get_db)):
+        result = db.execute(text("SELECT sent_at FROM email_logs WHERE user_id = :user_id ORDER BY sent_at DESC LIMIT 1"), {"user_id": user_id}).fetchone()
+        return {"send": result is None}
+
+    @app.get("/sync/recommend-products")
+    def recommend_products_sync(category: str, product_id: int, email: str, user_id: int, db: Session = Depends(get_db)):
+        products = catalog_cache.get(db).by_category.get(category, [])[:3]
+        return [{"title": p.title, "price": p.price, "discount": p.discount, "email": email, "user_id": user_id} for p in products]
+
+    return app
+
+
+def seed(path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from sqlalchemy import insert
+    from db import Base, EmailLog, Order, Products, SessionLocal, User, init_db
+
+    init_db()
+
+    with SessionLocal() as db:
+        db.execute(insert(User), [{"email": f"user{i}@example.com", "password": "x"} for i in range(USERS)])
+        db.execute(insert(Products), [
+            {"title": f"Product {i}", "description": "bench", "price": 100, "discount": 10, "image": "b.png", "category": f"cat{i % 5}", "stock_quantity": 100}
+            for i in range(PRODUCTS)
+        ])
+        db.execute(insert(Order), [
+            {"c_id": i % USERS + 1, "p_id": i % PRODUCTS + 1, "total_price": 90, "payment_status": "PAID", "is_delivered": False, "quantity": 1}
+            for i in range(USERS * 20)
+        ])
+        old = datetime.utcnow() - timedelta(days=1)
+        db.execute(insert(EmailLog), [{"user_id": i + 1, "product_id": 1, "sent_at": old} for i in range(USERS)])
+        db.commit()
+
+
+def requests_for(prefix, i):
+    user_id, product_id = i % USERS + 1, i % PRODUCTS + 1
+    return [
+        (f"{prefix}/check-purchase", {"user_id": user_id, "product_id": product_id}),
+        (f"{prefix}/check-email-log", {"user_id": user_id}),
+        (f"{prefix}/recommend-products", {"category": f"cat{i % 5}", "product_id": product_id, "email": "a@b.c", "user_id": user_id}),
+    ][i % 3]
+
+
+async def load(base_url, prefix, concurrency, seconds):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker(n):
+            nonlocal errors
+            i = n
+            while time.perf_counter() < deadline:
+                path, params = requests_for(prefix, i)
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path, params=params)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    errors += 1
+                i += concurrency
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+    return len(latencies) / elapsed, p99, errors
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def main(seconds=10.0, modes=("sync", "async")):
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(max(soft, 8192), hard), hard))
+    except (ImportError, ValueError):
+        pass
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    seed(path)
+    port = free_port()
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}", "N8N_WEBHOOK_URL": "", "RESERVATION_SWEEP_INTERVAL": "3600"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--factory", "benchmarks.bench_async_reads:create_app",
+         "--port", str(port), "--log-level", "warning", "--backlog", "4096"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url + "/check-email-log?user_id=1")
+        print(f"{'mode':>6} {'clients':>8} {'req/s':>9} {'p99 ms':>9} {'errors':>7}")
+        for mode in modes:
+            prefix = "/sync" if mode == "sync" else ""
+            for concurrency in CONCURRENCY:
+                rps, p99, errors = asyncio.run(load(base_url, prefix, concurrency, seconds))
+                print(f"{mode:>6} {concurrency:>8} {rps:>9.0f} {p99:>9.1f} {errors:>7}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(float(args[0]) if args else 10.0, tuple(args[1:]) or ("sync", "async"))
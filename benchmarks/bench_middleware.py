@@ -0,0 +1,97 @@
+"""
+Middleware overhead benchmark
+Drives a one-route Starlette app directly through ASGI and reports the per-request cost each middleware adds
+
+    python -m benchmarks.bench_middleware [requests]
+"""
+
+import asyncio
+import sys
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from csrf import CSRFMiddleware, generate_csrf_token
+from metrics import HttpMetrics, MetricsMiddleware, instrument_routes
+
+
+async def ok(request):
+    return PlainTextResponse("ok")
+
+
+async def passthrough(request, call_next):
+    return await call_next(request)
+
+
+async def legacy_csrf_cookie(request, call_next):
+    # The BaseHTTPMiddleware cookie issuer that CSRFMiddleware replaced, kept for comparison
+    response = await call_next(request)
+    if "csrf_token" not in request.cookies:
+        response.set_cookie("csrf_token", generate_csrf_token(), httponly=False, samesite="lax", secure=True)
+    return response
+
+
+def build(middleware=(), instrument=False):
+    app = Starlette(routes=[Route("/items/{item_id}", ok)], middleware=list(middleware))
+    if instrument:
+        instrument_routes(app.routes, http=instrument)
+    return app
+
+
+def stacks():
+    http = HttpMetrics()
+    return {
+        "bare": build(),
+        "metrics": build([Middleware(MetricsMiddleware, http=http)], instrument=http),
+        "base_http_noop": build([Middleware(BaseHTTPMiddleware, dispatch=passthrough)]),
+        "csrf_legacy": build([Middleware(BaseHTTPMiddleware, dispatch=legacy_csrf_cookie)]),
+        "csrf_asgi": build([Middleware(CSRFMiddleware)]),
+    }
+
+
+async def drive(app, requests):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/items/7", "raw_path": b"/items/7", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    never = asyncio.Event()
+
+    def receiver():
+        # Like a real server: the body once, then block until the client goes away
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await never.wait()
+
+        return receive
+
+    async def send(message):
+        pass
+
+    for _ in range(requests // 10):
+        await app(dict(scope), receiver(), send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receiver(), send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main(requests=20_000):
+    results = {name: asyncio.run(drive(app, requests)) for name, app in stacks().items()}
+    print(f"{requests} requests per stack")
+    print(f"{'stack':>16} {'us/request':>12} {'overhead us':>12}")
+    for name, micros in results.items():
+        print(f"{name:>16} {micros:>12.1f} {micros - results['bare']:>12.1f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 20_000)
@@ -0,0 +1,79 @@
+"""
+Settlement benchmark
+Times card settlement for 1, 10 and 100-item carts: the old two-commit ORM path against the bulk path
+
+    python -m benchmarks.bench_settlement [rounds]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db import Base, User, Products, Order, Payment, Transactions
+from payments import pending_orders, settle_card
+
+CART_SIZES = (1, 10, 100)
+
+
+def two_commit_settle(db, orders, intent_id, amount):
+    transaction = Transactions(stripe_intent_id=intent_id, amount=amount / 100, status="success")
+    db.add(transaction)
+    db.commit()
+    db.refresh(transaction)
+    for order in orders:
+        db.add(Payment(o_id=order.o_id, t_id=transaction.t_id, amount=order.total_price, method="CARD", status="completed"))
+        order.payment_status = "PAID"
+    db.commit()
+    return True
+
+
+def make_cart(db, user_id, product_id, size):
+    orders = [Order(c_id=user_id, p_id=product_id, quantity=1, total_price=10, payment_status="pending") for _ in range(size)]
+    db.add_all(orders)
+    db.commit()
+    # Load the cart the way /payment does rather than lazily refreshing each expired order
+    return pending_orders(db, user_id)
+
+
+def run(settle, session_factory, user_id, product_id, size, rounds):
+    elapsed = []
+    for i in range(rounds):
+        db = session_factory()
+        try:
+            orders = make_cart(db, user_id, product_id, size)
+            start = time.perf_counter()
+            settle(db, orders, f"pi_{settle.__name__}_{size}_{i}", size * 1000)
+            elapsed.append(time.perf_counter() - start)
+        finally:
+            db.close()
+    elapsed.sort()
+    return sum(elapsed) / len(elapsed) * 1000, elapsed[len(elapsed) // 2] * 1000
+
+
+def main(rounds=50):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = session_factory()
+    user = User(email="bench@example.com", password="x")
+    product = Products(title="Bench", description="bench", price=10, discount=0, image="bench.png", category="bench", stock_quantity=10**9)
+    db.add_all([user, product])
+    db.commit()
+    user_id, product_id = user.id, product.p_id
+    db.close()
+
+    print(f"{'cart':>6} {'two-commit ms':>15} {'bulk ms':>10} {'speedup':>9}")
+    for size in CART_SIZES:
+        old_mean, _ = run(two_commit_settle, session_factory, user_id, product_id, size, rounds)
+        new_mean, _ = run(settle_card, session_factory, user_id, product_id, size, rounds)
+        print(f"{size:>6} {old_mean:>15.2f} {new_mean:>10.2f} {old_mean / new_mean:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
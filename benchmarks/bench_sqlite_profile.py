@@ -0,0 +1,104 @@
+"""
+SQLite profile benchmark
+Runs concurrent readers and writers against the old engine defaults and the create_db_engine profile
+
+    python -m benchmarks.bench_sqlite_profile [seconds] [readers] [writers]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from db import Base, User, Products, Order, create_db_engine
+
+SEED_ORDERS = 20_000
+
+
+def seed(engine):
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all([User(email=f"user{i}@example.com", password="x") for i in range(100)])
+        db.add(Products(title="Bench", description="bench", price=10, discount=0, image="bench.png", category="bench", stock_quantity=10**9))
+        db.commit()
+        db.execute(insert(Order), [
+            {"c_id": i % 100 + 1, "p_id": 1, "total_price": 10, "payment_status": "pending", "is_delivered": False, "quantity": 1}
+            for i in range(SEED_ORDERS)
+        ])
+        db.commit()
+
+
+def run(engine, seconds, readers, writers):
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def reader(n):
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with session_factory() as db:
+                    db.execute(select(Order.o_id, Order.total_price).where(Order.c_id == n % 100 + 1).limit(50)).all()
+                key = "reads"
+            except OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+                latencies.append(time.perf_counter() - started)
+
+    def writer(n):
+        while not stop.is_set():
+            try:
+                with session_factory() as db:
+                    db.add(Order(c_id=n % 100 + 1, p_id=1, total_price=10, payment_status="pending", quantity=1))
+                    db.commit()
+                key = "writes"
+            except OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+    return counts["reads"] / seconds, counts["writes"] / seconds, counts["errors"], p99
+
+
+def main(seconds=5.0, readers=8, writers=2):
+    directory = tempfile.mkdtemp()
+    profiles = {
+        "defaults": lambda path: create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}),
+        "profile": lambda path: create_db_engine(f"sqlite:///{path}"),
+    }
+    print(f"{readers} readers, {writers} writers, {seconds:g}s per run")
+    print(f"{'engine':>10} {'reads/s':>10} {'writes/s':>10} {'errors':>8} {'read p99 ms':>12}")
+    for name, factory in profiles.items():
+        engine = factory(os.path.join(directory, f"{name}.db"))
+        seed(engine)
+        reads, writes, errors, p99 = run(engine, seconds, readers, writers)
+        engine.dispose()
+        print(f"{name:>10} {reads:>10.0f} {writes:>10.0f} {errors:>8} {p99:>12.2f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        float(args[0]) if len(args) > 0 else 5.0,
+        int(args[1]) if len(args) > 1 else 8,
+        int(args[2]) if len(args) > 2 else 2,
+    )
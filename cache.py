@@ -0,0 +1,382 @@
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields, replace
+from typing import Optional
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from db import Products, Order, SessionLocal
+
+
+@dataclass(frozen=True)
+class CatalogProduct:
+    p_id: int
+    title: str
+    description: Optional[str]
+    price: int
+    discount: int
+    image: str
+    category: str
+    stock_quantity: int
+
+
+PRODUCT_FIELDS = [f.name for f in fields(CatalogProduct)]
+
+
+class Catalog:
+    # Immutable view of the products table, ordered by p_id so keyset pages are a bisect away
+    def __init__(self, products):
+        self.products = products
+        self.ids = [p.p_id for p in products]
+        self.by_id = {p.p_id: p for p in products}
+        self.by_category = {}
+        for p in products:
+            self.by_category.setdefault(p.category, []).append(p)
+        self.category_ids = {c: [p.p_id for p in items] for c, items in self.by_category.items()}
+
+    def with_stock(self, stock: dict) -> "Catalog":
+        # Copy-on-write patch of stock levels: readers holding this snapshot keep a consistent
+        # view, and only the touched categories' lists are copied. Unknown ids are ignored.
+        catalog = Catalog.__new__(Catalog)
+        catalog.ids = self.ids
+        catalog.category_ids = self.category_ids
+        catalog.products = list(self.products)
+        catalog.by_id = dict(self.by_id)
+        catalog.by_category = dict(self.by_category)
+        copied = set()
+        for p_id, quantity in stock.items():
+            i = bisect.bisect_left(self.ids, p_id)
+            if i == len(self.ids) or self.ids[i] != p_id:
+                continue
+            product = replace(catalog.products[i], stock_quantity=quantity)
+            catalog.products[i] = catalog.by_id[p_id] = product
+            category = product.category
+            if category not in copied:
+                catalog.by_category[category] = list(catalog.by_category[category])
+                copied.add(category)
+            catalog.by_category[category][bisect.bisect_left(self.category_ids[category], p_id)] = product
+        return catalog
+
+    def page(self, after=None, before=None, limit=24, category=None):
+        if category:
+            products = self.by_category.get(category, [])
+            ids = self.category_ids.get(category, [])
+        else:
+            products, ids = self.products, self.ids
+
+        if before is not None:
+            end = bisect.bisect_left(ids, before)
+            start = max(0, end - limit)
+            rows = products[start:end]
+            if not rows:
+                return self.page(limit=limit, category=category)
+            return {"items": rows, "next_cursor": rows[-1].p_id, "prev_cursor": rows[0].p_id if start > 0 else None}
+
+        start = bisect.bisect_right(ids, after) if after is not None else 0
+        rows = products[start:start + limit]
+        return {
+            "items": rows,
+            "next_cursor": rows[-1].p_id if rows and start + limit < len(ids) else None,
+            "prev_cursor": rows[0].p_id if after is not None and rows and start > 0 else None,
+        }
+
+
+class LRUCache:
+    # Bounded LRU with a per-entry deadline; all operations are O(1) under one lock
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+
+
+class PrincipalCache:
+    # Keyed by (user id, token exp) so entries never outlive the token that produced them
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = LRUCache(maxsize, ttl)
+
+    def get(self, user_id: int, exp: int) -> Optional[Principal]:
+        return self._cache.get((user_id, exp))
+
+    def set(self, user_id: int, exp: int, principal: Principal):
+        self._cache.set((user_id, exp), principal, ttl=max(exp - time.time(), 0))
+
+    def invalidate(self, user_id: int):
+        # Rare write path (password change), a linear sweep is fine
+        self._cache.pop_where(lambda key: key[0] == user_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class VersionCounter:
+    def __init__(self):
+        self.version = 0
+        self.updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            self.updated_at = time.time()
+
+
+class CatalogCache:
+    # Catalog writes call bump() and readers rebuild lazily when the version moved or the TTL ran out;
+    # stock-only writes call update_stock() with the committed levels instead.
+    # generation/updated_at follow the built snapshot's content, so a TTL rebuild that picks up an
+    # out-of-band write moves the HTTP validators just like a bump() does
+    def __init__(self, ttl: float, session_factory=SessionLocal):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self.version = 0
+        self.generation = 0
+        self.updated_at = time.time()
+        self._catalog = None
+        self._built_version = -1
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.patches = 0
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            self.updated_at = time.time()
+
+    def update_stock(self, stock: dict):
+        # Stock-only writes (orders, cancels, expired holds) patch the current snapshot with the
+        # committed levels instead of forcing a full rebuild. A snapshot that was already stale
+        # is left for the next reader to rebuild.
+        if not stock:
+            return
+        with self._lock:
+            self.version += 1
+            if self._catalog is not None and self._built_version == self.version - 1:
+                self._catalog = self._catalog.with_stock(stock)
+                self._built_version = self.version
+                self.patches += 1
+            self.generation += 1
+            self.updated_at = time.time()
+
+    def _fresh(self):
+        return self._catalog is not None and self._built_version == self.version and time.monotonic() - self._built_at < self.ttl
+
+    def _store(self, version, rows) -> Catalog:
+        products = [CatalogProduct(*row) for row in rows]
+        if self._catalog is None or products != self._catalog.products:
+            self.generation += 1
+            self.updated_at = time.time()
+        self._catalog = Catalog(products)
+        self._built_version = version
+        self._built_at = time.monotonic()
+        self.rebuilds += 1
+        return self._catalog
+
+    def _rebuild(self, db: Session) -> Catalog:
+        with self._lock:
+            if self._fresh():
+                return self._catalog
+            version = self.version
+            rows = db.query(*[getattr(Products, name) for name in PRODUCT_FIELDS]).order_by(Products.p_id).all()
+            return self._store(version, rows)
+
+    def _load(self) -> Catalog:
+        with self.session_factory() as db:
+            return self._rebuild(db)
+
+    def get(self, db: Session) -> Catalog:
+        if self._fresh():
+            self.hits += 1
+            return self._catalog
+        self.misses += 1
+        return self._rebuild(db)
+
+    async def get_async(self) -> Catalog:
+        # Rebuilds run on a worker thread with a sync session: building the rows and indexes is
+        # CPU work that would stall every other request if it ran on the event loop
+        if self._fresh():
+            self.hits += 1
+            return self._catalog
+        self.misses += 1
+        return await run_in_threadpool(self._load)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "generation": self.generation,
+            "size": len(self._catalog.products) if self._catalog else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+            "patches": self.patches,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+@dataclass(frozen=True)
+class OrderRow:
+    o_id: int
+    p_id: int
+    title: str
+    description: Optional[str]
+    category: str
+    price: int
+    discount: int
+    total_price: float
+    quantity: int
+    is_delivered: bool
+    payment_status: Optional[str]
+
+
+ORDER_COLUMNS = [
+    Order.o_id, Order.p_id, Products.title, Products.description, Products.category, Products.price,
+    Products.discount, Order.total_price, Order.quantity, Order.is_delivered, Order.payment_status,
+]
+
+
+def order_row(row) -> OrderRow:
+    # Unpaid orders have no payment status as far as the views are concerned
+    values = list(row)
+    values[-1] = None if values[-1] == "pending" else values[-1]
+    return OrderRow(*values)
+
+
+def query_order_page(db: Session, user_id: int, after=None, before=None, limit=24):
+    # Keyset page over (c_id, o_id); fetches one extra row to know whether another page exists
+    query = db.query(*ORDER_COLUMNS).join(Products, Order.p_id == Products.p_id).filter(Order.c_id == user_id)
+    if before is not None:
+        rows = query.filter(Order.o_id < before).order_by(Order.o_id.desc()).limit(limit + 1).all()
+        more = len(rows) > limit
+        rows = [order_row(r) for r in reversed(rows[:limit])]
+        if not rows:
+            return query_order_page(db, user_id, limit=limit)
+        return {"items": rows, "next_cursor": rows[-1].o_id, "prev_cursor": rows[0].o_id if more else None}
+
+    if after is not None:
+        query = query.filter(Order.o_id > after)
+    rows = query.order_by(Order.o_id).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = [order_row(r) for r in rows[:limit]]
+    return {
+        "items": rows,
+        "next_cursor": rows[-1].o_id if more else None,
+        "prev_cursor": rows[0].o_id if after is not None and rows else None,
+    }
+
+
+class OrderHistoryCache:
+    # One LRU entry per user holding the pages read so far. Writers call invalidate(user_id);
+    # the per-user version stops a read that raced a write from caching what it saw.
+    MAX_PAGES_PER_USER = 32
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = LRUCache(maxsize, ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def page(self, db: Session, user_id: int, after=None, before=None, limit=24):
+        key = (after, before, limit)
+        version = self._versions.get(user_id, 0)
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] == version and key in entry[1]:
+            return entry[1][key]
+
+        page = query_order_page(db, user_id, after=after, before=before, limit=limit)
+        with self._lock:
+            if self._versions.get(user_id, 0) == version:
+                pages = entry[1] if entry is not None and entry[0] == version else {}
+                if len(pages) >= self.MAX_PAGES_PER_USER:
+                    pages = {}
+                self._cache.set(user_id, (version, {**pages, key: page}))
+        return page
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                self._cache.pop(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+catalog_cache = CatalogCache(ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")))
+rating_stats_version = VersionCounter()
+principal_cache = PrincipalCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "300")),
+)
+order_history = OrderHistoryCache(
+    maxsize=int(os.getenv("ORDER_HISTORY_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("ORDER_HISTORY_CACHE_TTL", "300")),
+)
@@ -0,0 +1,194 @@
+import secrets
+from urllib.parse import parse_qsl
+
+from starlette.requests import cookie_parser
+from starlette.responses import JSONResponse
+
+CSRF_COOKIE = "csrf_token"
+CSRF_FIELD = "csrf_token"
+CSRF_HEADER = b"x-csrf-token"
+UNSAFE_METHODS = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+
+
+def generate_csrf_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def header_value(headers, name: bytes):
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+
+class FieldScanner:
+    # Pulls one field out of a multipart body as it streams past; file parts are skipped, never stored
+    def __init__(self, boundary: bytes, name: str):
+        from multipart.multipart import MultipartParser
+
+        self.name = name.encode()
+        self.value = None
+        self._header_field = b""
+        self._header_value = b""
+        self._in_field = False
+        self._data = bytearray()
+        self.parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._add_header_field,
+            "on_header_value": self._add_header_value,
+            "on_header_end": self._header_end,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def _part_begin(self):
+        self._in_field = False
+        self._data.clear()
+
+    def _add_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _add_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _header_end(self):
+        from multipart.multipart import parse_options_header
+
+        if self._header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self._header_value)
+            self._in_field = options.get(b"name") == self.name and b"filename" not in options
+        self._header_field = self._header_value = b""
+
+    def _part_data(self, data, start, end):
+        if self._in_field:
+            self._data += data[start:end]
+
+    def _part_end(self):
+        if self._in_field and self.value is None:
+            self.value = self._data.decode("utf-8", "replace")
+
+    def feed(self, chunk: bytes):
+        self.parser.write(chunk)
+
+
+class CSRFMiddleware:
+    # Pure ASGI double-submit check. Issues the cookie on first contact and, on protected
+    # paths, compares it with the submitted token before the endpoint sees the request.
+    # Form bodies are read only as far as the token field, then replayed to the app untouched.
+    def __init__(self, app, protected=(), protected_prefixes=(), skip_prefixes=("/static", "/uploads"), secure=True):
+        self.app = app
+        self.protected = frozenset(protected)
+        self.protected_prefixes = tuple(protected_prefixes)
+        self.skip_prefixes = tuple(skip_prefixes)
+        self.cookie_attrs = "; Path=/; SameSite=lax" + ("; Secure" if secure else "")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        cookie_header = header_value(scope["headers"], b"cookie")
+        cookie = None
+        if cookie_header is not None and CSRF_COOKIE.encode() in cookie_header:
+            cookie = cookie_parser(cookie_header.decode("latin-1")).get(CSRF_COOKIE)
+
+        issued = None
+        if not cookie:
+            issued = generate_csrf_token()
+            send = self._sender(send, issued)
+
+        path = scope["path"]
+        if scope["method"] in UNSAFE_METHODS and (path in self.protected or path.startswith(self.protected_prefixes)):
+            token, receive = await self._submitted_token(scope, receive)
+            error = None
+            if not cookie or not token:
+                error = "CSRF token missing"
+            elif not secrets.compare_digest(cookie.encode(), token.encode()):
+                error = "Invalid CSRF token"
+            if error:
+                await JSONResponse({"detail": error}, status_code=403)(scope, receive, send)
+                return
+
+        if issued:
+            # Pages rendered by this request embed the new token in their forms
+            scope["headers"] = self._with_request_cookie(scope["headers"], cookie_header, issued)
+        await self.app(scope, receive, send)
+
+    def _sender(self, send, token):
+        set_cookie = f"{CSRF_COOKIE}={token}{self.cookie_attrs}".encode("latin-1")
+        prefix = f"{CSRF_COOKIE}=".encode()
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                headers = message.setdefault("headers", [])
+                if not isinstance(headers, list):
+                    headers = message["headers"] = list(headers)
+                # Login and registration rotate the token themselves
+                if not any(k == b"set-cookie" and v.startswith(prefix) for k, v in headers):
+                    headers.append((b"set-cookie", set_cookie))
+            await send(message)
+
+        return send_with_cookie
+
+    @staticmethod
+    def _with_request_cookie(headers, cookie_header, token):
+        pair = f"{CSRF_COOKIE}={token}".encode()
+        if cookie_header is None:
+            return [*headers, (b"cookie", pair)]
+        return [(k, v + b"; " + pair if k == b"cookie" and v is cookie_header else v) for k, v in headers]
+
+    async def _submitted_token(self, scope, receive):
+        header = header_value(scope["headers"], CSRF_HEADER)
+        if header:
+            return header.decode("latin-1"), receive
+
+        content_type = (header_value(scope["headers"], b"content-type") or b"").decode("latin-1")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            messages, body = await self._read_until(receive, None)
+            token = dict(parse_qsl(body.decode("latin-1"))).get(CSRF_FIELD)
+        elif content_type.startswith("multipart/form-data"):
+            from multipart.multipart import parse_options_header
+
+            boundary = parse_options_header(content_type)[1].get(b"boundary")
+            if not boundary:
+                return None, receive
+            scanner = FieldScanner(boundary, CSRF_FIELD)
+            messages, _ = await self._read_until(receive, scanner)
+            token = scanner.value
+        else:
+            return None, receive
+        return token, self._replay(messages, receive)
+
+    @staticmethod
+    async def _read_until(receive, scanner):
+        # Buffers request messages until the body ends or the scanner has found its field
+        messages, chunks = [], []
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            chunk = message.get("body", b"")
+            if scanner is None:
+                chunks.append(chunk)
+            else:
+                try:
+                    scanner.feed(chunk)
+                except Exception:
+                    break
+                if scanner.value is not None:
+                    break
+            if not message.get("more_body", False):
+                break
+        return messages, b"".join(chunks)
+
+    @staticmethod
+    def _replay(messages, receive):
+        messages = list(reversed(messages))
+
+        async def replay():
+            if messages:
+                return messages.pop()
+            return await receive()
+
+        return replay
@@ -1,13 +1,102 @@
-from sqlalchemy import Column, Integer, Text ,String, create_engine , ForeignKey , Boolean ,DateTime ,Index
+from sqlalchemy import Column, Integer, Text ,String, create_engine , ForeignKey , Boolean ,DateTime ,Index , event , text , inspect
 from sqlalchemy.orm import sessionmaker, declarative_base , relationship
+from sqlalchemy.ext.asyncio import create_async_engine , async_sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool , QueuePool
 from pydantic import BaseModel , EmailStr 
-from typing import Optional
+from typing import Optional , List
 from sqlalchemy.sql import func
 import datetime
-
-DATABASE_URL = "sqlite:///./data/test.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+import os
+import time
+from query_stats import instrument_engine
+from metrics import db_pool_checkout_wait
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/test.db")
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the single writer and
+# NORMAL sync is durable in WAL mode except across power loss; the rest trade memory for fewer syscalls.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+# Sized to the request threadpool (40 threads) so sync endpoints never queue on the pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+class TimedCheckout:
+    # Records how long each checkout waits for a free connection (or for a new one to open)
+    checkout_wait = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.checkout_wait.observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    checkout_wait = db_pool_checkout_wait.labels("sync")
+
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    checkout_wait = db_pool_checkout_wait.labels("async")
+
+
+def create_db_engine(url=None, pragmas=None, **kwargs):
+    url = url or DATABASE_URL
+    if not url.startswith("sqlite"):
+        kwargs.setdefault("poolclass", TimedQueuePool)
+        return instrument_engine(create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT, pool_pre_ping=True, **kwargs))
+
+    if ":memory:" not in url and url != "sqlite://" and "poolclass" not in kwargs:
+        kwargs["poolclass"] = TimedQueuePool
+        kwargs.setdefault("pool_size", DB_POOL_SIZE)
+        kwargs.setdefault("max_overflow", DB_MAX_OVERFLOW)
+        kwargs.setdefault("pool_timeout", DB_POOL_TIMEOUT)
+    new_engine = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+    apply_sqlite_pragmas(new_engine, SQLITE_PRAGMAS if pragmas is None else pragmas)
+    return instrument_engine(new_engine)
+
+
+def create_async_db_engine(url=None, pragmas=None, **kwargs):
+    # Same database and profile as create_db_engine, driven through aiosqlite
+    url = make_url(url or DATABASE_URL)
+    if url.get_backend_name() != "sqlite":
+        kwargs.setdefault("poolclass", TimedAsyncQueuePool)
+        new_engine = create_async_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT, pool_pre_ping=True, **kwargs)
+        instrument_engine(new_engine.sync_engine)
+        return new_engine
+
+    if url.database and url.database != ":memory:" and "poolclass" not in kwargs:
+        # aiosqlite defaults to NullPool, which would reopen the file and rerun the pragmas per request
+        kwargs.update(poolclass=TimedAsyncQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    new_engine = create_async_engine(url.set(drivername="sqlite+aiosqlite"), **kwargs)
+    apply_sqlite_pragmas(new_engine.sync_engine, SQLITE_PRAGMAS if pragmas is None else pragmas)
+    instrument_engine(new_engine.sync_engine)
+    return new_engine
+
+
+def apply_sqlite_pragmas(target, pragmas):
+    @event.listens_for(target, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -30,6 +119,8 @@ class Products(Base):
     category=Column(String,nullable=False)
     stock_quantity=Column(Integer,nullable=False,default=100)
 
+    __table_args__ = (Index("idx_products_category_pid", "category", "p_id"),)
+
 class Order(Base):
     __tablename__ = "orders"
     o_id=Column(Integer,primary_key=True,index=True)
@@ -40,6 +131,22 @@ class Order(Base):
     payment_status=Column(String, nullable=False, default="pending")
     quantity=Column(Integer,nullable=False)
     payment = relationship("Payment", back_populates="order", uselist=False)
+    # Every cart, checkout, delivery and review check filters on the customer first
+    __table_args__ = (
+        Index("idx_orders_customer","c_id","o_id"),
+        Index("idx_orders_customer_status","c_id","payment_status"),
+        Index("idx_orders_customer_product","c_id","p_id","is_delivered","payment_status"),
+    )
+
+class StockReservation(Base):
+    # Stock held for a pending order. Stock is taken when the hold is placed, so availability
+    # stays a primary-key read of products.stock_quantity; the hold records what to give back.
+    __tablename__="stock_reservations"
+    id=Column(Integer,primary_key=True)
+    order_id=Column(Integer,ForeignKey("orders.o_id"),nullable=False,unique=True)
+    product_id=Column(Integer,ForeignKey("products.p_id"),nullable=False)
+    quantity=Column(Integer,nullable=False)
+    expires_at=Column(DateTime,nullable=False,index=True)
 
 class Transactions(Base):
     __tablename__="transactions"
@@ -49,6 +156,29 @@ class Transactions(Base):
     amount=Column(Integer,nullable=False)
     status=Column(String,nullable=False)
 
+class PaymentIntentOrder(Base):
+    # The orders a PaymentIntent was created for, recorded server side when the intent is made
+    __tablename__="payment_intent_orders"
+    id=Column(Integer,primary_key=True)
+    intent_id=Column(String,nullable=False)
+    o_id=Column(Integer,ForeignKey("orders.o_id"),nullable=False,index=True)
+    created_at=Column(DateTime,server_default=func.now(),nullable=False)
+
+    __table_args__ = (Index("idx_payment_intent_orders_intent", "intent_id", "o_id", unique=True),)
+
+class PaymentEvent(Base):
+    __tablename__="payment_events"
+    id=Column(Integer,primary_key=True,index=True)
+    event_id=Column(String,unique=True,nullable=False)
+    type=Column(String,nullable=False)
+    intent_id=Column(String,nullable=True,index=True)
+    payload=Column(Text,nullable=False)
+    received_at=Column(DateTime,server_default=func.now(),nullable=False)
+    processed_at=Column(DateTime,nullable=True)
+    attempts=Column(Integer,nullable=False,default=0)
+
+    __table_args__ = (Index("idx_payment_events_pending", "processed_at", "id"),)
+
 class Payment(Base):
     __tablename__="payment"
     pay_id=Column(Integer,primary_key=True,index=True )
@@ -72,6 +202,29 @@ class Review(Base):
     user=relationship("User")
     product = relationship("Products")
 
+    __table_args__ = (Index("idx_reviews_user_product", "user_id", "product_id"),)
+
+
+class ProductRatingStats(Base):
+    __tablename__ = "product_rating_stats"
+
+    product_id = Column(Integer, ForeignKey("products.p_id"), primary_key=True)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    star_1 = Column(Integer, nullable=False, default=0)
+    star_2 = Column(Integer, nullable=False, default=0)
+    star_3 = Column(Integer, nullable=False, default=0)
+    star_4 = Column(Integer, nullable=False, default=0)
+    star_5 = Column(Integer, nullable=False, default=0)
+
+    @property
+    def avg_rating(self):
+        return round(self.rating_sum / self.rating_count, 1) if self.rating_count else 0
+
+    @property
+    def histogram(self):
+        return {star: getattr(self, f"star_{star}") for star in range(1, 6)}
+
 
 class ProductView(Base):
     __tablename__ = "product_views"
@@ -84,6 +237,11 @@ class ProductView(Base):
     user = relationship("User")
     product = relationship("Products")
 
+    __table_args__ = (
+        Index("idx_product_views_user_time", "user_id", "viewed_at"),
+        Index("idx_user_product_view", "user_id", "product_id"),
+    )
+
 
 
 
@@ -97,6 +255,8 @@ class EmailLog(Base):
 
     user = relationship("User")
 
+    __table_args__ = (Index("idx_email_user_time", "user_id", "sent_at"),)
+
 
 class EmailCheck(BaseModel):
     email:EmailStr 
@@ -176,11 +336,100 @@ class EmailLogRequest(BaseModel):
     user_id: int
     product_id: int
 
+class OrderLine(BaseModel):
+    product_id:int
+    quantity:int
 
-Base.metadata.create_all(bind=engine)
+class BatchOrderRequest(BaseModel):
+    items:List[OrderLine]
+
+class BulkDeliveryRequest(BaseModel):
+    order_ids:List[int]
+
+
+# Full-text index over the catalog. External-content FTS5 table kept in sync by triggers,
+# so every writer (the app, edit.py, ad-hoc SQL) updates it without extra code.
+PRODUCTS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        title, description, category,
+        content='products', content_rowid='p_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, title, description, category)
+        VALUES (new.p_id, new.title, new.description, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, title, description, category)
+        VALUES ('delete', old.p_id, old.title, old.description, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF title, description, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, title, description, category)
+        VALUES ('delete', old.p_id, old.title, old.description, old.category);
+        INSERT INTO products_fts(rowid, title, description, category)
+        VALUES (new.p_id, new.title, new.description, new.category);
+    END""",
+]
+
+
+def create_search_index(connection):
+    for ddl in PRODUCTS_FTS_DDL:
+        connection.execute(text(ddl))
+    connection.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+
+def ensure_search_index(bind):
+    # create_all skips existing tables, so databases created before the index need it added here
+    if "products_fts" in inspect(bind).get_table_names():
+        return
+    with bind.begin() as connection:
+        create_search_index(connection)
+
+
+def missing_indexes(bind):
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    return [
+        index
+        for table in Base.metadata.sorted_tables if table.name in tables
+        for index in table.indexes if index.name not in {i["name"] for i in inspector.get_indexes(table.name)}
+    ]
+
+
+def ensure_indexes(bind):
+    # create_all only creates indexes together with their table, so add any missing ones to existing databases
+    for index in missing_indexes(bind):
+        index.create(bind)
+
+
+@event.listens_for(Products.__table__, "after_create")
+def _products_created(target, connection, **kw):
+    create_search_index(connection)
+
+
+@event.listens_for(Products.__table__, "before_drop")
+def _products_dropping(target, connection, **kw):
+    connection.execute(text("DROP TABLE IF EXISTS products_fts"))
+
+
+def init_db(bind=None):
+    # Called from the app's startup phase (and scripts), never at import time
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    ensure_search_index(bind)
+    ensure_indexes(bind)
+
+
+def check_schema(bind=None) -> list:
+    # Read-only comparison of the database against the models; returns what is missing
+    bind = bind or engine
+    tables = set(inspect(bind).get_table_names())
+    problems = [f"missing table {t.name}" for t in Base.metadata.sorted_tables if t.name not in tables]
+    problems += [f"missing index {i.name} on {i.table.name}" for i in missing_indexes(bind)]
+    if "products_fts" not in tables:
+        problems.append("missing search index products_fts")
+    return problems
 
-Index("idx_user_product_view", ProductView.user_id, ProductView.product_id)
-Index("idx_email_user_time", EmailLog.user_id, EmailLog.sent_at)
 
 def get_db():
     db = SessionLocal()
@@ -189,3 +438,7 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
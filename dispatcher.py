@@ -0,0 +1,147 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import external_call_duration, external_call_errors
+from resilience import CircuitBreaker, backoff_delay
+
+logger = logging.getLogger("webhooks")
+
+
+class WebhookDispatcher:
+    # Outbound webhooks are queued and sent from one background thread over a pooled
+    # session, so page latency never depends on the receiver being up or fast.
+    def __init__(self, url, maxsize: int = 1000, batch_size: int = 1, retries: int = 3, timeout: float = 2.0, breaker: CircuitBreaker = None):
+        self.url = url
+        self.batch_size = batch_size
+        self.retries = retries
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._session = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.short_circuited = 0
+        self._latency = external_call_duration.labels("webhook")
+        self._error_count = external_call_errors.labels("webhook")
+
+    def submit(self, event: dict) -> bool:
+        if not self.url:
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _new_session(self):
+        # requests is imported on first send, keeping it off the app's import path
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        return session
+
+    def _send(self, batch):
+        import requests
+
+        if self._session is None:
+            self._session = self._new_session()
+        # A batch size of 1 keeps the receiver's original single-object payload
+        payload = batch[0] if self.batch_size == 1 else batch
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                self.short_circuited += len(batch)
+                return False
+            started = time.perf_counter()
+            try:
+                response = self._session.post(self.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.RequestException:
+                self._latency.observe(time.perf_counter() - started)
+                self._error_count.inc()
+                self.breaker.failure()
+                if attempt == self.retries:
+                    logger.exception("Webhook failed after %d attempts", attempt + 1)
+                    break
+                self.retried += 1
+                if self._stop.wait(backoff_delay(attempt)):
+                    break
+                continue
+            self._latency.observe(time.perf_counter() - started)
+            self.breaker.success()
+            self.sent += len(batch)
+            return True
+        self.failed += len(batch)
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._send(self._drain(first))
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="webhook-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, drain_timeout: float = 2.0):
+        if self._thread is None:
+            return
+        # Give queued events a short grace period before shutting down
+        deadline = time.monotonic() + drain_timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retried": self.retried,
+            "short_circuited": self.short_circuited,
+            "breaker": self.breaker.state,
+        }
+
+
+def create_webhook_dispatcher():
+    return WebhookDispatcher(
+        os.getenv("N8N_WEBHOOK_URL", "https://sahil9900.app.n8n.cloud/webhook-test/product-view"),
+        maxsize=int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000")),
+        batch_size=int(os.getenv("WEBHOOK_BATCH_SIZE", "1")),
+        retries=int(os.getenv("WEBHOOK_RETRIES", "3")),
+        timeout=float(os.getenv("WEBHOOK_TIMEOUT", "2")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("WEBHOOK_BREAKER_RESET", "30")),
+        ),
+    )
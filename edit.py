@@ -1,16 +1,6 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from db import Products, Base  # assuming your file is named db.py
-
-# Database URL
-DATABASE_URL = "sqlite:///./data/test.db"
-
-# Create engine
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-
-# Create session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from db import Products, Base , SessionLocal , init_db  # assuming your file is named db.py
+from cache import catalog_cache
 
 def update_product_category(product_id: int, new_category: str):
     db: Session = SessionLocal()
@@ -26,6 +16,8 @@ def update_product_category(product_id: int, new_category: str):
         product.category = new_category
         db.commit()
         db.refresh(product)
+        # Only reaches a cache living in this process; app workers pick it up on TTL expiry
+        catalog_cache.bump()
 
         print(f"Updated Product ID {product_id} → Category set to '{new_category}'")
 
@@ -38,4 +30,5 @@ def update_product_category(product_id: int, new_category: str):
 
 
 if __name__ == "__main__":
+    init_db()
     update_product_category(6, "Lifestyle & Misc")
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from cache import order_history
+from db import Order
+
+DELIVERY_CHUNK_SIZE = int(os.getenv("DELIVERY_CHUNK_SIZE", "1000"))
+
+
+def deliver_chunk(db: Session, order_ids) -> dict:
+    # One bounded transaction per chunk. Only paid orders that are still open are flipped,
+    # the same rule PUT /updatedeliver applies; RETURNING tells us whose history to drop.
+    rows = db.execute(
+        update(Order)
+        .where(Order.o_id.in_(order_ids), Order.is_delivered == False, Order.payment_status.in_(["PAID", "COD"]))
+        .values(is_delivered=True)
+        .returning(Order.c_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    order_history.invalidate(*{row.c_id for row in rows})
+    return {"requested": len(order_ids), "updated": len(rows)}
+
+
+def chunked(items, size: int = None):
+    size = size or DELIVERY_CHUNK_SIZE
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def csv_lines(stream):
+    buffer = b""
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+async def csv_order_id_chunks(stream, size: int = None, invalid: list = None):
+    # Order id in the first column, optional header row; yields chunks while the body is still arriving
+    size = size or DELIVERY_CHUNK_SIZE
+    chunk, first = [], True
+    async for line in csv_lines(stream):
+        value = line.split(b",", 1)[0].strip().strip(b'"')
+        if not value:
+            continue
+        try:
+            chunk.append(int(value))
+        except ValueError:
+            if not first and invalid is not None:
+                invalid.append(value.decode(errors="replace"))
+        first = False
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,202 @@
+import datetime
+import logging
+import os
+import threading
+from collections import Counter
+
+from sqlalchemy import update, delete, insert, bindparam, exists
+from sqlalchemy.orm import Session
+
+from cache import catalog_cache, order_history
+from db import Products, Order, StockReservation, PaymentIntentOrder, Transactions
+
+logger = logging.getLogger("reservations")
+
+RESERVATION_TTL = datetime.timedelta(minutes=int(os.getenv("RESERVATION_TTL_MINUTES", "30")))
+# How long an unsettled PaymentIntent keeps its orders from being swept; a late webhook or
+# post-back inside this window still finds them
+INTENT_GRACE = datetime.timedelta(hours=int(os.getenv("PAYMENT_INTENT_GRACE_HOURS", "24")))
+
+
+def note_stock(db: Session, levels):
+    # New stock levels written in this session, handed to the catalog cache once committed
+    db.info.setdefault("stock_levels", {}).update(levels)
+
+
+def committed_stock(db: Session) -> dict:
+    # Call after commit; returns and forgets the levels noted since the last call
+    return db.info.pop("stock_levels", {})
+
+
+def decrement_stock(db: Session, product_id: int, quantity: int) -> bool:
+    # Check and decrement in one statement so concurrent orders can never oversell.
+    # Runs on the caller's session; the caller commits it together with the order rows.
+    remaining = db.execute(
+        update(Products)
+        .where(Products.p_id == product_id, Products.stock_quantity >= quantity)
+        .values(stock_quantity=Products.stock_quantity - quantity)
+        .returning(Products.stock_quantity)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if remaining is None:
+        return False
+    note_stock(db, {product_id: remaining})
+    return True
+
+
+def hold_stock(db: Session, holds):
+    # holds: (order_id, product_id, quantity) for stock already taken by decrement_stock
+    if not holds:
+        return
+    expires_at = datetime.datetime.utcnow() + RESERVATION_TTL
+    db.execute(insert(StockReservation), [
+        {"order_id": o, "product_id": p, "quantity": q, "expires_at": expires_at} for o, p, q in holds
+    ])
+
+
+def commit_holds(db: Session, order_ids):
+    # Payment keeps the stock; the holds just stop being releasable
+    db.execute(delete(StockReservation).where(StockReservation.order_id.in_(order_ids)))
+
+
+def extend_holds(db: Session, user_id: int):
+    # A customer on the payment page keeps their cart for another full hold period
+    db.execute(
+        update(StockReservation)
+        .where(StockReservation.order_id.in_(
+            db.query(Order.o_id).filter(Order.c_id == user_id, Order.payment_status == "pending").scalar_subquery()
+        ))
+        .values(expires_at=datetime.datetime.utcnow() + RESERVATION_TTL)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def restock(db: Session, quantities: Counter):
+    if quantities:
+        db.execute(
+            update(Products.__table__)
+            .where(Products.__table__.c.p_id == bindparam("pid"))
+            .values(stock_quantity=Products.__table__.c.stock_quantity + bindparam("qty")),
+            [{"pid": p, "qty": q} for p, q in quantities.items()],
+        )
+        # executemany cannot RETURNING on SQLite, so read the new levels back in the same transaction
+        note_stock(db, db.query(Products.p_id, Products.stock_quantity).filter(Products.p_id.in_(list(quantities))).all())
+
+
+def release_order(db: Session, order: Order):
+    # Cancelling a pending order hands its stock back; the caller commits
+    db.execute(delete(StockReservation).where(StockReservation.order_id == order.o_id))
+    restock(db, Counter({order.p_id: order.quantity}))
+    db.delete(order)
+
+
+def paying_orders(db: Session, order_ids, now) -> set:
+    # Orders on a PaymentIntent that was created recently and has not been settled yet
+    return {
+        o for (o,) in db.query(PaymentIntentOrder.o_id).filter(
+            PaymentIntentOrder.o_id.in_(order_ids),
+            PaymentIntentOrder.created_at >= now - INTENT_GRACE,
+            ~exists().where(Transactions.stripe_intent_id == PaymentIntentOrder.intent_id),
+        )
+    }
+
+
+def expire_holds(db: Session, limit: int = 500, now=None):
+    # Releases up to `limit` expired holds in one transaction: the abandoned pending orders are
+    # removed and their stock returned. Orders with an open PaymentIntent may still be paid, so
+    # their holds are pushed back a full period instead. Returns (holds handled, customer ids touched).
+    now = now or datetime.datetime.utcnow()
+    holds = (
+        db.query(StockReservation.id, StockReservation.order_id, StockReservation.product_id, StockReservation.quantity)
+        .filter(StockReservation.expires_at < now)
+        .order_by(StockReservation.expires_at)
+        .limit(limit)
+        .all()
+    )
+    if not holds:
+        return 0, set()
+
+    order_ids = [h.order_id for h in holds]
+    paying = paying_orders(db, order_ids, now)
+    if paying:
+        db.execute(
+            update(StockReservation)
+            .where(StockReservation.order_id.in_(paying))
+            .values(expires_at=now + RESERVATION_TTL)
+            .execution_options(synchronize_session=False)
+        )
+        holds = [h for h in holds if h.order_id not in paying]
+    abandoned = {
+        row.o_id: row.c_id
+        for row in db.query(Order.o_id, Order.c_id).filter(Order.o_id.in_(order_ids), Order.payment_status == "pending")
+        if row.o_id not in paying
+    }
+    if holds:
+        db.execute(delete(StockReservation).where(StockReservation.id.in_([h.id for h in holds])))
+    if abandoned:
+        db.execute(
+            delete(Order)
+            .where(Order.o_id.in_(list(abandoned)), Order.payment_status == "pending")
+            .execution_options(synchronize_session=False)
+        )
+    quantities = Counter()
+    for h in holds:
+        if h.order_id in abandoned:
+            quantities[h.product_id] += h.quantity
+    restock(db, quantities)
+    db.commit()
+    return len(order_ids), set(abandoned.values())
+
+
+class ReservationSweeper:
+    # Expires stale holds in batches on a background thread
+    def __init__(self, session_factory, batch_size: int = 500, interval: float = 60.0):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.expired = 0
+        self.sweeps = 0
+
+    def sweep(self) -> int:
+        total = 0
+        while True:
+            db = self.session_factory()
+            try:
+                count, user_ids = expire_holds(db, self.batch_size)
+                stock = committed_stock(db)
+            finally:
+                db.close()
+            if user_ids:
+                order_history.invalidate(*user_ids)
+            catalog_cache.update_stock(stock)
+            total += count
+            if count < self.batch_size:
+                break
+        self.expired += total
+        self.sweeps += 1
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Reservation sweeper error")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="reservation-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {"expired": self.expired, "sweeps": self.sweeps}
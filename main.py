@@ -1,5 +1,11 @@
+import os
+from dotenv import load_dotenv
+
+# Load .env before the project modules read their settings (DATABASE_URL, SQLITE_*, ...)
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)),".env"))
+
 from fastapi import FastAPI, Form, Depends, Request,UploadFile ,File , HTTPException
-from fastapi.responses import RedirectResponse , JSONResponse 
+from fastapi.responses import RedirectResponse , JSONResponse , Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import  Session
@@ -7,56 +13,174 @@ from pydantic import  ValidationError
 from typing import List ,Optional
 from jose import jwt , JWTError
 from datetime import datetime, timedelta
-from db import User , Products ,Order ,Transactions ,Payment,EmailCheck  , OrderResponse ,ProductManger , ProductCategory  , get_db ,ProductResponse , Review , ProductView ,EmailLog , EmailLogRequest
+from db import get_async_db , async_engine , engine , init_db , check_schema , User , Products ,Order ,Transactions ,Payment,EmailCheck  , OrderResponse ,ProductManger , ProductCategory  , get_db , SessionLocal ,ProductResponse , Review , ProductView ,EmailLog , EmailLogRequest , ProductRatingStats , BatchOrderRequest , BulkDeliveryRequest
 import shutil 
 from starlette.middleware.sessions import SessionMiddleware
-from passlib.context import CryptContext 
+from hashing import pwd , bcrypt_pool , PoolSaturated
 import uuid
-import requests
-from sqlalchemy import func , or_ , text
+from sqlalchemy import func , or_ , text , select
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.exceptions import HTTPException as StarletteHTTPException
-import os
 import secrets
 import random
-import stripe 
-
-from dotenv import load_dotenv
-
-load_dotenv()
-
-
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-
-
-app = FastAPI(title="Order portal")
+from ratings import record_rating , get_rating_stats
+from cache import catalog_cache , rating_stats_version , principal_cache , Principal , order_history
+from search import search_products
+from inventory import decrement_stock , hold_stock , extend_holds , release_order , committed_stock , ReservationSweeper
+from orders import place_orders , MAX_BATCH_LINES
+from fulfilment import deliver_chunk , chunked , csv_order_id_chunks
+from view_buffer import create_view_buffer
+from dispatcher import create_webhook_dispatcher
+from stripe_client import create_stripe_client , StripeError , verify_webhook_signature
+from query_stats import QueryStatsMiddleware
+from csrf import CSRFMiddleware , generate_csrf_token
+from metrics import MetricsMiddleware , instrument_routes , render as render_metrics , CONTENT_TYPE as METRICS_CONTENT_TYPE , threadpool_busy , threadpool_size , db_pool_checked_out , template_render
+import anyio.to_thread
+import jinja2
+from payments import pending_orders , cart_amount , settle_cod , settle_card , transaction_status , intent_metadata , record_intent , orders_for_intent , store_payment_event , succeeded_intent , PaymentEventWorker
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import hashlib
+import sys
+import time
+import logging
+from email.utils import formatdate , parsedate_to_datetime
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL","INFO"),format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger("startup")
+
+
+view_buffer = create_view_buffer(SessionLocal)
+webhook_dispatcher = create_webhook_dispatcher()
+stripe_client = create_stripe_client()
+payment_worker = PaymentEventWorker(SessionLocal,batch_size=int(os.getenv("PAYMENT_EVENT_BATCH","100")))
+reservation_sweeper = ReservationSweeper(SessionLocal,interval=float(os.getenv("RESERVATION_SWEEP_INTERVAL","60")))
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+FULFILMENT_API_KEY = os.getenv("FULFILMENT_API_KEY")
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
+# Form posts checked against the csrf_token cookie by CSRFMiddleware
+CSRF_PROTECTED_PATHS = {"/login","/register","/password","/add-product","/payment","/updatediscount","/add-review"}
+# create: create missing tables/indexes, check: refuse to start on drift, skip: trust the migrations
+STARTUP_SCHEMA = os.getenv("STARTUP_SCHEMA","create")
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP","1") == "1"
+startup_timings = {}
+
+
+def startup_step(name,fn,*args) :
+    started = time.perf_counter()
+    result = fn(*args)
+    startup_timings[name] = round((time.perf_counter()-started)*1000,1)
+    logger.info("startup %s took %.1fms",name,startup_timings[name])
+    return result
+
+def setup_schema() :
+    if STARTUP_SCHEMA == "create" :
+        init_db()
+    elif STARTUP_SCHEMA == "check" :
+        problems = check_schema()
+        if problems :
+            raise RuntimeError("Schema check failed: " + "; ".join(problems))
+
+def load_templates() :
+    for name in templates.env.list_templates(extensions=["html"]) :
+        templates.env.get_template(name)
+
+def warm_catalog() :
+    with SessionLocal() as db :
+        catalog_cache.get(db)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_timings.clear()
+    started = time.perf_counter()
+    os.makedirs("uploads",exist_ok=True)
+    if STARTUP_SCHEMA != "skip" :
+        await run_in_threadpool(startup_step,"schema",setup_schema)
+    startup_step("templates",load_templates)
+    if STARTUP_WARMUP :
+        await run_in_threadpool(startup_step,"catalog",warm_catalog)
+    view_buffer.start()
+    webhook_dispatcher.start()
+    stripe_client.start()
+    payment_worker.start()
+    reservation_sweeper.start()
+    startup_timings["total"] = round((time.perf_counter()-started)*1000,1)
+    yield
+    reservation_sweeper.stop()
+    payment_worker.stop()
+    await stripe_client.aclose()
+    webhook_dispatcher.stop()
+    view_buffer.stop()
+    await async_engine.dispose()
+
+
+app = FastAPI(title="Order portal",lifespan=lifespan)
 
 
 app.add_middleware(SessionMiddleware,secret_key=os.getenv("SESSION_SECRET", "dev-secret"),same_site="lax",https_only=False,session_cookie="session",)
+app.add_middleware(CSRFMiddleware,protected=CSRF_PROTECTED_PATHS,protected_prefixes=("/orders/cancel/",))
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/static", StaticFiles(directory="static",check_dir=False), name="static")
+app.mount("/uploads", StaticFiles(directory="uploads",check_dir=False), name="uploads")
 
-templates = Jinja2Templates(directory="Template")
+class TimedTemplate(jinja2.Template) :
+    def render(self,*args,**kwargs) :
+        started = time.perf_counter()
+        try :
+            return super().render(*args,**kwargs)
+        finally :
+            template_render.labels(self.name).observe(time.perf_counter()-started)
 
+templates = Jinja2Templates(directory="Template")
+templates.env.template_class = TimedTemplate
 
-pwd=CryptContext(schemes=["bcrypt"],deprecated = "auto")
 
 SECRET_KEY = os.getenv("JWT_SECRET","dev-jwt-secret")
 ALGORITHM = "HS256"
+BOOT_ID = secrets.token_hex(4)
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 
 
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "24"))
+CATALOG_MAX_PAGE_SIZE = 100
+ORDER_PAGE_SIZE = int(os.getenv("ORDER_PAGE_SIZE", "50"))
+
+
+def run_bcrypt(fn,*args) :
+    try :
+        return bcrypt_pool.run(fn,*args)
+    except PoolSaturated :
+        raise HTTPException(status_code=503,detail="Server busy, please retry",headers={"Retry-After":"1"})
 
 def hash_password(password:str)->str :
     if len(password.encode("utf-8")) > 72 :
         raise HTTPException(status_code=400,detail="Password to long ")
-    return pwd.hash(password)
+    return run_bcrypt(pwd.hash,password)
 
 def verify_password(plain_password:str,hashed_password:str) -> bool :
-    return pwd.verify(plain_password,hashed_password)
+    return run_bcrypt(pwd.verify,plain_password,hashed_password)
+
+# Endpoints await these: a sync endpoint would hold a request threadpool thread for the whole hash
+async def run_bcrypt_async(fn,*args) :
+    try :
+        return await bcrypt_pool.run_async(fn,*args)
+    except PoolSaturated :
+        raise HTTPException(status_code=503,detail="Server busy, please retry",headers={"Retry-After":"1"})
+
+async def hash_password_async(password:str) -> str :
+    if len(password.encode("utf-8")) > 72 :
+        raise HTTPException(status_code=400,detail="Password to long ")
+    return await run_bcrypt_async(pwd.hash,password)
+
+async def verify_password_async(plain_password:str,hashed_password:str) -> bool :
+    return await run_bcrypt_async(pwd.verify,plain_password,hashed_password)
 
-def generate_csrf_token():
-    return secrets.token_urlsafe(32)
+async def verify_and_rehash_async(plain_password:str,hashed_password:str) -> tuple :
+    # Returns (ok, new_hash); new_hash is set when the stored cost differs from BCRYPT_ROUNDS
+    return await run_bcrypt_async(pwd.verify_and_update,plain_password,hashed_password)
 
 def create_access_token(user_id:int) -> str:
     payload = {
@@ -66,32 +190,36 @@ def create_access_token(user_id:int) -> str:
     return jwt.encode(payload,SECRET_KEY,algorithm=ALGORITHM)
 
 
-def csrf_protect(request: Request,csrf_token: str | None =Form(None)):
-    cookie_token = request.cookies.get("csrf_token")
-
-    if not cookie_token or not csrf_token:
-        raise HTTPException(status_code=403, detail="CSRF token missing")
-
-    if not secrets.compare_digest(cookie_token, csrf_token):
-        raise HTTPException(status_code=403, detail="Invalid CSRF token")
-    print("COOKIE:", request.cookies.get("csrf_token"))
-    print("FORM:", csrf_token)
-
-
-
-def user_authentication(request:Request,db:Session=Depends(get_db))-> User:
+def decode_access_token(request:Request) -> Optional[tuple] :
     token = request.cookies.get("access_token")
     if not token :
-        raise HTTPException(status_code=401)
-
+        return None
     try :
         payload = jwt.decode(token,SECRET_KEY,algorithms=[ALGORITHM])
         user_id = int(payload.get("sub"))
-    except JWTError :
+    except (JWTError,TypeError,ValueError) :
+        return None
+    if not user_id :
+        return None
+    return user_id , int(payload.get("exp") or 0)
+
+def load_principal(db:Session,user_id:int,exp:int) -> Optional[Principal] :
+    principal = principal_cache.get(user_id,exp)
+    if principal :
+        return principal
+    row = db.query(User.id,User.email).filter(User.id==user_id).first()
+    if not row :
+        return None
+    principal = Principal(id=row.id,email=row.email)
+    principal_cache.set(user_id,exp,principal)
+    return principal
+
+def user_authentication(request:Request,db:Session=Depends(get_db))-> Principal:
+    claims = decode_access_token(request)
+    if not claims :
         raise HTTPException(status_code=401)
 
-
-    user = db.query(User).filter(User.id==user_id).first()
+    user = load_principal(db,*claims)
     if not user :
         raise  HTTPException(status_code=401, detail="Invalid session")
     return user
@@ -103,19 +231,69 @@ def no_cache(response):
     return response
 
 
+def token_user_id(request:Request) -> Optional[int] :
+    claims = decode_access_token(request)
+    return claims[0] if claims else None
+
 def get_current_user_optional(request:Request,db:Session):
-    token = request.cookies.get("access_token")
-    if not token : 
-        return None 
-    try :
-        payload = jwt.decode(token , SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = int(payload.get("sub"))
-        if not user_id :
-            return None 
-    except JWTError :
+    claims = decode_access_token(request)
+    if not claims : 
         return None 
 
-    return db.query(User).filter(User.id == user_id).first()
+    return load_principal(db,*claims)
+
+async def get_current_user_optional_async(request:Request,db:AsyncSession):
+    claims = decode_access_token(request)
+    if not claims :
+        return None
+    principal = principal_cache.get(*claims)
+    if principal :
+        return principal
+    return await db.run_sync(load_principal,*claims)
+
+def page_etag(request:Request,user_id:Optional[int]) -> str :
+    # Pages only change when the catalog or rating stats move, so versions + identity make a validator.
+    # Call it after catalog_cache.get*() so a TTL rebuild is reflected in the generation.
+    # Logged-in pages embed the csrf cookie in their forms, so it is part of the identity too.
+    identity = f"{user_id}:{request.cookies.get('csrf_token')}" if user_id else "anon"
+    raw = f"{BOOT_ID}:{catalog_cache.version}:{catalog_cache.generation}:{rating_stats_version.version}:{identity}:{request.url.path}?{request.url.query}"
+    return 'W/"' + hashlib.blake2b(raw.encode(),digest_size=12).hexdigest() + '"'
+
+def last_modified() -> float :
+    return max(catalog_cache.updated_at,rating_stats_version.updated_at)
+
+def validator_headers(user_id:Optional[int],etag:str) -> dict :
+    headers = {
+        "ETag":etag,
+        "Cache-Control":"private, no-cache" if user_id else "public, no-cache",
+    }
+    # HTTP dates have one-second resolution: until that second is over a later write could share it,
+    # so the date is only a safe validator once it has passed
+    modified = last_modified()
+    if int(time.time()) > int(modified) :
+        headers["Last-Modified"] = formatdate(modified,usegmt=True)
+    return headers
+
+def not_modified(request:Request,user_id:Optional[int],etag:str):
+    # A pending flash message must be rendered (and consumed), so never short-circuit past it
+    if "flash" in request.session :
+        return None
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None :
+        tags = [t.strip() for t in if_none_match.split(",")]
+        if "*" not in tags and etag not in tags and etag[2:] not in tags :
+            return None
+    else :
+        if_modified_since = request.headers.get("if-modified-since")
+        if user_id or not if_modified_since :
+            return None
+        try :
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError,ValueError) :
+            return None
+        if int(last_modified()) > since :
+            return None
+    return Response(status_code=304,headers=validator_headers(user_id,etag))
 
 def generate_otp()-> str :
     return str(random.randint(100000,999999))
@@ -136,23 +314,68 @@ async def not_found_handler(request: Request, exc: StarletteHTTPException):
         return templates.TemplateResponse("404.html",{"request": request,"path": request.url.path},status_code=404)
     return JSONResponse(status_code=exc.status_code,content={"detail": exc.detail},)
 
-@app.middleware("http")
-async def ensure_csrf_cookie(request: Request, call_next):
-    response = await call_next(request)
-    if "csrf_token" not in request.cookies:
-        csrf_token = generate_csrf_token()
-        response.set_cookie(key="csrf_token",value=csrf_token,httponly=False,samesite="lax",secure=True)
-    return response
+
+
+def clamp_page_size(limit:Optional[int],default:int=CATALOG_PAGE_SIZE) -> int :
+    if not limit :
+        return default
+    return max(1, min(limit, CATALOG_MAX_PAGE_SIZE))
+
+def fetch_catalog_page(db:Session,after:Optional[int]=None,before:Optional[int]=None,limit:int=CATALOG_PAGE_SIZE,category:Optional[str]=None):
+    return catalog_cache.get(db).page(after=after,before=before,limit=limit,category=category)
+
+def page_links(request:Request,page:dict):
+    base = request.url.remove_query_params(["after","before"])
+    next_url = str(base.include_query_params(after=page["next_cursor"])) if page["next_cursor"] is not None else None
+    prev_url = str(base.include_query_params(before=page["prev_cursor"])) if page["prev_cursor"] is not None else None
+    return next_url , prev_url
 
 
 @app.get("/")
-def products_home(request:Request,db:Session=Depends(get_db)):
-    products = db.query(Products).all()
-    user = get_current_user_optional(request,db)
-    reviews=db.query(Review.product_id,func.avg(Review.rating).label("avg_rating"),func.count(Review.r_id).label("review_count")).group_by(Review.product_id).all()
-    review_map={r.product_id : {"avg":round(r.avg_rating,1),"count":r.review_count} for r in reviews}
+async def products_home(request:Request,after:Optional[int]=None,before:Optional[int]=None,limit:Optional[int]=None,category:Optional[str]=None,db:AsyncSession=Depends(get_async_db)):
+    catalog = await catalog_cache.get_async()
+    user_id = token_user_id(request)
+    etag = page_etag(request,user_id)
+    cached = not_modified(request,user_id,etag)
+    if cached :
+        return cached
+
+    page = catalog.page(after=after,before=before,limit=clamp_page_size(limit),category=category)
+    products = page["items"]
+    user = await get_current_user_optional_async(request,db)
+    stats = await db.run_sync(get_rating_stats,[p.p_id for p in products])
+    review_map={pid : {"avg":s.avg_rating,"count":s.rating_count} for pid , s in stats.items() if s.rating_count}
+    next_url , prev_url = page_links(request,page)
     flash_message=request.session.pop("flash",None)
-    return templates.TemplateResponse("products.html",{"request":request,"products":products,"user":user, "user_id": user.id if user else None,"flash":flash_message,"review_map":review_map})
+    response = templates.TemplateResponse("products.html",{"request":request,"products":products,"user":user, "user_id": user.id if user else None,"flash":flash_message,"review_map":review_map,"category":category,"next_url":next_url,"prev_url":prev_url})
+    if not flash_message :
+        response.headers.update(validator_headers(user_id,etag))
+    return response
+
+@app.get("/api/products",tags=["Catalog endpoint"])
+def products_api(after:Optional[int]=None,before:Optional[int]=None,limit:Optional[int]=None,category:Optional[str]=None,db:Session=Depends(get_db)):
+    page = fetch_catalog_page(db,after=after,before=before,limit=clamp_page_size(limit),category=category)
+    return {
+        "items":[ProductResponse.model_validate(p).model_dump() for p in page["items"]],
+        "next_cursor":page["next_cursor"],
+        "prev_cursor":page["prev_cursor"],
+    }
+
+@app.get("/search",tags=["Search endpoint"])
+def search_page(request:Request,q:str="",page:int=1,limit:Optional[int]=None,db:Session=Depends(get_db)):
+    page = max(page,1)
+    results = search_products(db,q,page=page,limit=clamp_page_size(limit))
+    products = results["items"]
+    user = get_current_user_optional(request,db)
+    stats = get_rating_stats(db,[p["p_id"] for p in products])
+    review_map={pid : {"avg":s.avg_rating,"count":s.rating_count} for pid , s in stats.items() if s.rating_count}
+    next_url = str(request.url.include_query_params(page=page + 1)) if results["has_more"] else None
+    prev_url = str(request.url.include_query_params(page=page - 1)) if page > 1 else None
+    return templates.TemplateResponse("products.html",{"request":request,"products":products,"user":user, "user_id": user.id if user else None,"review_map":review_map,"query":q,"next_url":next_url,"prev_url":prev_url})
+
+@app.get("/api/search",tags=["Search endpoint"])
+def search_api(q:str="",page:int=1,limit:Optional[int]=None,db:Session=Depends(get_db)):
+    return search_products(db,q,page=max(page,1),limit=clamp_page_size(limit))
 
 @app.get("/login")
 def login_page(request: Request, db: Session = Depends(get_db)):
@@ -161,19 +384,24 @@ def login_page(request: Request, db: Session = Depends(get_db)):
     return templates.TemplateResponse("index.html",{"request": request, "user": None})
 
 @app.post("/login",tags=["Login User endpoint"])
-def login_form(request: Request,email: str = Form(...),password: str = Form(...),db: Session = Depends(get_db),csrf=Depends(csrf_protect)):
+async def login_form(request: Request,email: str = Form(...),password: str = Form(...),db: AsyncSession = Depends(get_async_db)):
     try :
         EmailCheck(email=email)
     except ValidationError :
         return templates.TemplateResponse("index.html",{"request":request ,"user": None,"error":"Invalid email address"})
     
-    user=db.query(User).filter(User.email == email).first()
+    user=await db.scalar(select(User).where(User.email == email))
     if not user :
         error = "Email not found please register"
         return templates.TemplateResponse("register.html",{"request":request,"error":error})
     
-    if user and not verify_password(password,user.password):
+    valid , new_hash = await verify_and_rehash_async(password,user.password)
+    if not valid :
         return templates.TemplateResponse("index.html",{"request":request,"user": None,"error":"Password does not match"})
+
+    if new_hash :
+        user.password = new_hash
+        await db.commit()
     
     access_token= create_access_token(user.id)
     csrf_token = generate_csrf_token()
@@ -195,19 +423,18 @@ def register_page(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
 @app.post("/register",tags=["Register User endpoint"])
-def register_user(request:Request, email:str=Form(...),password:str=Form(...),db:Session=Depends(get_db),csrf=Depends(csrf_protect)):
+async def register_user(request:Request, email:str=Form(...),password:str=Form(...),db:AsyncSession=Depends(get_async_db)):
     try :
         EmailCheck(email=email)
     except ValidationError :
         return templates.TemplateResponse("register.html",{"request":request ,"error":"Invalid email address"})
     
-    if db.query(User).filter(User.email == email).first() :
+    if await db.scalar(select(User.id).where(User.email == email)) :
         return templates.TemplateResponse("index.html",{"request":request,"message" :"User already exists"})
-    hashed=hash_password(password)
+    hashed=await hash_password_async(password)
     new_user = User(email=email,password=hashed)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
 
     token = create_access_token(new_user.id)
     csrf_token = generate_csrf_token()
@@ -222,15 +449,15 @@ def display_forget_password(request:Request):
     return templates.TemplateResponse("forget-password.html",{"request":request})
 
 @app.post("/password",tags=["Forget Password endpoint"])
-def update_password(request:Request,email:str=Form(...),otp:str=Form(...),password:str=Form(...),db:Session=Depends(get_db),csrf=Depends(csrf_protect)):
+async def update_password(request:Request,email:str=Form(...),otp:str=Form(...),password:str=Form(...),db:AsyncSession=Depends(get_async_db)):
 
-    check_email=db.query(User).filter(User.email==email).first()
+    check_email=await db.scalar(select(User).where(User.email==email))
      
     if not check_email :
         error="Email not found"
         return templates.TemplateResponse("forget-password.html",{"request":request,"error":error})
     
-    if verify_password(password,check_email.password):
+    if await verify_password_async(password,check_email.password):
         error="New and old password is same either login or use different password"
         return templates.TemplateResponse("forget-password.html",{"request":request,"error":error})
     
@@ -239,9 +466,9 @@ def update_password(request:Request,email:str=Form(...),otp:str=Form(...),passwo
         return templates.TemplateResponse("register.html",{"request":request,"error":error})
     
 
-    check_email.password=hash_password(password)
-    db.commit()
-    db.refresh(check_email)
+    check_email.password=await hash_password_async(password)
+    await db.commit()
+    principal_cache.invalidate(check_email.id)
 
     request.session["success"]="Password updated successfully please login"
     return RedirectResponse(url="/login",status_code=303)
@@ -252,7 +479,7 @@ def addproducts_page(request:Request,current_user:User = Depends(user_authentica
     return no_cache(response)
 
 @app.post("/add-product", tags=["Add product endpoint"])
-def addproduct(request: Request,title: Optional[str] = Form(None),description: Optional[str] = Form(None),price: Optional[float] = Form(None),discount: Optional[float] = Form(None),image: Optional[UploadFile] = File(None),category: Optional[str] = Form(None),quantity:Optional[int] = Form(None),current_user: Optional[User] = Depends(user_authentication),db: Session = Depends(get_db),csrf=Depends(csrf_protect)):
+def addproduct(request: Request,title: Optional[str] = Form(None),description: Optional[str] = Form(None),price: Optional[float] = Form(None),discount: Optional[float] = Form(None),image: Optional[UploadFile] = File(None),category: Optional[str] = Form(None),quantity:Optional[int] = Form(None),current_user: Optional[User] = Depends(user_authentication),db: Session = Depends(get_db)):
     if not current_user:
         return RedirectResponse("/login", status_code=303)
 
@@ -285,6 +512,7 @@ def addproduct(request: Request,title: Optional[str] = Form(None),description: O
     db.add(new_product)
     db.commit()
     db.refresh(new_product)
+    catalog_cache.bump()
     flash(request, "Product added successfully", "success")
 
     return RedirectResponse("/", status_code=303)
@@ -292,7 +520,7 @@ def addproduct(request: Request,title: Optional[str] = Form(None),description: O
 @app.post("/order",tags=["Order product endpoint"])
 def create_order(request:Request,product_id : int =Form(...),quantity:int = Form(...),current_user: User = Depends(user_authentication),db:Session=Depends(get_db)):
     
-    product=db.query(Products).filter(Products.p_id==product_id).first()
+    product=db.query(Products.p_id,Products.price,Products.discount).filter(Products.p_id==product_id).first()
     if not product :
         return RedirectResponse(url="/",status_code=303)
     
@@ -304,20 +532,14 @@ def create_order(request:Request,product_id : int =Form(...),quantity:int = Form
         flash(request, "Out of stock", "error")
         return RedirectResponse(url="/",status_code=303)
     
-    if quantity > product.stock_quantity :
-        flash(request, "Thanks for adding the product , but we don't have stock right now . Stay tunned we will update it !", "error")
-        return RedirectResponse(url="/",status_code=303)
-    
-    
-    product.stock_quantity = product.stock_quantity - quantity 
+    existing_order = db.query(Order.o_id).filter(Order.c_id==current_user.id,Order.p_id==product.p_id,Order.is_delivered==False).first()
 
-    if product.stock_quantity < 0 :
-        flash(request, "This product is currently out of stock", "error")
+    if existing_order :
         return RedirectResponse(url="/",status_code=303)
-    
-    existing_order = db.query(Order).filter(Order.c_id==current_user.id,Order.p_id==product.p_id,Order.is_delivered==False).first()
 
-    if existing_order :
+    if not decrement_stock(db,product.p_id,quantity) :
+        db.rollback()
+        flash(request, "Thanks for adding the product , but we don't have stock right now . Stay tunned we will update it !", "error")
         return RedirectResponse(url="/",status_code=303)
 
     discounted_price = product.price - (product.price * product.discount) /100 
@@ -326,11 +548,54 @@ def create_order(request:Request,product_id : int =Form(...),quantity:int = Form
     order=Order(c_id=current_user.id,p_id=product.p_id,total_price=total_price,payment_status="pending",is_delivered = False ,quantity=quantity)
 
     db.add(order)
+    db.flush()
+    hold_stock(db,[(order.o_id,product.p_id,quantity)])
     db.commit()
+    catalog_cache.update_stock(committed_stock(db))
+    order_history.invalidate(current_user.id)
     flash(request, "Product added to cart successfully ", "success")
 
     return RedirectResponse(url="/",status_code=303)
 
+async def batch_order_lines(request:Request) -> list :
+    # JSON body {"items":[{"product_id":..,"quantity":..}]} or a form with repeated product_id/quantity fields
+    if request.headers.get("content-type","").startswith("application/json") :
+        try :
+            body = BatchOrderRequest.model_validate(await request.json())
+        except (ValueError,ValidationError) :
+            raise HTTPException(status_code=422, detail="Invalid order request")
+        return [line.model_dump() for line in body.items]
+    form = await request.form()
+    product_ids , quantities = form.getlist("product_id") , form.getlist("quantity")
+    if len(product_ids) != len(quantities) :
+        raise HTTPException(status_code=422, detail="Every product needs a quantity")
+    try :
+        return [{"product_id":int(p),"quantity":int(q)} for p,q in zip(product_ids,quantities)]
+    except ValueError :
+        raise HTTPException(status_code=422, detail="Invalid order request")
+
+@app.post("/orders/batch",tags=["Order product endpoint"])
+async def create_orders(request:Request,current_user: User = Depends(user_authentication),db:Session=Depends(get_db)):
+    lines = await batch_order_lines(request)
+    if not lines or len(lines) > MAX_BATCH_LINES :
+        raise HTTPException(status_code=422, detail=f"Send between 1 and {MAX_BATCH_LINES} items")
+
+    results = await run_in_threadpool(place_orders,db,current_user.id,lines)
+    created = sum(1 for r in results if r["status"] == "created")
+    if created :
+        catalog_cache.update_stock(committed_stock(db))
+        order_history.invalidate(current_user.id)
+
+    if request.headers.get("content-type","").startswith("application/json") :
+        return {"created": created, "failed": len(results) - created, "items": results}
+
+    if created == len(results) :
+        flash(request, "Products added to cart successfully ", "success")
+    else :
+        errors = "; ".join(sorted({r["error"] for r in results if r["status"] == "error"}))
+        flash(request, f"Added {created} of {len(results)} products to cart : {errors}", "error")
+    return RedirectResponse(url="/",status_code=303)
+
 @app.post("/checkout/start")
 def start_checkout(request: Request,current_user: User = Depends(user_authentication),db: Session = Depends(get_db)):
     orders = db.query(Order).filter(Order.c_id == current_user.id,Order.payment_status == "pending").first()
@@ -342,88 +607,138 @@ def start_checkout(request: Request,current_user: User = Depends(user_authentica
 
     return RedirectResponse("/payment", status_code=303)
 
+async def cart_payment_intent(request:Request,db:Session,user_id:int,order_ids:list,amount:int) -> dict :
+    # One PaymentIntent per cart, remembered in the session: reloads of /payment reuse it,
+    # an amount change modifies it, and a different set of pending orders starts a new one.
+    cached = request.session.get("payment_intent")
+    if cached and cached["user_id"] == user_id and cached["orders"] == order_ids :
+        if cached["amount"] != amount :
+            await stripe_client.modify_payment_intent(cached["id"],amount)
+            cached["amount"] = amount
+            request.session["payment_intent"] = cached
+        return cached
+
+    intent = await stripe_client.create_payment_intent(amount,"inr",intent_metadata(user_id,order_ids))
+    await run_in_threadpool(record_intent,db,intent["id"],order_ids)
+    cached = {"id":intent["id"],"client_secret":intent["client_secret"],"user_id":user_id,"orders":order_ids,"amount":amount}
+    request.session["payment_intent"] = cached
+    return cached
+
 @app.get("/payment",tags=["Payments"])
-def payment_page(request: Request,current_user: User = Depends(user_authentication),db: Session = Depends(get_db)):
+async def payment_page(request: Request,current_user: User = Depends(user_authentication),db: Session = Depends(get_db)):
     if not request.session.get("can_pay"):
         return RedirectResponse("/", status_code=303)
 
-    orders = db.query(Order).filter(Order.c_id == current_user.id,Order.payment_status == "pending").all()
+    orders = await run_in_threadpool(pending_orders,db,current_user.id)
 
     if not orders:
         return RedirectResponse("/", status_code=303)
 
     total_amount = round(sum(o.total_price for o in orders), 2)
+    await run_in_threadpool(extend_holds,db,current_user.id)
 
-    intent = stripe.PaymentIntent.create(amount=int(total_amount * 100),currency="inr",automatic_payment_methods={"enabled": True},metadata={"user_id": current_user.id})
+    try :
+        intent = await cart_payment_intent(request,db,current_user.id,sorted(o.o_id for o in orders),cart_amount(orders))
+    except StripeError :
+        flash(request, "Payments are temporarily unavailable, please try again shortly", "error")
+        return RedirectResponse("/", status_code=303)
 
-    response = templates.TemplateResponse("payment.html",{"request": request,"total_amount": total_amount,"client_secret": intent.client_secret,"stripe_pk": os.getenv("STRIPE_PUBLISHABLE_KEY")})
+    response = templates.TemplateResponse("payment.html",{"request": request,"total_amount": total_amount,"client_secret": intent["client_secret"],"stripe_pk": os.getenv("STRIPE_PUBLISHABLE_KEY")})
 
     return no_cache(response)
 
 @app.post("/payment",tags=["Payment"])
-def process_payment(request: Request,method: str = Form(...),payment_intent_id: str = Form(None),current_user: User = Depends(user_authentication),db: Session = Depends(get_db),csrf=Depends(csrf_protect)):
-    orders = db.query(Order).filter(Order.c_id == current_user.id,Order.payment_status == "pending").all()
+async def process_payment(request: Request,method: str = Form(...),payment_intent_id: str = Form(None),current_user: User = Depends(user_authentication),db: Session = Depends(get_db)):
+    orders = await run_in_threadpool(pending_orders,db,current_user.id)
 
     if not orders:
         return RedirectResponse("/", status_code=303)
 
     if method == "COD":
-        for order in orders:
-            db.add(Payment( o_id=order.o_id, amount=order.total_price, method="COD", status="completed"))
-            order.payment_status = "COD"
-
-        db.commit()
+        await run_in_threadpool(settle_cod,db,orders)
         request.session.pop("can_pay", None)
+        request.session.pop("payment_intent", None)
         return RedirectResponse("/", status_code=303)
-    
-    intent = stripe.PaymentIntent.retrieve(payment_intent_id)
 
-    if intent.metadata.get("user_id") != str(current_user.id):
+    if not payment_intent_id :
+        flash(request, "Payment failed!", "error")
+        return RedirectResponse("/payment", status_code=303)
+
+    # The signed webhook usually lands before the browser posts back; only ask Stripe if it has not
+    intent = await run_in_threadpool(succeeded_intent,db,payment_intent_id)
+    if intent is None :
+        try :
+            intent = await stripe_client.retrieve_payment_intent(payment_intent_id)
+        except StripeError :
+            flash(request, "We could not confirm your payment yet, please retry in a moment", "error")
+            return RedirectResponse("/payment", status_code=303)
+
+    if intent.get("metadata",{}).get("user_id") != str(current_user.id):
         raise HTTPException(status_code=403, detail="Invalid payment session")
 
-    if intent.status != "succeeded":
+    if intent["status"] != "succeeded":
         request.session.pop("can_pay",None)
         flash(request, "Payment failed!", "error")
         return RedirectResponse("/payment", status_code=303)
-    
-    existing = db.query(Transactions).filter(Transactions.stripe_intent_id == payment_intent_id).first()
 
-    if existing:
+    orders = await run_in_threadpool(orders_for_intent,db,intent)
+    settled = await run_in_threadpool(settle_card,db,orders,payment_intent_id,intent["amount"])
+    request.session.pop("payment_intent", None)
+    if not settled :
+        if await run_in_threadpool(transaction_status,db,payment_intent_id) == "needs_review" :
+            flash(request, "We received your payment but could not match it to your cart, our team will reconcile it shortly", "error")
         return RedirectResponse("/", status_code=303)
 
-    transaction = Transactions(stripe_intent_id=payment_intent_id, amount=intent.amount / 100,status="success")
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
-
-    for order in orders:
-        db.add(Payment(o_id=order.o_id,t_id=transaction.t_id,amount=order.total_price,method="CARD",status="completed"))
-        order.payment_status = "PAID"
-
-    db.commit()
     request.session.pop("can_pay", None)
     flash(request, "Payment successful , Order confirmed!", "success")
     return RedirectResponse("/", status_code=303)
 
+@app.post("/stripe/webhook",include_in_schema=False)
+async def stripe_webhook(request: Request,db: Session = Depends(get_db)):
+    if not STRIPE_WEBHOOK_SECRET :
+        raise HTTPException(status_code=503, detail="Webhook not configured")
+    payload = await request.body()
+    try :
+        event = verify_webhook_signature(payload,request.headers.get("stripe-signature"),STRIPE_WEBHOOK_SECRET)
+    except StripeError as e :
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Persist and acknowledge; the payment worker applies it to orders in the background
+    if await run_in_threadpool(store_payment_event,db,event) :
+        payment_worker.notify()
+    return {"received": True}
+
+def fetch_order_page(db:Session,user_id:int,after:Optional[int]=None,before:Optional[int]=None,limit:Optional[int]=None):
+    return order_history.page(db,user_id,after=after,before=before,limit=clamp_page_size(limit,ORDER_PAGE_SIZE))
+
+def order_view(request:Request,template:str,user_id:int,page:dict):
+    next_url , prev_url = page_links(request,page)
+    flash_message = request.session.pop("flash", None)
+    response= templates.TemplateResponse(template,{"request":request,"response":page["items"],"user_id":user_id,"flash": flash_message,"next_url":next_url,"prev_url":prev_url})
+    return no_cache(response)
+
 @app.get("/products/get-orders/{user_id}",response_model=List[OrderResponse],tags=["Cart endpoint"])
-def order(request:Request,user_id:int,current_user:User=Depends(user_authentication),db:Session=Depends(get_db)):
+def order(request:Request,user_id:int,after:Optional[int]=None,before:Optional[int]=None,limit:Optional[int]=None,current_user:User=Depends(user_authentication),db:Session=Depends(get_db)):
     if current_user.id != user_id : 
 
         return RedirectResponse(url="/",status_code=303)
 
-    orders=db.query(Order,Products).join(Products,Order.p_id==Products.p_id).filter(Order.c_id==user_id).all()
-    response = [] 
+    return order_view(request,"second.html",user_id,fetch_order_page(db,user_id,after,before,limit))
 
-    for o,p in orders :
-       response.append(OrderResponse(o_id = o.o_id,p_id=p.p_id,title=p.title,description=p.description,total_price=o.total_price,quantity=o.quantity,is_delivered=o.is_delivered,payment_status=None if o.payment_status == "pending" else o.payment_status))
-    
-    flash_message = request.session.pop("flash", None)
+@app.get("/api/orders/{user_id}",tags=["Cart endpoint"])
+def orders_api(user_id:int,after:Optional[int]=None,before:Optional[int]=None,limit:Optional[int]=None,current_user:User=Depends(user_authentication),db:Session=Depends(get_db)):
+    if current_user.id != user_id :
+        raise HTTPException(status_code=403, detail="Not allowed")
 
-    response= templates.TemplateResponse("second.html",{"request":request,"response":response,"order":orders,"user_id":user_id,"flash": flash_message})
-    return no_cache(response)
+    page = fetch_order_page(db,user_id,after,before,limit)
+    return {
+        "items":[OrderResponse.model_validate(o).model_dump() for o in page["items"]],
+        "next_cursor":page["next_cursor"],
+        "prev_cursor":page["prev_cursor"],
+    }
 
 @app.post("/orders/cancel/{o_id}", tags=["Cancel order"])
-def cancel_order(request:Request,o_id: int,current_user: User = Depends(user_authentication),db: Session = Depends(get_db),csrf=Depends(csrf_protect)):
+def cancel_order(request:Request,o_id: int,current_user: User = Depends(user_authentication),db: Session = Depends(get_db)):
     order = (db.query(Order).filter(Order.o_id == o_id, Order.c_id == current_user.id,Order.payment_status == "pending").first())
 
     if not order:
@@ -431,8 +746,10 @@ def cancel_order(request:Request,o_id: int,current_user: User = Depends(user_aut
         return RedirectResponse(f"/products/get-orders/{current_user.id}",status_code=303)
         
 
-    db.delete(order)
+    release_order(db,order)
     db.commit()
+    catalog_cache.update_stock(committed_stock(db))
+    order_history.invalidate(current_user.id)
     flash(request, "Order removed successfully", "success")
 
     return RedirectResponse(f"/products/get-orders/{current_user.id}",status_code=303)
@@ -445,38 +762,54 @@ def update_delivery(request: Request,productid: int,current_user: User = Depends
         raise HTTPException(status_code=404,detail="Order already delivered ")
     order_update.is_delivered = True
     db.commit()
-    db.refresh(order_update)
+    order_history.invalidate(current_user.id)
 
     return {"status":"ok", "is_delivered": True }
 
 
+def fulfilment_auth(request:Request):
+    if not FULFILMENT_API_KEY :
+        raise HTTPException(status_code=503, detail="Fulfilment API not configured")
+    if not secrets.compare_digest(request.headers.get("x-fulfilment-key",""),FULFILMENT_API_KEY) :
+        raise HTTPException(status_code=401, detail="Invalid fulfilment key")
+
+@app.post("/fulfilment/deliveries",tags=["Delivery endpoint"],dependencies=[Depends(fulfilment_auth)])
+async def bulk_update_delivery(request:Request,db:Session=Depends(get_db)):
+    # JSON {"order_ids":[...]} or a text/csv body streamed in chunks, one order id per line
+    chunks , invalid = [] , []
+    if request.headers.get("content-type","").startswith("application/json") :
+        try :
+            body = BulkDeliveryRequest.model_validate(await request.json())
+        except (ValueError,ValidationError) :
+            raise HTTPException(status_code=422, detail="Invalid delivery request")
+        for ids in chunked(body.order_ids) :
+            chunks.append(await run_in_threadpool(deliver_chunk,db,ids))
+    else :
+        async for ids in csv_order_id_chunks(request.stream(),invalid=invalid) :
+            chunks.append(await run_in_threadpool(deliver_chunk,db,ids))
+
+    return {
+        "requested": sum(c["requested"] for c in chunks),
+        "updated": sum(c["updated"] for c in chunks),
+        "invalid": invalid[:100],
+        "chunks": chunks,
+    }
+
 @app.get("/products/get-orders/{user_id}/productmanager",response_model=list[ProductManger],tags=["Product manager endpoint"])
-def product_manager(request:Request,user_id:int,current_user:User = Depends(user_authentication),db:Session=Depends(get_db)):
+def product_manager(request:Request,user_id:int,after:Optional[int]=None,before:Optional[int]=None,limit:Optional[int]=None,current_user:User = Depends(user_authentication),db:Session=Depends(get_db)):
 
     if current_user.id != user_id:
         return RedirectResponse("/", 303)
 
-    pro=db.query(Order,Products).join(Products,Order.p_id==Products.p_id).filter(Order.c_id==current_user.id).all()
-    response=[]
-    for o,p in pro :
-        response.append(ProductManger(p_id=p.p_id,title=p.title,price=p.price,quantity=o.quantity,discount=p.discount,total_price=o.total_price))
-    flash_message = request.session.pop("flash", None)
-    response= templates.TemplateResponse("product_manager.html",{"request":request,"user_id":current_user.id,"pro":response,"flash": flash_message})
-    return no_cache(response)
+    return order_view(request,"product_manager.html",user_id,fetch_order_page(db,user_id,after,before,limit))
    
 
 @app.get("/products/get-orders/{user_id}/category",response_model=List[ProductCategory], tags=["Category endpoint"])
-def get_category(request:Request,user_id:int,current_user=Depends(user_authentication),db:Session=Depends(get_db)):
+def get_category(request:Request,user_id:int,after:Optional[int]=None,before:Optional[int]=None,limit:Optional[int]=None,current_user=Depends(user_authentication),db:Session=Depends(get_db)):
     
     if current_user.id != user_id :
         return RedirectResponse("/",status_code=303)
-    product_category=db.query(Order,Products).join(Products,Order.p_id==Products.p_id).filter(Order.c_id==user_id).all()
-    response=[]
-    for o,p in product_category:
-        response.append(ProductCategory(title=p.title,category=p.category,discount=p.discount,total_price=o.total_price))
-    flash_message = request.session.pop("flash", None)
-    response= templates.TemplateResponse("category.html",{"request":request,"user_id":current_user.id,"response":response,"flash": flash_message})
-    return no_cache(response)
+    return order_view(request,"category.html",user_id,fetch_order_page(db,user_id,after,before,limit))
 
 @app.get("/updatediscount" , tags=["update discount endpoint"])
 def updatediscount(request:Request,current_user=Depends(user_authentication)):
@@ -484,7 +817,7 @@ def updatediscount(request:Request,current_user=Depends(user_authentication)):
     return no_cache(response)
 
 @app.post("/updatediscount" , tags=["update discount endpoint"])
-def updatediscount(request:Request,product_id:int=Form(...), discount:int=Form(...),current_user=Depends(user_authentication),db:Session=Depends(get_db),csrf=Depends(csrf_protect)):
+def updatediscount(request:Request,product_id:int=Form(...), discount:int=Form(...),current_user=Depends(user_authentication),db:Session=Depends(get_db)):
     exisiting = db.query(Products).filter(Products.p_id==product_id).first()
     if exisiting is None:
         message="No product found"
@@ -498,11 +831,14 @@ def updatediscount(request:Request,product_id:int=Form(...), discount:int=Form(.
 
     db.commit()
     db.refresh(exisiting)   
+    catalog_cache.bump()
+    # Order history rows carry product fields, drop them all on the rare admin edit
+    order_history.clear()
     flash(request, "Discount updated successfully", "success")
     return RedirectResponse(url="/",status_code=303)
 
 @app.post("/add-review",tags=["Review"])
-def add_review(request:Request,product_id:int=Form(...),rating:int=Form(...),comment:str=Form(...),current_user:User=Depends(user_authentication),db:Session=Depends(get_db),csrf=Depends(csrf_protect)):
+def add_review(request:Request,product_id:int=Form(...),rating:int=Form(...),comment:str=Form(...),current_user:User=Depends(user_authentication),db:Session=Depends(get_db)):
 
     if comment is None:
         return RedirectResponse("/",status_code=303)
@@ -525,7 +861,9 @@ def add_review(request:Request,product_id:int=Form(...),rating:int=Form(...),com
 
     review = Review(user_id=current_user.id,product_id=product_id,rating=rating,comment=comment.strip())
     db.add(review)
+    record_rating(db,product_id,rating)
     db.commit()
+    rating_stats_version.bump()
 
     flash(request,"Review added successfully !","success")
     return RedirectResponse("/",status_code=303)
@@ -533,62 +871,51 @@ def add_review(request:Request,product_id:int=Form(...),rating:int=Form(...),com
 
 
 @app.get("/product/{product_id}")
-def product_detail(
+async def product_detail(
     request: Request,
     product_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
 
-    product = db.query(Products).filter(Products.p_id == product_id).first()
+    catalog = await catalog_cache.get_async()
+    user_id = token_user_id(request)
+    etag = page_etag(request, user_id)
+    if user_id is None:
+        cached = not_modified(request, user_id, etag)
+        if cached:
+            return cached
+
+    product = catalog.by_id.get(product_id)
 
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    user = get_current_user_optional(request, db)
+    user = await get_current_user_optional_async(request, db)
 
     if user:
-        view = ProductView(
-            user_id=user.id,
-            product_id=product.p_id
-        )
-        db.add(view)
-        db.commit()
-        thirty_min_ago = datetime.utcnow() - timedelta(minutes=30)
-
-        recent_views_count = db.query(ProductView).filter(
-            ProductView.user_id == user.id,
-            ProductView.viewed_at >= thirty_min_ago
-        ).count()
-        if recent_views_count == 1:
-            try:
-                requests.post(
-                    "https://sahil9900.app.n8n.cloud/webhook-test/product-view",
-                    json={
-                        "user_id": user.id,
-                        "email": user.email,
-                        "product_id": product.p_id,
-                        "category": product.category,
-                        "timestamp": datetime.utcnow().isoformat()
-                    },
-                    timeout=2
-                )
-            except Exception as e:
-                print("Webhook failed:", e)
-
-    review_stats = (
-        db.query(
-            func.avg(Review.rating).label("avg_rating"),
-            func.count(Review.r_id).label("review_count")
-        )
-        .filter(Review.product_id == product_id)
-        .first()
-    )
-
-    avg_rating = round(review_stats.avg_rating, 1) if review_stats.avg_rating else 0
-    review_count = review_stats.review_count or 0
+        first_view = view_buffer.record(user.id, product.p_id)
+        if first_view:
+            webhook_dispatcher.submit({
+                "user_id": user.id,
+                "email": user.email,
+                "product_id": product.p_id,
+                "category": product.category,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+    # Views are still recorded for logged-in users before answering from the browser cache
+    if user_id is not None:
+        cached = not_modified(request, user_id, etag)
+        if cached:
+            return cached
+
+    review_stats = await db.get(ProductRatingStats, product_id)
+
+    avg_rating = review_stats.avg_rating if review_stats else 0
+    review_count = review_stats.rating_count if review_stats else 0
 
     flash_message = request.session.pop("flash", None)
 
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
         "product_detail.html",
         {
             "request": request,
@@ -599,20 +926,23 @@ def product_detail(
             "flash": flash_message,
         }
     )
+    if not flash_message:
+        response.headers.update(validator_headers(user_id, etag))
+    return response
 
 @app.get("/check-purchase")
-def check_purchase(user_id: int, product_id: int, db: Session = Depends(get_db)):
-    count = db.query(Order).filter(
+async def check_purchase(user_id: int, product_id: int, db: AsyncSession = Depends(get_async_db)):
+    count = await db.scalar(select(func.count()).select_from(Order).where(
         Order.c_id == user_id,
         Order.p_id == product_id,
         Order.payment_status.in_(["PAID", "COD"])
-    ).count()
+    ))
 
     return {"purchase_count": count , "user_id":user_id , "product_id" : product_id}
 
 @app.get("/check-email-log")
-def check_email_log(user_id: int, db: Session = Depends(get_db)):
-    result = db.execute(
+async def check_email_log(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = (await db.execute(
         text("""
         SELECT sent_at FROM email_logs
         WHERE user_id = :user_id
@@ -620,7 +950,7 @@ def check_email_log(user_id: int, db: Session = Depends(get_db)):
         LIMIT 1
         """),
         {"user_id": user_id}
-    ).fetchone()
+    )).fetchone()
 
     if not result:
         return {"send": True}
@@ -640,16 +970,13 @@ def check_email_log(user_id: int, db: Session = Depends(get_db)):
     return {"send": False}
 
 @app.get("/recommend-products")
-def recommend_products(
+async def recommend_products(
     category: str,
     product_id: int,
     email: str,
-    user_id: int,
-    db: Session = Depends(get_db)
+    user_id: int
 ):
-    products = db.query(Products).filter(
-        Products.category == category
-    ).limit(3).all()
+    products = (await catalog_cache.get_async()).by_category.get(category, [])[:3]
 
     return [
         {
@@ -663,6 +990,29 @@ def recommend_products(
     ]
 
 
+@app.get("/metrics",include_in_schema=False)
+async def metrics():
+    # Gauges that are cheaper to read at scrape time than to keep current per request
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    threadpool_busy.labels().set(limiter.borrowed_tokens)
+    threadpool_size.labels().set(limiter.total_tokens)
+    for label , pool in (("sync",engine.pool),("async",async_engine.sync_engine.pool)) :
+        if hasattr(pool,"checkedout") :
+            db_pool_checked_out.labels(label).set(pool.checkedout())
+    return Response(render_metrics(),media_type=METRICS_CONTENT_TYPE)
+
+
+def internal_auth(request:Request):
+    if not INTERNAL_API_KEY :
+        raise HTTPException(status_code=503, detail="Internal API not configured")
+    if not secrets.compare_digest(request.headers.get("x-internal-key",""),INTERNAL_API_KEY) :
+        raise HTTPException(status_code=401, detail="Invalid internal key")
+
+@app.get("/internal/stats",include_in_schema=False,dependencies=[Depends(internal_auth)])
+def internal_stats():
+    return {"catalog": catalog_cache.stats(), "principals": principal_cache.stats(), "bcrypt": bcrypt_pool.stats(), "views": view_buffer.stats(), "webhook": webhook_dispatcher.stats(), "stripe": stripe_client.stats(), "payment_events": payment_worker.stats(), "order_history": order_history.stats(), "reservations": reservation_sweeper.stats(), "startup_ms": startup_timings}
+
+
 @app.post("/log-email-debug")
 async def debug(request: Request):
     body = await request.json()
@@ -690,6 +1040,13 @@ def log_email(data: EmailLogRequest, db: Session = Depends(get_db)):
         print("ERROR:", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+instrument_routes(app.routes)
+
 if __name__ == "__main__":
+    if "--check-schema" in sys.argv :
+        problems = check_schema()
+        for problem in problems :
+            print(problem)
+        sys.exit(1 if problems else 0)
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Pool checkouts and template renders are expected to take well under a millisecond
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+ROUTE_KEY = "metrics.route"
+UNMATCHED = "<unmatched>"
+
+
+class Histogram:
+    # Counts per bucket; cumulated only when rendered. The lock is there for threadpool observers
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            yield f"{name}_bucket", {**labels, "le": str(bound)}, cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+class Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Family:
+    # A named metric with one child per label combination; callers keep the child from labels()
+    def __init__(self, name, help, kind, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, Histogram(self.buckets) if self.kind == "histogram" else Value())
+        return child
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            yield from child.samples(self.name, dict(zip(self.labelnames, values)))
+
+
+class RouteStats:
+    # One per (method, route), created up front so a request only touches these counters
+    __slots__ = ("method", "route", "in_flight", "statuses", "latency")
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.in_flight = 0
+        self.statuses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+
+    def record(self, status, elapsed):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latency.observe(elapsed)
+
+
+class HttpMetrics:
+    # Only touched from the event loop thread, so the counters need no locking
+    def __init__(self):
+        self.routes = {}
+        self.in_flight = 0
+
+    def stats_for(self, method, route) -> RouteStats:
+        key = (method, route)
+        stats = self.routes.get(key)
+        if stats is None:
+            stats = self.routes[key] = RouteStats(method, route)
+        return stats
+
+    def samples(self):
+        yield "http_requests_total", "counter", "Requests by route and status", [
+            ("http_requests_total", {"method": s.method, "route": s.route, "status": str(status)}, count)
+            for s in self.routes.values() for status, count in sorted(s.statuses.items())
+        ]
+        yield "http_request_duration_seconds", "histogram", "Request latency by route", [
+            sample for s in self.routes.values() if s.latency.count
+            for sample in s.latency.samples("http_request_duration_seconds", {"method": s.method, "route": s.route})
+        ]
+        yield "http_requests_in_flight", "gauge", "Requests currently being handled by route", [
+            ("http_requests_in_flight", {"method": s.method, "route": s.route}, s.in_flight) for s in self.routes.values()
+        ]
+        yield "http_server_requests_in_flight", "gauge", "Requests currently being handled", [
+            ("http_server_requests_in_flight", {}, self.in_flight)
+        ]
+
+
+class RouteTracker:
+    # Wraps one route's ASGI app: marks the scope with the route's stats and keeps its in-flight gauge
+    def __init__(self, app, stats_by_method, route, http):
+        self.app = app
+        self.stats_by_method = stats_by_method
+        self.route = route
+        self.http = http
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = self.stats_by_method.get(scope["method"]) or self.http.stats_for(scope["method"], self.route)
+        scope[ROUTE_KEY] = stats
+        stats.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            stats.in_flight -= 1
+
+
+def instrument_routes(routes, http=None):
+    # Call once all routes are registered; routes added later are reported as <unmatched>
+    http = http or http_metrics
+    for route in routes:
+        if isinstance(getattr(route, "app", None), RouteTracker) or not hasattr(route, "path"):
+            continue
+        methods = getattr(route, "methods", None) or ("GET", "HEAD")
+        route.app = RouteTracker(route.app, {m: http.stats_for(m, route.path) for m in methods}, route.path, http)
+
+
+class MetricsMiddleware:
+    # Pure ASGI: times the whole request and records it against the route the router picked
+    def __init__(self, app, http=None):
+        self.app = app
+        self.http = http or http_metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http = self.http
+        http.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            http.in_flight -= 1
+            stats = scope.get(ROUTE_KEY) or http.stats_for(scope["method"], UNMATCHED)
+            stats.record(status, time.perf_counter() - started)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(families=None, http=None) -> str:
+    lines = []
+    groups = list((http or http_metrics).samples())
+    groups += [(f.name, f.kind, f.help, list(f.samples())) for f in (families or FAMILIES)]
+    for name, kind, help, samples in groups:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample, labels, value in samples:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{sample}{{{label_text}}} {_format(value)}" if label_text else f"{sample} {_format(value)}")
+    return "\n".join(lines) + "\n"
+
+
+http_metrics = HttpMetrics()
+threadpool_busy = Family("threadpool_threads_busy", "Worker threads currently running sync endpoints and dependencies", "gauge")
+threadpool_size = Family("threadpool_threads_max", "Size of the request threadpool", "gauge")
+db_pool_checkout_wait = Family("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection", "histogram", ("engine",), FAST_BUCKETS)
+db_pool_checked_out = Family("db_pool_connections_checked_out", "DB connections currently checked out", "gauge", ("engine",))
+template_render = Family("template_render_seconds", "Jinja template render time", "histogram", ("template",), FAST_BUCKETS)
+external_call_duration = Family("external_call_duration_seconds", "Latency of calls to external services", "histogram", ("service",))
+external_call_errors = Family("external_call_errors_total", "Failed calls to external services", "counter", ("service",))
+
+FAMILIES = [threadpool_busy, threadpool_size, db_pool_checkout_wait, db_pool_checked_out, template_render, external_call_duration, external_call_errors]
@@ -0,0 +1,61 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from db import Order, Products
+from inventory import decrement_stock, hold_stock
+
+MAX_ORDER_QUANTITY = 100
+MAX_BATCH_LINES = 100
+
+
+def line_error(line, error: str) -> dict:
+    return {"product_id": line["product_id"], "quantity": line["quantity"], "status": "error", "error": error}
+
+
+def place_orders(db: Session, user_id: int, lines) -> list:
+    # Validates every line against one product lookup, reserves stock per line with the
+    # conditional UPDATE and inserts all accepted orders in the same transaction.
+    # Returns one result per input line, in input order.
+    product_ids = {line["product_id"] for line in lines}
+    products = {
+        p.p_id: p
+        for p in db.query(Products.p_id, Products.price, Products.discount).filter(Products.p_id.in_(product_ids))
+    }
+    in_cart = {
+        row.p_id
+        for row in db.query(Order.p_id).filter(Order.c_id == user_id, Order.p_id.in_(product_ids), Order.is_delivered == False)
+    }
+
+    results, accepted, seen = [], [], set()
+    for line in lines:
+        product = products.get(line["product_id"])
+        quantity = line["quantity"]
+        if product is None:
+            results.append(line_error(line, "Product not found"))
+        elif quantity <= 0:
+            results.append(line_error(line, "Select valid quantity range"))
+        elif quantity > MAX_ORDER_QUANTITY:
+            results.append(line_error(line, "Out of stock"))
+        elif product.p_id in in_cart or product.p_id in seen:
+            results.append(line_error(line, "Product already in cart"))
+        elif not decrement_stock(db, product.p_id, quantity):
+            results.append(line_error(line, "Out of stock"))
+        else:
+            seen.add(product.p_id)
+            discounted_price = product.price - (product.price * product.discount) / 100
+            accepted.append((len(results), {
+                "c_id": user_id, "p_id": product.p_id, "total_price": quantity * discounted_price,
+                "payment_status": "pending", "is_delivered": False, "quantity": quantity,
+            }))
+            results.append(None)
+
+    if accepted:
+        order_ids = db.scalars(
+            insert(Order).returning(Order.o_id, sort_by_parameter_order=True),
+            [row for _, row in accepted],
+        ).all()
+        for (index, row), o_id in zip(accepted, order_ids):
+            results[index] = {"product_id": row["p_id"], "quantity": row["quantity"], "status": "created", "order_id": o_id}
+        hold_stock(db, [(o_id, row["p_id"], row["quantity"]) for (_, row), o_id in zip(accepted, order_ids)])
+    db.commit()
+    return results
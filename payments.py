@@ -0,0 +1,257 @@
+import datetime
+import json
+import logging
+import threading
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from cache import order_history
+from db import Order, Payment, Transactions, PaymentEvent, PaymentIntentOrder
+from inventory import commit_holds
+
+logger = logging.getLogger("payments")
+
+# Stripe metadata values are capped at 500 characters
+ORDER_IDS_METADATA_LIMIT = 500
+# Events that keep failing are parked after this many attempts instead of blocking the queue
+MAX_EVENT_ATTEMPTS = 5
+
+
+def pending_orders(db: Session, user_id: int):
+    return db.query(Order).filter(Order.c_id == user_id, Order.payment_status == "pending").all()
+
+
+def cart_amount(orders) -> int:
+    # Minor units, computed exactly as /payment does when it sizes the intent
+    return int(round(round(sum(o.total_price for o in orders), 2) * 100))
+
+
+def intent_metadata(user_id: int, order_ids) -> dict:
+    metadata = {"user_id": user_id}
+    joined = ",".join(str(o) for o in order_ids)
+    if len(joined) <= ORDER_IDS_METADATA_LIMIT:
+        metadata["order_ids"] = joined
+    return metadata
+
+
+def record_intent(db: Session, intent_id: str, order_ids):
+    # Remembers which orders the intent charges for, so settlement never depends on metadata alone
+    db.execute(
+        insert(PaymentIntentOrder)
+        .values([{"intent_id": intent_id, "o_id": o} for o in order_ids])
+        .on_conflict_do_nothing(index_elements=[PaymentIntentOrder.intent_id, PaymentIntentOrder.o_id])
+    )
+    db.commit()
+
+
+def orders_for_intent(db: Session, intent: dict):
+    # Settle exactly the cart the intent was created for: the server-side record first, then the
+    # order_ids metadata. An intent with neither settles nothing rather than whatever is pending now.
+    metadata = intent.get("metadata") or {}
+    wanted = [o for (o,) in db.query(PaymentIntentOrder.o_id).filter(PaymentIntentOrder.intent_id == intent.get("id"))]
+    if not wanted and metadata.get("order_ids"):
+        wanted = [int(o) for o in metadata["order_ids"].split(",")]
+    if not wanted:
+        return []
+    return (
+        db.query(Order)
+        .filter(Order.o_id.in_(wanted), Order.c_id == int(metadata["user_id"]), Order.payment_status == "pending")
+        .all()
+    )
+
+
+def insert_payments(db: Session, orders, method: str, t_id=None):
+    # One multi-row INSERT for the payments, one UPDATE for the orders and the stock holds made permanent
+    if not orders:
+        return
+    db.execute(insert(Payment), [
+        {"o_id": o.o_id, "t_id": t_id, "amount": o.total_price, "method": method, "status": "completed"}
+        for o in orders
+    ])
+    db.execute(
+        update(Order)
+        .where(Order.o_id.in_([o.o_id for o in orders]), Order.payment_status == "pending")
+        .values(payment_status="PAID" if method == "CARD" else method)
+    )
+    commit_holds(db, [o.o_id for o in orders])
+
+
+def unpaid_orders(db: Session, order_ids):
+    return (
+        db.query(Order)
+        .filter(Order.o_id.in_(order_ids), Order.payment_status == "pending", ~Order.payment.has())
+        .all()
+    )
+
+
+def settle_cod(db: Session, orders):
+    order_ids = [o.o_id for o in orders]
+    user_ids = {o.c_id for o in orders}
+    try:
+        insert_payments(db, orders, "COD")
+        db.commit()
+    except IntegrityError:
+        # A concurrent settlement paid some of these orders; settle whatever is left
+        db.rollback()
+        insert_payments(db, unpaid_orders(db, order_ids), "COD")
+        db.commit()
+    order_history.invalidate(*user_ids)
+
+
+def record_unmatched(db: Session, intent_id: str, amount: int) -> bool:
+    # Money was taken but does not match a cart: keep the charge on record for reconciliation
+    db.execute(
+        insert(Transactions)
+        .values(stripe_intent_id=intent_id, amount=amount / 100, status="needs_review")
+        .on_conflict_do_nothing(index_elements=[Transactions.stripe_intent_id])
+    )
+    db.commit()
+    return False
+
+
+def settle_card(db: Session, orders, intent_id: str, amount: int) -> bool:
+    # Returns False when this intent was already settled, or when it does not pay for exactly
+    # these orders (nothing left to settle, or a different total); those are flagged, not settled
+    if not orders or cart_amount(orders) != amount:
+        return record_unmatched(db, intent_id, amount)
+    order_ids = [o.o_id for o in orders]
+    user_ids = {o.c_id for o in orders}
+    for attempt in range(2):
+        try:
+            t_id = db.execute(
+                insert(Transactions)
+                .values(stripe_intent_id=intent_id, amount=amount / 100, status="success")
+                .on_conflict_do_nothing(index_elements=[Transactions.stripe_intent_id])
+                .returning(Transactions.t_id)
+            ).scalar()
+            if t_id is None:
+                db.rollback()
+                return False
+            insert_payments(db, orders, "CARD", t_id)
+            db.commit()
+            order_history.invalidate(*user_ids)
+            return True
+        except IntegrityError:
+            # Another writer touched the cart; retry once only if the still-unpaid orders match the intent
+            db.rollback()
+            if attempt:
+                raise
+            orders = unpaid_orders(db, order_ids)
+            if not orders or cart_amount(orders) != amount:
+                return record_unmatched(db, intent_id, amount)
+
+
+def transaction_status(db: Session, intent_id: str):
+    return db.query(Transactions.status).filter(Transactions.stripe_intent_id == intent_id).scalar()
+
+
+def store_payment_event(db: Session, event: dict) -> bool:
+    # Deduplicated on Stripe's event id; returns False for a redelivered event
+    intent = (event.get("data") or {}).get("object") or {}
+    result = db.execute(
+        insert(PaymentEvent)
+        .values(event_id=event["id"], type=event["type"], intent_id=intent.get("id"), payload=json.dumps(event))
+        .on_conflict_do_nothing(index_elements=[PaymentEvent.event_id])
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def succeeded_intent(db: Session, intent_id: str):
+    # Intent object from a received payment_intent.succeeded event, if the webhook got here first
+    row = (
+        db.query(PaymentEvent.payload)
+        .filter(PaymentEvent.intent_id == intent_id, PaymentEvent.type == "payment_intent.succeeded")
+        .first()
+    )
+    return json.loads(row.payload)["data"]["object"] if row else None
+
+
+def apply_payment_event(db: Session, event: dict):
+    if event.get("type") != "payment_intent.succeeded":
+        return
+    intent = (event.get("data") or {}).get("object") or {}
+    if not (intent.get("metadata") or {}).get("user_id"):
+        return
+    settle_card(db, orders_for_intent(db, intent), intent["id"], intent["amount"])
+
+
+class PaymentEventWorker:
+    # Applies stored webhook events in id order, a batch at a time, off the request path
+    def __init__(self, session_factory, batch_size: int = 100, poll_interval: float = 1.0):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.applied = 0
+        self.failed = 0
+        self.batches = 0
+
+    def notify(self):
+        self._wake.set()
+
+    def process_batch(self) -> int:
+        db = self.session_factory()
+        try:
+            events = (
+                db.query(PaymentEvent.id, PaymentEvent.payload)
+                .filter(PaymentEvent.processed_at.is_(None), PaymentEvent.attempts < MAX_EVENT_ATTEMPTS)
+                .order_by(PaymentEvent.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not events:
+                return 0
+            done, failed = [], []
+            for row in events:
+                try:
+                    apply_payment_event(db, json.loads(row.payload))
+                    done.append(row.id)
+                except Exception:
+                    # Settlement is idempotent per intent, so failed events are simply retried later
+                    db.rollback()
+                    failed.append(row.id)
+                    logger.exception("Payment event %s failed", row.id)
+            if done:
+                db.execute(update(PaymentEvent).where(PaymentEvent.id.in_(done)).values(processed_at=datetime.datetime.utcnow()))
+            if failed:
+                db.execute(update(PaymentEvent).where(PaymentEvent.id.in_(failed)).values(attempts=PaymentEvent.attempts + 1))
+            db.commit()
+            self.applied += len(done)
+            self.failed += len(failed)
+            self.batches += 1
+            return len(events)
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.process_batch()
+            except Exception:
+                logger.exception("Payment event worker error")
+                processed = 0
+            if processed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="payment-events", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {"applied": self.applied, "failed": self.failed, "batches": self.batches}
@@ -0,0 +1,139 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+logger = logging.getLogger("sql")
+
+# 0 leaves the N+1 detector off; K flags a statement seen more than K times in one request
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "0"))
+SQL_LOG_REQUESTS = os.getenv("SQL_LOG_REQUESTS", "1") == "1"
+
+_current = contextvars.ContextVar("query_stats", default=None)
+
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    # Bound parameters are already "?", so only IN lists, inlined literals and whitespace vary
+    statement = _LITERAL.sub("?", statement)
+    statement = _IN_LIST.sub("(?)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+class QueryStats:
+    # Per-request accumulator; the engine hooks find it through a context variable, which
+    # FastAPI's threadpool and SQLAlchemy's async greenlets both carry along with the request
+    def __init__(self, n_plus_one_threshold: int = None):
+        self.threshold = N_PLUS_ONE_THRESHOLD if n_plus_one_threshold is None else n_plus_one_threshold
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+        self.statements = Counter()
+        self.repeated = {}
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.slowest:
+            self.slowest = elapsed
+            self.slowest_statement = statement
+        if self.threshold:
+            key = normalize(statement)
+            self.statements[key] += 1
+            if self.statements[key] > self.threshold:
+                self.repeated[key] = self.statements[key]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total * 1000:.1f};desc="{self.count} queries", db-slowest;dur={self.slowest * 1000:.1f}'
+
+    def summary(self) -> dict:
+        return {
+            "queries": self.count,
+            "db_ms": round(self.total * 1000, 2),
+            "slowest_ms": round(self.slowest * 1000, 2),
+            "slowest_sql": normalize(self.slowest_statement) if self.slowest_statement else None,
+            "n_plus_one": [{"sql": sql, "count": count} for sql, count in self.repeated.items()],
+        }
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info["query_started"] = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.pop("query_started", None)
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    # Works for sync engines and for AsyncEngine.sync_engine
+    if not event.contains(engine, "before_cursor_execute", _before_execute):
+        event.listen(engine, "before_cursor_execute", _before_execute)
+        event.listen(engine, "after_cursor_execute", _after_execute)
+    return engine
+
+
+@contextmanager
+def track_queries(n_plus_one_threshold: int = None):
+    stats = QueryStats(n_plus_one_threshold)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class QueryStatsMiddleware:
+    # Pure ASGI so the context variable set here is the one the endpoint's threadpool copy inherits
+    def __init__(self, app, log_requests: bool = None):
+        self.app = app
+        self.log_requests = SQL_LOG_REQUESTS if log_requests is None else log_requests
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", stats.server_timing().encode("latin-1"))]}
+            await send(message)
+
+        with track_queries() as stats:
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                summary = stats.summary()
+                if summary["n_plus_one"]:
+                    logger.warning(json.dumps({"event": "n_plus_one", "method": scope["method"], "path": scope["path"], "statements": summary["n_plus_one"]}))
+                if self.log_requests and summary["queries"]:
+                    logger.info(json.dumps({"event": "request_sql", "method": scope["method"], "path": scope["path"], "status": status, **summary}))
+
+
+def parse_server_timing(header: str) -> dict:
+    # {"db": {"dur": 1.2, "desc": "3 queries"}, ...}; used by the query budget test helper
+    metrics = {}
+    for part in header.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        metrics[name] = {}
+        for param in params:
+            key, _, value = param.partition("=")
+            metrics[name][key] = value.strip('"')
+    return metrics
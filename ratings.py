@@ -0,0 +1,53 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy import func, case, delete
+from db import Review, ProductRatingStats, SessionLocal
+
+
+def record_rating(db: Session, product_id: int, rating: int):
+    # Upsert on the caller's session so the counters commit with the review itself
+    star = f"star_{rating}"
+    stmt = insert(ProductRatingStats).values(product_id=product_id, rating_sum=rating, rating_count=1, **{star: 1})
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ProductRatingStats.product_id],
+        set_={
+            "rating_sum": ProductRatingStats.rating_sum + rating,
+            "rating_count": ProductRatingStats.rating_count + 1,
+            star: getattr(ProductRatingStats, star) + 1,
+        },
+    )
+    db.execute(stmt)
+
+
+def get_rating_stats(db: Session, product_ids):
+    if not product_ids:
+        return {}
+    rows = db.query(ProductRatingStats).filter(ProductRatingStats.product_id.in_(product_ids)).all()
+    return {r.product_id: r for r in rows}
+
+
+def rebuild_rating_stats(db: Session) -> int:
+    # Full backfill from the reviews table, used once after deploy or if counters drift
+    stars = [func.sum(case((Review.rating == star, 1), else_=0)).label(f"star_{star}") for star in range(1, 6)]
+    rows = (
+        db.query(Review.product_id, func.sum(Review.rating).label("rating_sum"), func.count(Review.r_id).label("rating_count"), *stars)
+        .group_by(Review.product_id)
+        .all()
+    )
+    db.execute(delete(ProductRatingStats))
+    if rows:
+        db.execute(insert(ProductRatingStats), [dict(r._mapping) for r in rows])
+    db.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        count = rebuild_rating_stats(db)
+        print(f"Rebuilt rating stats for {count} products")
+    except Exception as e:
+        db.rollback()
+        print("Error:", e)
+    finally:
+        db.close()
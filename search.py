@@ -0,0 +1,36 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+SEARCH_MAX_TERMS = 8
+# bm25 column weights, in products_fts column order: title, description, category
+SEARCH_WEIGHTS = (10.0, 1.0, 4.0)
+
+SEARCH_SQL = text(f"""
+    SELECT p.p_id, p.title, p.description, p.price, p.discount, p.image, p.category, p.stock_quantity,
+           bm25(products_fts, {", ".join(str(w) for w in SEARCH_WEIGHTS)}) AS rank
+    FROM products_fts
+    JOIN products p ON p.p_id = products_fts.rowid
+    WHERE products_fts MATCH :match
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def build_match(query: str):
+    # Quote every term so user input can never be parsed as FTS5 syntax; last term is a prefix
+    terms = re.findall(r"\w+", query or "")[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_products(db: Session, query: str, page: int = 1, limit: int = 24):
+    match = build_match(query)
+    if not match:
+        return {"items": [], "page": page, "has_more": False}
+    offset = (page - 1) * limit
+    rows = db.execute(SEARCH_SQL, {"match": match, "limit": limit + 1, "offset": offset}).mappings().all()
+    return {"items": [dict(r) for r in rows[:limit]], "page": page, "has_more": len(rows) > limit}
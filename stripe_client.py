@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+from urllib.parse import urlencode
+
+from metrics import external_call_duration, external_call_errors
+from resilience import CircuitBreaker, backoff_delay
+
+
+class StripeError(Exception):
+    pass
+
+
+class StripeUnavailable(StripeError):
+    pass
+
+
+def encode_form(data: dict, prefix: str = "") -> list:
+    # Stripe's form encoding: nested dicts become key[sub]=value, booleans are lowercase
+    pairs = []
+    for key, value in data.items():
+        name = f"{prefix}[{key}]" if prefix else key
+        if isinstance(value, dict):
+            pairs.extend(encode_form(value, name))
+        elif isinstance(value, bool):
+            pairs.append((name, "true" if value else "false"))
+        elif value is not None:
+            pairs.append((name, str(value)))
+    return pairs
+
+
+def verify_webhook_signature(payload: bytes, header: str, secret: str, tolerance: int = 300) -> dict:
+    # Stripe-Signature: t=<timestamp>,v1=<hex hmac-sha256 of "<t>.<payload>">[,v1=...]
+    if not header or not secret:
+        raise StripeError("Missing signature")
+    timestamp, signatures = None, []
+    for item in header.split(","):
+        key, _, value = item.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+    if not timestamp or not timestamp.isdigit() or not signatures:
+        raise StripeError("Malformed signature header")
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, sig) for sig in signatures):
+        raise StripeError("Signature mismatch")
+    if abs(time.time() - int(timestamp)) > tolerance:
+        raise StripeError("Timestamp outside tolerance")
+    try:
+        event = json.loads(payload)
+    except ValueError as e:
+        raise StripeError("Invalid payload") from e
+    if not isinstance(event, dict) or not isinstance(event.get("id"), str) or not isinstance(event.get("type"), str):
+        raise StripeError("Malformed event")
+    return event
+
+
+class AsyncStripeClient:
+    # Talks to the Stripe REST API over one pooled httpx.AsyncClient, so a slow provider
+    # holds sockets on the event loop instead of pinning request threads.
+    def __init__(self, api_key, base_url: str = "https://api.stripe.com", timeout: float = 10.0, retries: int = 2, max_connections: int = 20, breaker: CircuitBreaker = None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.max_connections = max_connections
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+        self.calls = 0
+        self.errors = 0
+        self._latency = external_call_duration.labels("stripe")
+        self._error_count = external_call_errors.labels("stripe")
+
+    def start(self):
+        # httpx is imported when the client is opened, keeping it off the app's import path
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 3.0)),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, path: str, data: dict = None) -> dict:
+        import httpx
+
+        self.start()
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        body = None
+        if method == "POST":
+            body = urlencode(encode_form(data or {}))
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            # Same key on every retry, so a retried create can never make a second intent
+            headers["Idempotency-Key"] = str(uuid.uuid4())
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise StripeUnavailable("Payment provider circuit open")
+            self.calls += 1
+            started = time.perf_counter()
+            try:
+                response = await self._client.request(method, self.base_url + path, content=body, headers=headers)
+            except httpx.HTTPError as e:
+                self._latency.observe(time.perf_counter() - started)
+                self._error_count.inc()
+                self.errors += 1
+                self.breaker.failure()
+                if attempt == self.retries:
+                    raise StripeUnavailable(str(e)) from e
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            self._latency.observe(time.perf_counter() - started)
+            if response.status_code == 429 or response.status_code >= 500:
+                self._error_count.inc()
+                self.errors += 1
+                self.breaker.failure()
+                if attempt == self.retries:
+                    raise StripeUnavailable(f"Stripe returned {response.status_code}")
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            self.breaker.success()
+            try:
+                body = response.json()
+            except ValueError as e:
+                # e.g. an HTML error page from a proxy in front of the API
+                self._error_count.inc()
+                self.errors += 1
+                raise StripeError(f"Stripe returned {response.status_code} with a non-JSON body") from e
+            if response.status_code >= 400:
+                self._error_count.inc()
+                self.errors += 1
+                raise StripeError(body.get("error", {}).get("message", f"Stripe returned {response.status_code}"))
+            return body
+
+    async def create_payment_intent(self, amount: int, currency: str, metadata: dict) -> dict:
+        return await self._request("POST", "/v1/payment_intents", {
+            "amount": amount,
+            "currency": currency,
+            "automatic_payment_methods": {"enabled": True},
+            "metadata": metadata,
+        })
+
+    async def modify_payment_intent(self, intent_id: str, amount: int) -> dict:
+        return await self._request("POST", f"/v1/payment_intents/{intent_id}", {"amount": amount})
+
+    async def retrieve_payment_intent(self, intent_id: str) -> dict:
+        return await self._request("GET", f"/v1/payment_intents/{intent_id}")
+
+    def stats(self):
+        return {"calls": self.calls, "errors": self.errors, "breaker": self.breaker.state}
+
+
+def create_stripe_client():
+    return AsyncStripeClient(
+        os.getenv("STRIPE_SECRET_KEY"),
+        base_url=os.getenv("STRIPE_API_BASE", "https://api.stripe.com"),
+        timeout=float(os.getenv("STRIPE_TIMEOUT", "10")),
+        retries=int(os.getenv("STRIPE_RETRIES", "2")),
+        max_connections=int(os.getenv("STRIPE_MAX_CONNECTIONS", "20")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("STRIPE_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("STRIPE_BREAKER_RESET", "30")),
+        ),
+    )
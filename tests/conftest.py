@@ -6,14 +6,30 @@ Ensures complete isolation from production database and files
 import pytest
 import os
 import shutil
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 from io import BytesIO
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_suite.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+
+# Outbound webhooks stay off unless a test points a dispatcher at a local stub
+os.environ.setdefault("N8N_WEBHOOK_URL", "")
+# The app's own engine (background workers, scripts) points at the test database too, even when
+# a developer has DATABASE_URL exported for the real one
+os.environ["DATABASE_URL"] = SQLALCHEMY_DATABASE_URL
+# Fixtures own the schema and the catalog cache, so the app's startup phase leaves both alone
+os.environ.setdefault("STARTUP_SCHEMA", "skip")
+os.environ.setdefault("STARTUP_WARMUP", "0")
+
+from db import create_db_engine, create_async_db_engine
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Each TestClient runs its own event loop, so async connections are not pooled across tests
+async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 
 def pytest_configure(config):
@@ -39,6 +55,12 @@ def pytest_unconfigure(config):
             print("✓ Removed test database: test_suite.db")
         except Exception as e:
             print(f"⚠️  Could not remove test_suite.db: {e}")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists("test_suite.db" + suffix):
+            try:
+                os.remove("test_suite.db" + suffix)
+            except OSError:
+                pass
     
 
     if os.path.exists("test_uploads"):
@@ -67,12 +89,24 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    """Override async database dependency for testing"""
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture(scope="session")
 def test_engine():
     """Provide test database engine"""
     return engine
 
 
+@pytest.fixture(scope="session")
+def test_async_engine():
+    """Provide the async test database engine"""
+    return async_engine
+
+
 @pytest.fixture(scope="session")
 def test_db_session():
     """Provide test database session"""
@@ -83,8 +117,12 @@ def test_db_session():
 def setup_and_teardown(test_engine):
     """Set up and tear down database for each test"""
     from db import Base
+    from cache import catalog_cache, principal_cache, order_history
     
     Base.metadata.create_all(bind=test_engine)
+    catalog_cache.bump()
+    principal_cache.clear()
+    order_history.clear()
     os.makedirs("test_uploads", exist_ok=True)
     
     yield
@@ -100,9 +138,13 @@ def setup_and_teardown(test_engine):
 @pytest.fixture
 def client():
     """Provide FastAPI test client with database override"""
-    from main import app, get_db
+    from main import app, get_db, get_async_db, view_buffer, payment_worker, reservation_sweeper
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    view_buffer.session_factory = TestingSessionLocal
+    payment_worker.session_factory = TestingSessionLocal
+    reservation_sweeper.session_factory = TestingSessionLocal
     
     with TestClient(app) as test_client:
         yield test_client
@@ -162,6 +204,29 @@ def authenticated_client(client, test_user):
     return client
 
 
+@pytest.fixture
+def token_client(client, test_user):
+    """Provide client carrying a valid access token and CSRF cookie"""
+    from main import create_access_token
+
+    client.cookies.set("access_token", create_access_token(test_user.id))
+    client.cookies.set("csrf_token", "test-csrf-token")
+    return client
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    """Point the app's Stripe client at a local fake Stripe API"""
+    import main
+    from resilience import CircuitBreaker
+    from stubs import FakeStripe
+
+    with FakeStripe() as fake:
+        monkeypatch.setattr(main.stripe_client, "base_url", fake.url)
+        monkeypatch.setattr(main.stripe_client, "breaker", CircuitBreaker())
+        yield fake
+
+
 @pytest.fixture
 def test_image():
     """Provide a test image file"""
@@ -224,4 +289,17 @@ def pytest_runtest_makereport(item, call):
     """Make test results available to fixtures"""
     outcome = yield
     rep = outcome.get_result()
-    setattr(item, "rep_" + rep.when, rep)
\ No newline at end of file
+    setattr(item, "rep_" + rep.when, rep)
+
+@pytest.fixture
+def query_budget():
+    """Assert how many SQL statements a response reports in its Server-Timing header"""
+    from query_stats import parse_server_timing
+
+    def check(response, max_queries):
+        timing = parse_server_timing(response.headers["server-timing"])
+        queries = int(timing["db"]["desc"].split()[0])
+        assert queries <= max_queries, f"{response.request.method} {response.request.url.path} ran {queries} queries, budget is {max_queries}"
+        return queries
+
+    return check
@@ -0,0 +1,154 @@
+"""
+Local stub servers used by the test suite
+Lets outbound integrations be exercised without network access
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class WebhookStub:
+    """Records JSON posts; status and delay can be changed while running
+
+    `fail_first` makes the first N posts return 500 before `status` applies.
+    """
+
+    def __init__(self, status=200, delay=0.0, fail_first=0):
+        self.status = status
+        self.delay = delay
+        self.fail_first = fail_first
+        self.received = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(stub.delay)
+                stub.received.append(json.loads(body or b"null"))
+                self.send_response(500 if len(stub.received) <= stub.fail_first else stub.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/webhook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(self.received) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.received) >= count
+
+
+class FakeStripe:
+    """Minimal in-memory Stripe PaymentIntents API for offline tests and load runs
+
+    Supports create, modify and retrieve, plus a test-only /confirm route that marks
+    an intent as succeeded. `fail_next` makes the next N calls return 500 and
+    `delay` adds latency to every call.
+    """
+
+    def __init__(self, delay=0.0, port=0):
+        self.delay = delay
+        self.fail_next = 0
+        self.intents = {}
+        self.calls = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, method):
+                from urllib.parse import parse_qsl
+
+                length = int(self.headers.get("Content-Length", 0))
+                form = dict(parse_qsl(self.rfile.read(length).decode())) if length else {}
+                fake.calls.append((method, self.path))
+                time.sleep(fake.delay)
+                if fake.fail_next:
+                    fake.fail_next -= 1
+                    return self._reply(500, {"error": {"message": "injected failure"}})
+
+                parts = self.path.strip("/").split("/")
+                if parts[:2] != ["v1", "payment_intents"]:
+                    return self._reply(404, {"error": {"message": "unknown route"}})
+                if len(parts) == 2 and method == "POST":
+                    intent_id = f"pi_fake_{len(fake.intents) + 1}"
+                    fake.intents[intent_id] = {
+                        "id": intent_id,
+                        "object": "payment_intent",
+                        "amount": int(form["amount"]),
+                        "currency": form.get("currency"),
+                        "status": "requires_payment_method",
+                        "client_secret": f"{intent_id}_secret",
+                        "metadata": {k[9:-1]: v for k, v in form.items() if k.startswith("metadata[")},
+                    }
+                    return self._reply(200, fake.intents[intent_id])
+
+                intent = fake.intents.get(parts[2]) if len(parts) > 2 else None
+                if intent is None:
+                    return self._reply(404, {"error": {"message": "No such payment_intent"}})
+                if len(parts) == 4 and parts[3] == "confirm":
+                    intent["status"] = "succeeded"
+                elif method == "POST" and "amount" in form:
+                    intent["amount"] = int(form["amount"])
+                return self._reply(200, intent)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def succeed(self, intent_id):
+        self.intents[intent_id]["status"] = "succeeded"
+
+
+if __name__ == "__main__":
+    # Run standalone for offline load tests:
+    #   python tests/stubs.py 12111 0.3
+    #   STRIPE_API_BASE=http://127.0.0.1:12111 uvicorn main:app
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 12111
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    stub = FakeStripe(delay=delay, port=port)
+    print(f"Fake Stripe listening on {stub.url}")
+    with stub:
+        stub.thread.join()
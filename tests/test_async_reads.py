@@ -0,0 +1,55 @@
+"""
+Async Read Path Tests
+Tests for the read endpoints served through the aiosqlite engine
+"""
+
+import asyncio
+import inspect
+import pytest
+
+
+@pytest.mark.integration
+class TestAsyncReads:
+    """Test cases for endpoints on get_async_db"""
+
+    def test_read_endpoints_are_coroutines(self):
+        """SUCCESS: Read endpoints run on the event loop, not the threadpool"""
+        import main
+
+        for endpoint in (main.products_home, main.product_detail, main.check_purchase, main.check_email_log, main.recommend_products):
+            assert inspect.iscoroutinefunction(endpoint), endpoint.__name__
+
+    def test_async_engine_profile(self, test_async_engine):
+        """SUCCESS: Async connections get the same SQLite profile"""
+        async def pragmas():
+            async with test_async_engine.connect() as conn:
+                return (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar(), (await conn.exec_driver_sql("PRAGMA busy_timeout")).scalar()
+
+        assert asyncio.run(pragmas()) == ("wal", 5000)
+
+    def test_check_purchase(self, client, test_order, test_user, db_session):
+        """SUCCESS: Paid orders are counted"""
+        params = {"user_id": test_user.id, "product_id": test_order.p_id}
+        assert client.get("/check-purchase", params=params).json()["purchase_count"] == 0
+
+        test_order.payment_status = "COD"
+        db_session.commit()
+        assert client.get("/check-purchase", params=params).json()["purchase_count"] == 1
+
+    def test_check_email_log(self, client, test_user, test_product):
+        """SUCCESS: A fresh email log suppresses the next send"""
+        assert client.get("/check-email-log", params={"user_id": test_user.id}).json() == {"send": True}
+        client.post("/log-email", json={"user_id": test_user.id, "product_id": test_product.p_id})
+        assert client.get("/check-email-log", params={"user_id": test_user.id}).json() == {"send": False}
+
+    def test_product_detail_logged_in(self, token_client, test_product):
+        """SUCCESS: Product page resolves the user through the async session"""
+        response = token_client.get(f"/product/{test_product.p_id}")
+        assert response.status_code == 200
+        assert test_product.title in response.text
+
+    def test_home_lists_products(self, client, test_product):
+        """SUCCESS: Home page renders the catalog from the async session"""
+        response = client.get("/")
+        assert response.status_code == 200
+        assert test_product.title in response.text
@@ -83,4 +83,80 @@ class TestAuthentication:
     def test_unauthenticated_redirect(self, client):
         """FAIL: Unauthenticated user redirected from protected routes"""
         response = client.get("/addproduct", follow_redirects=False)
-        assert response.status_code == 303
\ No newline at end of file
+        assert response.status_code == 303
+
+@pytest.mark.auth
+class TestPrincipalCache:
+    """Test cases for the cached user principal"""
+
+    def test_second_request_skips_user_lookup(self, token_client, test_user):
+        """SUCCESS: Repeat authenticated requests are served from the cache"""
+        from cache import principal_cache
+
+        token_client.get("/addproduct")
+        before = principal_cache.stats()
+        response = token_client.get("/addproduct")
+        assert response.status_code == 200
+        after = principal_cache.stats()
+        assert after["hits"] == before["hits"] + 1
+        assert after["misses"] == before["misses"]
+
+    def test_new_token_is_a_new_key(self, db_session, test_user):
+        """EDGE: Entries are keyed by token exp as well as user id"""
+        from cache import principal_cache, Principal
+
+        principal_cache.set(test_user.id, 2000000000, Principal(id=test_user.id, email=test_user.email))
+        assert principal_cache.get(test_user.id, 2000000000) is not None
+        assert principal_cache.get(test_user.id, 2000000001) is None
+
+    def test_invalidate_drops_all_tokens_for_user(self, test_user):
+        """SUCCESS: Invalidation hook removes every entry for the user"""
+        from cache import principal_cache, Principal
+
+        principal = Principal(id=test_user.id, email=test_user.email)
+        principal_cache.set(test_user.id, 2000000000, principal)
+        principal_cache.set(test_user.id, 2000000001, principal)
+        principal_cache.invalidate(test_user.id)
+        assert principal_cache.get(test_user.id, 2000000000) is None
+        assert principal_cache.get(test_user.id, 2000000001) is None
+
+    def test_password_change_invalidates(self, client, test_user):
+        """SUCCESS: /password drops the cached principal"""
+        from cache import principal_cache, Principal
+
+        principal_cache.set(test_user.id, 2000000000, Principal(id=test_user.id, email=test_user.email))
+        client.cookies.set("csrf_token", "test-csrf-token")
+        client.post("/password", data={
+            "email": test_user.email,
+            "otp": "123456",
+            "password": "brandnewpassword",
+            "csrf_token": "test-csrf-token"
+        }, follow_redirects=False)
+        assert principal_cache.get(test_user.id, 2000000000) is None
+
+    def test_lru_evicts_oldest(self):
+        """EDGE: Cache stays bounded"""
+        from cache import LRUCache
+
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_stats_exposed(self, client, monkeypatch):
+        """SUCCESS: Principal cache stats are exposed"""
+        import main
+        monkeypatch.setattr(main, "INTERNAL_API_KEY", "ops-key")
+        assert "principals" in client.get("/internal/stats", headers={"x-internal-key": "ops-key"}).json()
+
+    def test_stats_require_key(self, client, monkeypatch):
+        """FAIL: Stats are refused without the internal key"""
+        import main
+        assert client.get("/internal/stats").status_code == 503
+        monkeypatch.setattr(main, "INTERNAL_API_KEY", "ops-key")
+        assert client.get("/internal/stats").status_code == 401
+        assert client.get("/internal/stats", headers={"x-internal-key": "wrong"}).status_code == 401
@@ -0,0 +1,156 @@
+"""
+Catalog Cache Tests
+Tests for the in-process catalog snapshot and its invalidation
+"""
+
+import pytest
+
+
+@pytest.mark.products
+class TestCatalogCache:
+    """Test cases for the catalog snapshot cache"""
+
+    def test_repeat_reads_hit_snapshot(self, client, test_product):
+        """SUCCESS: Second read is served from the snapshot"""
+        from cache import catalog_cache
+
+        client.get(f"/product/{test_product.p_id}")
+        before = catalog_cache.stats()
+        client.get(f"/product/{test_product.p_id}")
+        client.get("/")
+        after = catalog_cache.stats()
+        assert after["hits"] == before["hits"] + 2
+        assert after["rebuilds"] == before["rebuilds"]
+
+    def test_bump_forces_rebuild(self, client, test_product, db_session):
+        """SUCCESS: Bumping the version makes readers see new rows"""
+        from cache import catalog_cache
+
+        client.get(f"/product/{test_product.p_id}")
+        test_product.discount = 55
+        db_session.commit()
+
+        catalog_cache.bump()
+        rebuilds = catalog_cache.stats()["rebuilds"]
+        response = client.get("/api/products")
+        assert response.json()["items"][0]["discount"] == 55
+        assert catalog_cache.stats()["rebuilds"] == rebuilds + 1
+
+    def test_ttl_expiry_rebuilds(self, db_session, test_product):
+        """EDGE: Expired snapshot is rebuilt even without a bump"""
+        from cache import CatalogCache
+
+        cache = CatalogCache(ttl=0)
+        cache.get(db_session)
+        cache.get(db_session)
+        assert cache.stats()["rebuilds"] == 2
+
+    def test_order_bumps_version(self, token_client, test_product):
+        """SUCCESS: Stock decrement from an order moves the version and the served stock"""
+        from cache import catalog_cache
+
+        version = catalog_cache.version
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 3}, follow_redirects=False)
+        assert catalog_cache.version > version
+        response = token_client.get("/api/products")
+        assert response.json()["items"][0]["stock_quantity"] == 97
+
+    def test_stock_writes_patch_snapshot(self, token_client, test_product, test_db_session):
+        """SUCCESS: Orders, batch orders, cancels and expired holds update stock without a rebuild"""
+        import datetime
+        from cache import catalog_cache
+        from db import Order, StockReservation
+        from inventory import ReservationSweeper
+
+        token_client.get("/api/products")
+        rebuilds = catalog_cache.stats()["rebuilds"]
+
+        def stock():
+            return token_client.get("/api/products").json()["items"][0]["stock_quantity"]
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 3}, follow_redirects=False)
+        assert stock() == 97
+        db = test_db_session()
+        order_id = db.query(Order.o_id).scalar()
+        db.close()
+        token_client.post(f"/orders/cancel/{order_id}", data={"csrf_token": "test-csrf-token"}, follow_redirects=False)
+        assert stock() == 100
+        token_client.post("/orders/batch", json={"items": [{"product_id": test_product.p_id, "quantity": 4}]})
+        assert stock() == 96
+
+        db = test_db_session()
+        db.query(StockReservation).update({"expires_at": datetime.datetime.utcnow() - datetime.timedelta(minutes=1)})
+        db.commit()
+        db.close()
+        ReservationSweeper(test_db_session).sweep()
+        assert stock() == 100
+        assert catalog_cache.stats()["rebuilds"] == rebuilds
+        assert catalog_cache.stats()["patches"] >= 4
+
+    def test_patch_updates_every_index(self, db_session, test_product):
+        """SUCCESS: A stock patch is visible by id, by category and in pages, and leaves the old snapshot intact"""
+        from cache import CatalogCache
+
+        cache = CatalogCache(ttl=60)
+        old = cache.get(db_session)
+        cache.update_stock({test_product.p_id: 7, 10 ** 6: 1})
+        new = cache.get(db_session)
+        assert cache.stats()["rebuilds"] == 1
+        assert new.by_id[test_product.p_id].stock_quantity == 7
+        assert new.by_category["Electronics"][0].stock_quantity == 7
+        assert new.page()["items"][0].stock_quantity == 7
+        assert old.by_id[test_product.p_id].stock_quantity == 100
+
+    def test_stale_snapshot_not_patched(self, db_session, test_product):
+        """EDGE: A snapshot already invalidated by a catalog write is rebuilt, not patched"""
+        from cache import CatalogCache
+
+        cache = CatalogCache(ttl=60)
+        cache.get(db_session)
+        cache.bump()
+        cache.update_stock({test_product.p_id: 7})
+        assert cache.stats()["patches"] == 0
+        assert cache.get(db_session).by_id[test_product.p_id].stock_quantity == 100
+        assert cache.stats()["rebuilds"] == 2
+
+    def test_async_rebuild_runs_off_the_loop(self, test_db_session, test_product):
+        """SUCCESS: get_async rebuilds on a worker thread and serves hits without one"""
+        import asyncio
+        import threading
+        from cache import CatalogCache
+
+        threads = []
+
+        def session():
+            threads.append(threading.get_ident())
+            return test_db_session()
+
+        async def read_twice():
+            first = await cache.get_async()
+            second = await cache.get_async()
+            return threading.get_ident(), first, second
+
+        cache = CatalogCache(ttl=60, session_factory=session)
+        loop_thread, first, second = asyncio.run(read_twice())
+        assert first is second
+        assert first.by_id[test_product.p_id].title == "Test Product"
+        assert len(threads) == 1 and threads[0] != loop_thread
+        assert cache.stats()["rebuilds"] == 1 and cache.stats()["hits"] == 1
+
+    def test_recommend_products_from_snapshot(self, client, test_product):
+        """SUCCESS: Recommendations come from the snapshot's category index"""
+        response = client.get("/recommend-products", params={
+            "category": "Electronics",
+            "product_id": test_product.p_id,
+            "email": "a@example.com",
+            "user_id": 1
+        })
+        assert response.status_code == 200
+        assert response.json()[0]["title"] == "Test Product"
+
+    def test_stats_endpoint(self, client, monkeypatch):
+        """SUCCESS: Stats endpoint exposes hit/miss/rebuild counters"""
+        import main
+        monkeypatch.setattr(main, "INTERNAL_API_KEY", "ops-key")
+        response = client.get("/internal/stats", headers={"x-internal-key": "ops-key"})
+        assert set(response.json()["catalog"]) >= {"hits", "misses", "rebuilds", "hit_rate"}
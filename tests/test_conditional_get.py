@@ -0,0 +1,124 @@
+"""
+Conditional GET Tests
+Tests for ETag / Last-Modified handling on catalog and product pages
+"""
+
+import pytest
+
+
+@pytest.fixture
+def settled(db_session, test_product):
+    """Build the catalog, then move the last change into a past second so Last-Modified is sent"""
+    from cache import catalog_cache, rating_stats_version
+
+    catalog_cache.get(db_session)
+    catalog_cache.updated_at -= 2
+    rating_stats_version.updated_at -= 2
+
+
+@pytest.mark.products
+class TestConditionalGet:
+    """Test cases for 304 Not Modified responses"""
+
+    def test_home_sets_validators(self, client, test_product, settled):
+        """SUCCESS: Home page returns ETag and Last-Modified"""
+        response = client.get("/")
+        assert response.status_code == 200
+        assert response.headers["etag"].startswith('W/"')
+        assert "last-modified" in response.headers
+
+    def test_home_not_modified(self, client, test_product):
+        """SUCCESS: Matching If-None-Match returns 304 with no body"""
+        etag = client.get("/").headers["etag"]
+        response = client.get("/", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_product_detail_not_modified(self, client, test_product):
+        """SUCCESS: Product page honours If-None-Match"""
+        url = f"/product/{test_product.p_id}"
+        etag = client.get(url).headers["etag"]
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    def test_catalog_write_changes_etag(self, client, test_product):
+        """SUCCESS: Catalog version bump invalidates the validator"""
+        from cache import catalog_cache
+
+        etag = client.get("/").headers["etag"]
+        catalog_cache.bump()
+        response = client.get("/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_rating_write_changes_etag(self, client, test_product):
+        """SUCCESS: Review stats version bump invalidates the validator"""
+        from cache import rating_stats_version
+
+        url = f"/product/{test_product.p_id}"
+        etag = client.get(url).headers["etag"]
+        rating_stats_version.bump()
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+    def test_etag_differs_per_user(self, client, test_product, test_user):
+        """SUCCESS: Logged-in and anonymous pages get different validators"""
+        from main import create_access_token
+
+        anon = client.get("/").headers["etag"]
+        client.cookies.set("access_token", create_access_token(test_user.id))
+        response = client.get("/", headers={"If-None-Match": anon})
+        assert response.status_code == 200
+        assert response.headers["etag"] != anon
+        assert response.headers["cache-control"].startswith("private")
+
+    def test_page_params_change_etag(self, client, test_product):
+        """EDGE: Different pages of the catalog have different validators"""
+        etag = client.get("/").headers["etag"]
+        assert client.get("/?category=Books", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_if_modified_since_anonymous(self, client, test_product, settled):
+        """SUCCESS: Anonymous If-Modified-Since returns 304 when unchanged"""
+        last_modified = client.get("/").headers["last-modified"]
+        assert client.get("/", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    def test_last_modified_withheld_in_same_second(self, client, test_product):
+        """EDGE: No Last-Modified while a later write could still share its second"""
+        from cache import catalog_cache
+
+        catalog_cache.bump()
+        response = client.get("/")
+        assert response.status_code == 200
+        assert "last-modified" not in response.headers
+
+    def test_write_after_if_modified_since(self, client, test_product, settled):
+        """SUCCESS: A catalog write after the client's copy defeats If-Modified-Since"""
+        from cache import catalog_cache
+
+        last_modified = client.get("/").headers["last-modified"]
+        catalog_cache.bump()
+        response = client.get("/", headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 200
+
+    def test_ttl_rebuild_changes_validators(self, client, test_product, db_session, settled):
+        """SUCCESS: An out-of-band write picked up by a TTL rebuild changes ETag and Last-Modified"""
+        from cache import catalog_cache
+
+        url = f"/product/{test_product.p_id}"
+        first = client.get(url)
+        test_product.title = "Renamed Product"
+        db_session.commit()
+        catalog_cache._built_at = float("-inf")
+
+        response = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+        assert response.status_code == 200
+        assert "Renamed Product" in response.text
+        assert response.headers["etag"] != first.headers["etag"]
+        catalog_cache._built_at = float("-inf")
+        assert client.get(url, headers={"If-Modified-Since": first.headers["last-modified"]}).status_code == 200
+
+    def test_ttl_rebuild_without_changes_keeps_etag(self, client, test_product):
+        """EDGE: A TTL rebuild that finds the same rows keeps the validator"""
+        from cache import catalog_cache
+
+        etag = client.get("/").headers["etag"]
+        catalog_cache._built_at = float("-inf")
+        assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
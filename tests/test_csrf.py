@@ -0,0 +1,130 @@
+"""
+CSRF Middleware Tests
+Tests for CSRF cookie issuance and double-submit validation on form posts
+"""
+
+import re
+import pytest
+
+
+def csrf_set_cookies(response):
+    return [v for k, v in response.headers.multi_items() if k == "set-cookie" and v.startswith("csrf_token=")]
+
+
+def echo_app(**kwargs):
+    # Minimal app behind the middleware that reports what the endpoint received
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+    from csrf import CSRFMiddleware
+
+    async def echo(request):
+        form = await request.form()
+        upload = form.get("image")
+        return JSONResponse({
+            "fields": {k: v for k, v in form.items() if isinstance(v, str)},
+            "image": (await upload.read()).decode() if upload else None,
+            "cookie": request.cookies.get("csrf_token"),
+        })
+
+    app = Starlette(routes=[Route("/form", echo, methods=["GET", "POST"]), Route("/open", echo, methods=["POST"])])
+    return CSRFMiddleware(app, protected={"/form"}, **kwargs)
+
+
+@pytest.mark.auth
+class TestCSRFIssuance:
+    """Test cases for handing out the csrf_token cookie"""
+
+    def test_first_page_gets_cookie_and_form_token(self, client):
+        """SUCCESS: The first response sets the cookie and its form already carries the same token"""
+        response = client.get("/login")
+        cookies = csrf_set_cookies(response)
+        assert len(cookies) == 1
+        token = cookies[0].split(";")[0].split("=", 1)[1]
+        assert "SameSite=lax" in cookies[0] and "Secure" in cookies[0]
+        assert re.search(r'name="csrf_token" value="([^"]+)"', response.text).group(1) == token
+
+    def test_existing_cookie_kept(self, client):
+        """SUCCESS: A request that already has the cookie gets no new one"""
+        client.cookies.set("csrf_token", "test-csrf-token")
+        assert csrf_set_cookies(client.get("/login")) == []
+
+    def test_static_files_skipped(self, client):
+        """EDGE: Static and upload mounts never get a cookie"""
+        response = client.get("/static/style2.css")
+        assert response.status_code == 200
+        assert csrf_set_cookies(response) == []
+
+    def test_login_rotates_token(self, client, test_user):
+        """SUCCESS: A successful login sets exactly one fresh csrf cookie"""
+        client.cookies.set("csrf_token", "test-csrf-token")
+        response = client.post("/login", data={"email": test_user.email, "password": "password123", "csrf_token": "test-csrf-token"}, follow_redirects=False)
+        assert response.status_code == 303
+        cookies = csrf_set_cookies(response)
+        assert len(cookies) == 1
+        assert not cookies[0].startswith("csrf_token=test-csrf-token;")
+
+
+@pytest.mark.auth
+class TestCSRFValidation:
+    """Test cases for rejecting form posts without a matching token"""
+
+    def test_missing_token_rejected(self, client, test_user):
+        """FAIL: A protected post without any token is rejected before the endpoint runs"""
+        response = client.post("/login", data={"email": test_user.email, "password": "password123"}, follow_redirects=False)
+        assert response.status_code == 403
+        assert response.json() == {"detail": "CSRF token missing"}
+
+    def test_mismatched_token_rejected(self, client, test_user):
+        """FAIL: A form token that does not match the cookie is rejected"""
+        client.cookies.set("csrf_token", "test-csrf-token")
+        response = client.post("/login", data={"email": test_user.email, "password": "password123", "csrf_token": "other"}, follow_redirects=False)
+        assert response.status_code == 403
+        assert response.json() == {"detail": "Invalid CSRF token"}
+
+    def test_cancel_prefix_protected(self, token_client, test_order):
+        """FAIL: Dynamic protected paths are matched by prefix"""
+        response = token_client.post(f"/orders/cancel/{test_order.o_id}", data={"csrf_token": "nope"}, follow_redirects=False)
+        assert response.status_code == 403
+
+    def test_urlencoded_body_replayed(self):
+        """SUCCESS: The endpoint still sees every field after the token was checked"""
+        from starlette.testclient import TestClient
+
+        client = TestClient(echo_app())
+        client.cookies.set("csrf_token", "tok")
+        response = client.post("/form", data={"csrf_token": "tok", "title": "Lamp"})
+        assert response.json()["fields"] == {"csrf_token": "tok", "title": "Lamp"}
+
+    def test_multipart_body_replayed(self):
+        """SUCCESS: Uploads pass through intact when the token field comes first or last"""
+        from starlette.testclient import TestClient
+
+        client = TestClient(echo_app())
+        client.cookies.set("csrf_token", "tok")
+        image = "x" * 200_000
+        response = client.post("/form", data={"csrf_token": "tok", "title": "Lamp"}, files={"image": ("a.png", image, "image/png")})
+        assert response.json()["image"] == image
+        assert response.json()["fields"]["title"] == "Lamp"
+
+        response = client.post("/form", data={"csrf_token": "bad"}, files={"image": ("a.png", image, "image/png")})
+        assert response.status_code == 403
+
+    def test_multipart_file_named_like_token_ignored(self):
+        """EDGE: A file part cannot stand in for the token field"""
+        from starlette.testclient import TestClient
+
+        client = TestClient(echo_app())
+        client.cookies.set("csrf_token", "tok")
+        response = client.post("/form", files={"csrf_token": ("t.txt", "tok", "text/plain")})
+        assert response.json() == {"detail": "CSRF token missing"}
+
+    def test_header_token_and_unprotected_paths(self):
+        """SUCCESS: An X-CSRF-Token header is accepted and unprotected paths are not checked"""
+        from starlette.testclient import TestClient
+
+        client = TestClient(echo_app())
+        client.cookies.set("csrf_token", "tok")
+        assert client.post("/form", json={}, headers={"X-CSRF-Token": "tok"}).status_code == 200
+        assert client.post("/open", data={"title": "x"}).status_code == 200
+        assert client.get("/form").status_code == 200
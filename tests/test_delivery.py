@@ -144,4 +144,98 @@ class TestDeliveryUpdate:
         
         response = authenticated_client.put(f"/updatedeliver/{test_product.p_id}")
         assert response.status_code == 404
-        assert b"not found" in response.content.lower() or b"unpaid" in response.content.lower()
\ No newline at end of file
+        assert b"not found" in response.content.lower() or b"unpaid" in response.content.lower()
+
+@pytest.fixture
+def fulfilment_client(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "FULFILMENT_API_KEY", "warehouse-key")
+    client.headers["X-Fulfilment-Key"] = "warehouse-key"
+    return client
+
+
+def add_orders(db_session, user, product, count, status="PAID"):
+    from sqlalchemy import insert
+    from db import Order
+
+    db_session.execute(insert(Order), [
+        {"c_id": user.id, "p_id": product.p_id, "total_price": 10, "payment_status": status, "is_delivered": False, "quantity": 1}
+        for _ in range(count)
+    ])
+    db_session.commit()
+    return [o.o_id for o in db_session.query(Order.o_id).filter(Order.payment_status == status).order_by(Order.o_id)]
+
+
+@pytest.mark.delivery
+class TestBulkDelivery:
+    """Test cases for the /fulfilment/deliveries batch endpoint"""
+
+    def test_json_ids(self, fulfilment_client, db_session, test_user, test_product, monkeypatch):
+        """SUCCESS: Listed orders are delivered in chunks"""
+        import fulfilment
+        from db import Order
+
+        monkeypatch.setattr(fulfilment, "DELIVERY_CHUNK_SIZE", 4)
+        ids = add_orders(db_session, test_user, test_product, 10)
+
+        response = fulfilment_client.post("/fulfilment/deliveries", json={"order_ids": ids})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["updated"] == 10
+        assert [c["requested"] for c in body["chunks"]] == [4, 4, 2]
+        assert db_session.query(Order).filter(Order.is_delivered == True).count() == 10
+
+    def test_streamed_csv(self, fulfilment_client, db_session, test_user, test_product):
+        """SUCCESS: CSV body with a header row is applied"""
+        ids = add_orders(db_session, test_user, test_product, 5)
+        csv = "o_id,warehouse\n" + "\n".join(f"{i},north" for i in ids) + "\nbogus,south\n"
+
+        response = fulfilment_client.post("/fulfilment/deliveries", content=csv.encode(), headers={"Content-Type": "text/csv"})
+        body = response.json()
+        assert body["updated"] == 5
+        assert body["invalid"] == ["bogus"]
+
+    def test_unpaid_and_delivered_skipped(self, fulfilment_client, db_session, test_user, test_product):
+        """EDGE: Pending and already delivered orders are not counted"""
+        paid = add_orders(db_session, test_user, test_product, 2)
+        pending = add_orders(db_session, test_user, test_product, 2, status="pending")
+
+        fulfilment_client.post("/fulfilment/deliveries", json={"order_ids": paid[:1]})
+        body = fulfilment_client.post("/fulfilment/deliveries", json={"order_ids": paid + pending}).json()
+        assert body["requested"] == 4
+        assert body["updated"] == 1
+
+    def test_invalidates_order_history(self, fulfilment_client, token_client, db_session, test_user, test_product):
+        """SUCCESS: Customers see the delivery on their next read"""
+        ids = add_orders(db_session, test_user, test_product, 1)
+        token_client.get(f"/api/orders/{test_user.id}")
+        fulfilment_client.post("/fulfilment/deliveries", json={"order_ids": ids})
+        assert token_client.get(f"/api/orders/{test_user.id}").json()["items"][0]["is_delivered"] is True
+
+    def test_requires_key(self, client, monkeypatch):
+        """FAIL: Calls without the fulfilment key are rejected"""
+        import main
+
+        monkeypatch.setattr(main, "FULFILMENT_API_KEY", "warehouse-key")
+        assert client.post("/fulfilment/deliveries", json={"order_ids": [1]}).status_code == 401
+
+    def test_disabled_without_key(self, client):
+        """FAIL: Endpoint is off until a key is configured"""
+        assert client.post("/fulfilment/deliveries", json={"order_ids": [1]}).status_code == 503
+
+    def test_hundred_thousand_updates(self, fulfilment_client, db_session, test_user, test_product):
+        """SUCCESS: A 100k-line CSV is applied in seconds"""
+        import time
+        from db import Order
+
+        ids = add_orders(db_session, test_user, test_product, 100_000)
+        csv = ("\n".join(str(i) for i in ids)).encode()
+
+        started = time.perf_counter()
+        body = fulfilment_client.post("/fulfilment/deliveries", content=csv, headers={"Content-Type": "text/csv"}).json()
+        elapsed = time.perf_counter() - started
+
+        assert body["updated"] == 100_000
+        assert db_session.query(Order).filter(Order.is_delivered == False).count() == 0
+        assert elapsed < 10
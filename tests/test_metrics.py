@@ -0,0 +1,134 @@
+"""
+Metrics Endpoint Tests
+Tests for the Prometheus /metrics endpoint and the counters behind it
+"""
+
+import asyncio
+import pytest
+from stubs import WebhookStub
+
+
+def sample(text, name, **labels):
+    # Value of one sample line in the Prometheus text format, 0 when absent
+    wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    prefix = f"{name}{{{wanted}}} " if wanted else f"{name} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+@pytest.mark.integration
+class TestMetricsEndpoint:
+    """Test cases for request metrics exposed on /metrics"""
+
+    def test_prometheus_format(self, client):
+        """SUCCESS: Endpoint serves the text exposition format"""
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "# TYPE http_request_duration_seconds histogram" in response.text
+        assert "# TYPE threadpool_threads_max gauge" in response.text
+        assert sample(response.text, "threadpool_threads_max") > 0
+
+    def test_requests_counted_per_route(self, client, test_product):
+        """SUCCESS: Requests are labelled with the route template, not the raw path"""
+        labels = {"method": "GET", "route": "/product/{product_id}"}
+        before = client.get("/metrics").text
+        for _ in range(3):
+            client.get(f"/product/{test_product.p_id}")
+        after = client.get("/metrics").text
+
+        assert sample(after, "http_requests_total", **labels, status="200") - sample(before, "http_requests_total", **labels, status="200") == 3
+        assert sample(after, "http_request_duration_seconds_count", **labels) - sample(before, "http_request_duration_seconds_count", **labels) == 3
+        assert sample(after, "http_request_duration_seconds_bucket", **labels, le="+Inf") == sample(after, "http_request_duration_seconds_count", **labels)
+        assert sample(after, "http_requests_in_flight", **labels) == 0
+        assert sample(after, "http_server_requests_in_flight") == 1
+
+    def test_unmatched_and_static(self, client):
+        """EDGE: Unknown paths share one label and static files report their mount"""
+        before = client.get("/metrics").text
+        client.get("/no/such/page/1")
+        client.get("/no/such/page/2")
+        client.get("/static/style2.css")
+        after = client.get("/metrics").text
+
+        unmatched = {"method": "GET", "route": "<unmatched>", "status": "404"}
+        static = {"method": "GET", "route": "/static", "status": "200"}
+        assert sample(after, "http_requests_total", **unmatched) - sample(before, "http_requests_total", **unmatched) == 2
+        assert sample(after, "http_requests_total", **static) - sample(before, "http_requests_total", **static) == 1
+        assert "/no/such" not in after
+
+    def test_template_and_pool_metrics(self, client, test_product):
+        """SUCCESS: Template renders and pool checkouts are timed"""
+        before = client.get("/metrics").text
+        client.get("/")
+        after = client.get("/metrics").text
+
+        assert sample(after, "template_render_seconds_count", template="products.html") - sample(before, "template_render_seconds_count", template="products.html") == 1
+        assert sample(after, "db_pool_checkout_wait_seconds_count", engine="sync") > 0
+        assert sample(after, "db_pool_connections_checked_out", engine="sync") == 0
+
+
+@pytest.mark.utility
+class TestMetricPrimitives:
+    """Test cases for histograms and external call counters"""
+
+    def test_histogram_buckets_cumulative(self):
+        """SUCCESS: Buckets are cumulative and end with +Inf"""
+        from metrics import Family, render
+
+        family = Family("demo_seconds", "Demo", "histogram", ("kind",), (0.1, 1.0))
+        child = family.labels("a")
+        for value in (0.05, 0.5, 0.5, 5):
+            child.observe(value)
+        text = render(families=[family])
+
+        assert sample(text, "demo_seconds_bucket", kind="a", le="0.1") == 1
+        assert sample(text, "demo_seconds_bucket", kind="a", le="1.0") == 3
+        assert sample(text, "demo_seconds_bucket", kind="a", le="+Inf") == 4
+        assert sample(text, "demo_seconds_sum", kind="a") == 6.05
+        assert family.labels("a") is child
+
+    def test_label_values_escaped(self):
+        """EDGE: Quotes and newlines in label values keep the output parseable"""
+        from metrics import Family, render
+
+        family = Family("demo_total", "Demo", "counter", ("name",))
+        family.labels('a"b\nc').inc()
+        assert 'demo_total{name="a\\"b\\nc"} 1' in render(families=[family])
+
+    def test_webhook_calls_counted(self):
+        """FAIL: Webhook latency is observed and failed posts are counted"""
+        from dispatcher import WebhookDispatcher
+        from metrics import external_call_duration, external_call_errors
+
+        latency, errors = external_call_duration.labels("webhook"), external_call_errors.labels("webhook")
+        calls, failures = latency.count, errors.value
+        with WebhookStub(status=500) as stub:
+            dispatcher = WebhookDispatcher(stub.url, retries=0, timeout=1)
+            dispatcher._send([{"user_id": 1}])
+        assert latency.count - calls == 1
+        assert errors.value - failures == 1
+
+    def test_stripe_calls_counted(self, fake_stripe):
+        """FAIL: Stripe latency covers retries and 5xx replies count as errors"""
+        from metrics import external_call_duration, external_call_errors
+        from stripe_client import AsyncStripeClient
+
+        latency, errors = external_call_duration.labels("stripe"), external_call_errors.labels("stripe")
+        calls, failures = latency.count, errors.value
+        client = AsyncStripeClient("sk_test", base_url=fake_stripe.url, retries=1)
+        fake_stripe.fail_next = 1
+
+        async def create():
+            try:
+                return await client.create_payment_intent(1000, "inr", {})
+            finally:
+                await client.aclose()
+
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr("stripe_client.backoff_delay", lambda attempt: 0)
+            asyncio.run(create())
+        assert latency.count - calls == 2
+        assert errors.value - failures == 1
@@ -0,0 +1,107 @@
+"""
+Order History Tests
+Tests for the cached, paginated per-user order read model
+"""
+
+import pytest
+
+
+def add_orders(db_session, user, product, count, status="pending"):
+    from db import Order
+
+    db_session.add_all([
+        Order(c_id=user.id, p_id=product.p_id, total_price=80, payment_status=status, is_delivered=False, quantity=1)
+        for _ in range(count)
+    ])
+    db_session.commit()
+
+
+@pytest.mark.orders
+class TestOrderHistory:
+    """Test cases for /api/orders and the three order views"""
+
+    def test_keyset_pages(self, token_client, db_session, test_user, test_product):
+        """SUCCESS: History is walked page by page with cursors"""
+        add_orders(db_session, test_user, test_product, 120)
+
+        first = token_client.get(f"/api/orders/{test_user.id}?limit=50").json()
+        assert len(first["items"]) == 50
+        assert first["prev_cursor"] is None
+
+        second = token_client.get(f"/api/orders/{test_user.id}?limit=50&after={first['next_cursor']}").json()
+        third = token_client.get(f"/api/orders/{test_user.id}?limit=50&after={second['next_cursor']}").json()
+        assert len(third["items"]) == 20
+        assert third["next_cursor"] is None
+
+        ids = [o["o_id"] for page in (first, second, third) for o in page["items"]]
+        assert ids == sorted(ids) and len(set(ids)) == 120
+
+        back = token_client.get(f"/api/orders/{test_user.id}?limit=50&before={second['prev_cursor']}").json()
+        assert back["items"] == first["items"]
+
+    def test_pending_has_no_payment_status(self, token_client, test_order, test_user):
+        """SUCCESS: Unpaid orders are reported without a payment status"""
+        items = token_client.get(f"/api/orders/{test_user.id}").json()["items"]
+        assert items[0]["payment_status"] is None
+        assert items[0]["title"] == "Test Product"
+
+    def test_pages_are_cached(self, token_client, db_session, test_user, test_product):
+        """SUCCESS: Repeat reads are served without re-querying"""
+        from cache import order_history
+
+        add_orders(db_session, test_user, test_product, 1)
+        token_client.get(f"/api/orders/{test_user.id}")
+        # Written behind the app's back, so the cached page must not see it
+        add_orders(db_session, test_user, test_product, 1)
+        hits = order_history.stats()["hits"]
+        assert len(token_client.get(f"/api/orders/{test_user.id}").json()["items"]) == 1
+        assert order_history.stats()["hits"] == hits + 1
+
+    def test_order_write_invalidates(self, token_client, db_session, test_order, test_user):
+        """SUCCESS: Placing an order shows up on the next read"""
+        from db import Products
+
+        other = Products(title="Other", description="Other", price=50, discount=10, image="uploads/o.jpg", category="Books")
+        db_session.add(other)
+        db_session.commit()
+
+        token_client.get(f"/api/orders/{test_user.id}")
+        token_client.post("/order", data={"product_id": other.p_id, "quantity": 1}, follow_redirects=False)
+        assert len(token_client.get(f"/api/orders/{test_user.id}").json()["items"]) == 2
+
+    def test_cancel_and_payment_invalidate(self, token_client, db_session, test_user, test_product):
+        """SUCCESS: Cancelling and paying are reflected immediately"""
+        add_orders(db_session, test_user, test_product, 2)
+        items = token_client.get(f"/api/orders/{test_user.id}").json()["items"]
+
+        token_client.post(f"/orders/cancel/{items[0]['o_id']}", data={"csrf_token": "test-csrf-token"}, follow_redirects=False)
+        items = token_client.get(f"/api/orders/{test_user.id}").json()["items"]
+        assert len(items) == 1
+
+        token_client.post("/payment", data={"method": "COD", "csrf_token": "test-csrf-token"}, follow_redirects=False)
+        items = token_client.get(f"/api/orders/{test_user.id}").json()["items"]
+        assert items[0]["payment_status"] == "COD"
+
+    def test_delivery_invalidates(self, token_client, db_session, test_user, test_product):
+        """SUCCESS: Marking delivered is reflected immediately"""
+        add_orders(db_session, test_user, test_product, 1, status="PAID")
+        token_client.get(f"/api/orders/{test_user.id}")
+        assert token_client.put(f"/updatedeliver/{test_product.p_id}").status_code == 200
+        assert token_client.get(f"/api/orders/{test_user.id}").json()["items"][0]["is_delivered"] is True
+
+    def test_views_render_from_read_model(self, token_client, test_order, test_user):
+        """SUCCESS: All three order views render the same rows"""
+        for path in ("", "/productmanager", "/category"):
+            response = token_client.get(f"/products/get-orders/{test_user.id}{path}")
+            assert response.status_code == 200
+            assert "Test Product" in response.text
+
+    def test_views_paginate(self, token_client, db_session, test_user, test_product):
+        """EDGE: Views link to the next page when history is long"""
+        add_orders(db_session, test_user, test_product, 3)
+        response = token_client.get(f"/products/get-orders/{test_user.id}/category?limit=2")
+        assert "after=" in response.text
+
+    def test_other_user_forbidden(self, token_client, other_user):
+        """FAIL: Cannot read another user's history"""
+        assert token_client.get(f"/api/orders/{other_user.id}").status_code == 403
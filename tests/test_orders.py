@@ -93,4 +93,154 @@ class TestOrders:
     def test_view_orders_empty(self, authenticated_client, test_user):
         """SUCCESS: View orders with no orders returns successfully"""
         response = authenticated_client.get(f"/products/get-orders/{test_user.id}")
-        assert response.status_code == 200
\ No newline at end of file
+        assert response.status_code == 200
+
+@pytest.mark.orders
+class TestAtomicStock:
+    """Test cases for the conditional stock decrement"""
+
+    def test_order_decrements_stock(self, token_client, test_product, db_session):
+        """SUCCESS: Order and stock decrement commit together"""
+        from db import Order
+
+        response = token_client.post("/order", data={
+            "product_id": test_product.p_id,
+            "quantity": 3
+        }, follow_redirects=False)
+        assert response.status_code == 303
+
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 97
+        assert db_session.query(Order).filter(Order.p_id == test_product.p_id).count() == 1
+
+    def test_insufficient_stock_creates_nothing(self, token_client, test_product, db_session):
+        """FAIL: Order larger than stock leaves stock and orders untouched"""
+        from db import Order
+
+        test_product.stock_quantity = 2
+        db_session.commit()
+
+        token_client.post("/order", data={
+            "product_id": test_product.p_id,
+            "quantity": 3
+        }, follow_redirects=False)
+
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 2
+        assert db_session.query(Order).count() == 0
+
+    def test_parallel_orders_never_oversell(self, client, db_session, test_product):
+        """CONCURRENCY: Parallel POST /order requests for a hot product never oversell"""
+        from concurrent.futures import ThreadPoolExecutor
+        from fastapi.testclient import TestClient
+        from db import Order, User, StockReservation
+        from main import app, create_access_token
+
+        stock, quantity, attempts = 25, 2, 40
+        test_product.stock_quantity = stock
+        users = [User(email=f"buyer{i}@example.com", password="unused") for i in range(attempts)]
+        db_session.add_all(users)
+        db_session.commit()
+        product_id, user_ids = test_product.p_id, [u.id for u in users]
+
+        def place_order(user_id):
+            # One client per buyer so each request carries its own session cookies
+            buyer = TestClient(app, cookies={"access_token": create_access_token(user_id), "csrf_token": "test-csrf-token"})
+            return buyer.post("/order", data={
+                "product_id": product_id,
+                "quantity": quantity,
+                "csrf_token": "test-csrf-token"
+            }, follow_redirects=False).status_code
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(place_order, user_ids))
+
+        db_session.refresh(test_product)
+        placed = db_session.query(Order).filter(Order.p_id == product_id).count()
+        assert statuses == [303] * attempts
+        assert test_product.stock_quantity >= 0
+        assert placed * quantity == stock - test_product.stock_quantity
+        assert placed == stock // quantity
+        assert db_session.query(StockReservation).count() == placed
+
+
+@pytest.mark.orders
+class TestBatchOrders:
+    """Test cases for the multi-item /orders/batch endpoint"""
+
+    def make_products(self, db_session, count):
+        from db import Products
+
+        products = [
+            Products(title=f"Batch {i}", description="Batch", price=100, discount=10, image="uploads/b.jpg", category="Batch")
+            for i in range(count)
+        ]
+        db_session.add_all(products)
+        db_session.commit()
+        return products
+
+    def test_json_batch_creates_all_orders(self, token_client, db_session):
+        """SUCCESS: Every valid line becomes an order with stock decremented"""
+        from db import Order
+
+        products = self.make_products(db_session, 20)
+        response = token_client.post("/orders/batch", json={
+            "items": [{"product_id": p.p_id, "quantity": 2} for p in products]
+        })
+        assert response.status_code == 200
+        body = response.json()
+        assert body["created"] == 20
+        assert all(item["status"] == "created" for item in body["items"])
+        assert db_session.query(Order).count() == 20
+        for p in products:
+            db_session.refresh(p)
+            assert p.stock_quantity == 98
+
+    def test_per_line_errors(self, token_client, db_session, test_product):
+        """EDGE: Invalid lines are reported while valid ones are still placed"""
+        from db import Order
+
+        low, ok = self.make_products(db_session, 2)
+        low.stock_quantity = 1
+        db_session.commit()
+
+        response = token_client.post("/orders/batch", json={"items": [
+            {"product_id": ok.p_id, "quantity": 1},
+            {"product_id": 999999, "quantity": 1},
+            {"product_id": low.p_id, "quantity": 5},
+            {"product_id": test_product.p_id, "quantity": 0},
+            {"product_id": ok.p_id, "quantity": 1},
+        ]})
+        items = response.json()["items"]
+        assert [i["status"] for i in items] == ["created", "error", "error", "error", "error"]
+        assert items[1]["error"] == "Product not found"
+        assert items[2]["error"] == "Out of stock"
+        assert items[4]["error"] == "Product already in cart"
+        assert db_session.query(Order).count() == 1
+        db_session.refresh(low)
+        assert low.stock_quantity == 1
+
+    def test_form_batch(self, token_client, db_session):
+        """SUCCESS: Repeated form fields are accepted and redirect home"""
+        from db import Order
+
+        products = self.make_products(db_session, 3)
+        response = token_client.post("/orders/batch", data={
+            "product_id": [str(p.p_id) for p in products],
+            "quantity": ["1", "2", "3"]
+        }, follow_redirects=False)
+        assert response.status_code == 303
+        assert sorted(o.quantity for o in db_session.query(Order)) == [1, 2, 3]
+
+    def test_existing_cart_item_rejected(self, token_client, db_session, test_order, test_product):
+        """FAIL: A product already in the cart is not ordered twice"""
+        response = token_client.post("/orders/batch", json={"items": [{"product_id": test_product.p_id, "quantity": 1}]})
+        assert response.json()["items"][0]["error"] == "Product already in cart"
+
+    def test_empty_batch_rejected(self, token_client):
+        """FAIL: A batch with no items is rejected"""
+        assert token_client.post("/orders/batch", json={"items": []}).status_code == 422
+
+    def test_requires_login(self, client):
+        """FAIL: Anonymous batch orders are rejected"""
+        assert client.post("/orders/batch", json={"items": [{"product_id": 1, "quantity": 1}]}).status_code == 401
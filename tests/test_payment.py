@@ -161,4 +161,303 @@ class TestPayment:
         
         orders = db_session.query(Order).all()
         assert len(orders) == 2
-        assert all(o.payment_status == "COD" for o in orders)
\ No newline at end of file
+        assert all(o.payment_status == "COD" for o in orders)
+
+@pytest.mark.payment
+class TestPaymentIntentReuse:
+    """Test cases for reusing one Stripe PaymentIntent per cart"""
+
+    def test_intent_cart_recorded(self, token_client, test_order, db_session, fake_stripe):
+        """SUCCESS: Creating an intent records which orders it charges for"""
+        from db import PaymentIntentOrder
+
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+        rows = db_session.query(PaymentIntentOrder.intent_id, PaymentIntentOrder.o_id).all()
+        assert rows == [("pi_fake_1", test_order.o_id)]
+
+    def test_reload_reuses_intent(self, token_client, test_order, fake_stripe):
+        """SUCCESS: Reloading the payment page makes no further Stripe calls"""
+        token_client.post("/checkout/start", follow_redirects=False)
+        first = token_client.get("/payment")
+        second = token_client.get("/payment")
+        assert first.status_code == second.status_code == 200
+        assert b"pi_fake_1_secret" in second.content
+        assert fake_stripe.calls == [("POST", "/v1/payment_intents")]
+
+    def test_cart_change_creates_new_intent(self, token_client, test_order, test_user, db_session, fake_stripe):
+        """SUCCESS: A different set of pending orders gets a fresh intent"""
+        from db import Products, Order
+
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+
+        product = Products(title="Second", description="d", price=50, discount=10, image="uploads/x.jpg", category="Books")
+        db_session.add(product)
+        db_session.commit()
+        db_session.add(Order(c_id=test_user.id, p_id=product.p_id, total_price=45, payment_status="pending", quantity=1))
+        db_session.commit()
+
+        response = token_client.get("/payment")
+        assert b"pi_fake_2_secret" in response.content
+        assert len(fake_stripe.calls) == 2
+
+    def test_amount_change_modifies_intent(self, token_client, test_order, db_session, fake_stripe):
+        """SUCCESS: Same cart with a new total modifies the existing intent"""
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+
+        test_order.total_price = 60
+        db_session.commit()
+
+        token_client.get("/payment")
+        assert fake_stripe.calls[-1] == ("POST", "/v1/payment_intents/pi_fake_1")
+        assert fake_stripe.intents["pi_fake_1"]["amount"] == 6000
+        assert len(fake_stripe.calls) == 2
+
+    def test_cod_payment_drops_intent(self, token_client, test_order, db_session, fake_stripe):
+        """SUCCESS: Completing payment forgets the intent"""
+        from db import Order
+
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+        token_client.post("/payment", data={"method": "COD", "csrf_token": "test-csrf-token"}, follow_redirects=False)
+        db_session.refresh(test_order)
+        assert test_order.payment_status == "COD"
+
+        db_session.add(Order(c_id=test_order.c_id, p_id=test_order.p_id, total_price=80, payment_status="pending", quantity=1))
+        db_session.commit()
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+        assert len(fake_stripe.intents) == 2
+
+
+@pytest.mark.payment
+class TestAsyncStripeClient:
+    """Test cases for the async Stripe client and card settlement"""
+
+    def test_card_payment_settles(self, token_client, test_order, fake_stripe, db_session):
+        """SUCCESS: Succeeded intent marks the cart paid"""
+        from db import Transactions
+
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+        fake_stripe.succeed("pi_fake_1")
+
+        response = token_client.post("/payment", data={
+            "method": "CARD",
+            "payment_intent_id": "pi_fake_1",
+            "csrf_token": "test-csrf-token"
+        }, follow_redirects=False)
+        assert response.status_code == 303
+        db_session.refresh(test_order)
+        assert test_order.payment_status == "PAID"
+        assert db_session.query(Transactions).count() == 1
+
+    def test_cancelled_cart_is_not_confirmed(self, token_client, test_order, fake_stripe, db_session):
+        """FAIL: Paying for a cart whose orders are gone is flagged instead of confirmed"""
+        from db import Order, Transactions
+
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+        fake_stripe.succeed("pi_fake_1")
+        db_session.add(Order(c_id=test_order.c_id, p_id=test_order.p_id, total_price=80, payment_status="pending", quantity=1))
+        db_session.delete(test_order)
+        db_session.commit()
+
+        response = token_client.post("/payment", data={
+            "method": "CARD",
+            "payment_intent_id": "pi_fake_1",
+            "csrf_token": "test-csrf-token"
+        })
+        assert "Order confirmed" not in response.text
+        assert "reconcile" in response.text
+        assert db_session.query(Transactions.status).scalar() == "needs_review"
+
+    def test_unsucceeded_intent_is_rejected(self, token_client, test_order, fake_stripe, db_session):
+        """FAIL: Intent that has not succeeded leaves the cart pending"""
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+
+        response = token_client.post("/payment", data={
+            "method": "CARD",
+            "payment_intent_id": "pi_fake_1",
+            "csrf_token": "test-csrf-token"
+        }, follow_redirects=False)
+        assert response.headers["location"] == "/payment"
+        db_session.refresh(test_order)
+        assert test_order.payment_status == "pending"
+
+    def test_transient_errors_are_retried(self, token_client, test_order, fake_stripe):
+        """SUCCESS: 5xx from the provider is retried"""
+        fake_stripe.fail_next = 1
+        token_client.post("/checkout/start", follow_redirects=False)
+        response = token_client.get("/payment")
+        assert response.status_code == 200
+        assert len(fake_stripe.calls) == 2
+
+    def test_provider_down_degrades_gracefully(self, token_client, test_order, fake_stripe):
+        """FAIL: Provider outage redirects instead of erroring"""
+        fake_stripe.fail_next = 10
+        token_client.post("/checkout/start", follow_redirects=False)
+        response = token_client.get("/payment", follow_redirects=False)
+        assert response.status_code == 303
+
+    def test_breaker_short_circuits(self, fake_stripe):
+        """FAIL: Open circuit fails fast without calling the provider"""
+        import asyncio
+        from resilience import CircuitBreaker
+        from stripe_client import AsyncStripeClient, StripeUnavailable
+
+        client = AsyncStripeClient("sk_test", base_url=fake_stripe.url, retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+        fake_stripe.fail_next = 5
+
+        async def run():
+            for _ in range(3):
+                with pytest.raises(StripeUnavailable):
+                    await client.retrieve_payment_intent("pi_x")
+            await client.aclose()
+
+        asyncio.run(run())
+        assert len(fake_stripe.calls) == 1
+
+    def test_cancelled_trial_frees_breaker(self):
+        """EDGE: A half-open trial cancelled mid-flight does not wedge the breaker"""
+        import asyncio
+        import httpx
+        from resilience import CircuitBreaker
+        from stripe_client import AsyncStripeClient
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.failure()
+        client = AsyncStripeClient("sk_test", base_url="http://stripe.test", retries=0, breaker=breaker)
+        slow = asyncio.Event()
+
+        async def handler(request):
+            if not slow.is_set():
+                slow.set()
+                await asyncio.sleep(10)
+            return httpx.Response(200, json={"id": "pi_x", "status": "succeeded"})
+
+        async def run():
+            client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            trial = asyncio.create_task(client.retrieve_payment_intent("pi_x"))
+            await slow.wait()
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            intent = await client.retrieve_payment_intent("pi_x")
+            await client.aclose()
+            return intent
+
+        assert asyncio.run(run())["status"] == "succeeded"
+        assert breaker.state == "closed"
+
+    def test_non_json_error_body(self):
+        """FAIL: An HTML error page from a proxy surfaces as StripeError"""
+        import asyncio
+        import httpx
+        from stripe_client import AsyncStripeClient, StripeError
+
+        client = AsyncStripeClient("sk_test", base_url="http://stripe.test", retries=0)
+
+        async def run():
+            client._client = httpx.AsyncClient(transport=httpx.MockTransport(
+                lambda request: httpx.Response(403, text="<html>Forbidden</html>", headers={"Content-Type": "text/html"})
+            ))
+            with pytest.raises(StripeError):
+                await client.retrieve_payment_intent("pi_x")
+            await client.aclose()
+
+        asyncio.run(run())
+        assert client.errors == 1
+
+    def test_form_encoding(self):
+        """SUCCESS: Nested params use Stripe's bracket encoding"""
+        from stripe_client import encode_form
+
+        assert encode_form({"amount": 100, "metadata": {"user_id": 1}, "automatic_payment_methods": {"enabled": True}}) == [
+            ("amount", "100"),
+            ("metadata[user_id]", "1"),
+            ("automatic_payment_methods[enabled]", "true"),
+        ]
+
+
+@pytest.mark.payment
+class TestBulkSettlement:
+    """Test cases for single-transaction cart settlement"""
+
+    def make_cart(self, db_session, test_user, test_product, size):
+        from db import Order
+        from payments import pending_orders
+
+        db_session.add_all([
+            Order(c_id=test_user.id, p_id=test_product.p_id, total_price=10, payment_status="pending", quantity=1)
+            for _ in range(size)
+        ])
+        db_session.commit()
+        return pending_orders(db_session, test_user.id)
+
+    def test_card_settles_whole_cart(self, db_session, test_user, test_product):
+        """SUCCESS: Every order gets a payment row linked to one transaction"""
+        from db import Order, Payment, Transactions
+        from payments import settle_card
+
+        orders = self.make_cart(db_session, test_user, test_product, 25)
+        assert settle_card(db_session, orders, "pi_bulk", 25000) is True
+
+        transaction = db_session.query(Transactions).one()
+        assert db_session.query(Payment).filter(Payment.t_id == transaction.t_id).count() == 25
+        assert db_session.query(Order).filter(Order.payment_status == "PAID").count() == 25
+
+    def test_cod_settles_whole_cart(self, db_session, test_user, test_product):
+        """SUCCESS: COD marks the cart and records a payment per order"""
+        from db import Order, Payment
+        from payments import settle_cod
+
+        settle_cod(db_session, self.make_cart(db_session, test_user, test_product, 5))
+        assert db_session.query(Payment).filter(Payment.method == "COD").count() == 5
+        assert db_session.query(Order).filter(Order.payment_status == "COD").count() == 5
+
+    def test_duplicate_intent_is_noop(self, db_session, test_user, test_product):
+        """EDGE: Settling the same intent twice leaves one transaction"""
+        from db import Transactions
+        from payments import settle_card
+
+        orders = self.make_cart(db_session, test_user, test_product, 2)
+        settle_card(db_session, orders, "pi_dup", 2000)
+        assert settle_card(db_session, orders, "pi_dup", 2000) is False
+        assert db_session.query(Transactions).count() == 1
+
+    def test_empty_cart_is_flagged(self, db_session):
+        """FAIL: An intent with nothing left to settle is recorded for review, not confirmed"""
+        from db import Transactions
+        from payments import settle_card
+
+        assert settle_card(db_session, [], "pi_empty", 8000) is False
+        assert db_session.query(Transactions.status).filter(Transactions.stripe_intent_id == "pi_empty").scalar() == "needs_review"
+
+    def test_amount_mismatch_is_flagged(self, db_session, test_user, test_product):
+        """FAIL: An intent whose amount differs from the cart total leaves the cart unpaid"""
+        from db import Order, Payment, Transactions
+        from payments import settle_card
+
+        orders = self.make_cart(db_session, test_user, test_product, 3)
+        assert settle_card(db_session, orders, "pi_short", 2000) is False
+        assert db_session.query(Transactions).one().status == "needs_review"
+        assert db_session.query(Payment).count() == 0
+        assert db_session.query(Order).filter(Order.payment_status == "pending").count() == 3
+
+    def test_order_paid_concurrently_is_flagged(self, db_session, test_user, test_product):
+        """FAIL: An intent whose cart was partly paid by another writer is flagged, not settled for the rest"""
+        from db import Order, Payment, Transactions
+        from payments import settle_card
+
+        orders = self.make_cart(db_session, test_user, test_product, 3)
+        db_session.add(Payment(o_id=orders[0].o_id, amount=10, method="COD", status="completed"))
+        db_session.commit()
+
+        assert settle_card(db_session, orders, "pi_race", 3000) is False
+        assert db_session.query(Transactions).one().status == "needs_review"
+        assert db_session.query(Payment).filter(Payment.method == "CARD").count() == 0
+        assert db_session.query(Order).filter(Order.payment_status == "PAID").count() == 0
@@ -0,0 +1,94 @@
+"""
+Product View Tests
+Tests for the write-behind product view buffer
+"""
+
+import pytest
+
+
+@pytest.fixture
+def buffer(test_db_session):
+    from view_buffer import ViewBuffer
+
+    return ViewBuffer(test_db_session, flush_size=100, flush_interval=60)
+
+
+@pytest.mark.products
+class TestViewBuffer:
+    """Test cases for buffered product view ingestion"""
+
+    def test_views_are_buffered_until_flush(self, buffer, db_session, test_user, test_product):
+        """SUCCESS: Views land in one batch on flush"""
+        from db import ProductView
+
+        for _ in range(5):
+            buffer.record(test_user.id, test_product.p_id)
+        assert db_session.query(ProductView).count() == 0
+
+        assert buffer.flush() == 5
+        assert db_session.query(ProductView).count() == 5
+        assert buffer.stats()["flushes"] == 1
+
+    def test_size_threshold_flushes(self, test_db_session, db_session, test_user, test_product):
+        """SUCCESS: Reaching the size threshold triggers a flush"""
+        from db import ProductView
+        from view_buffer import ViewBuffer
+
+        buffer = ViewBuffer(test_db_session, flush_size=3, flush_interval=60)
+        for _ in range(3):
+            buffer.record(test_user.id, test_product.p_id)
+        assert db_session.query(ProductView).count() == 3
+
+    def test_stop_flushes_pending(self, buffer, db_session, test_user, test_product):
+        """SUCCESS: Shutdown flushes whatever is still buffered"""
+        from db import ProductView
+
+        buffer.start()
+        buffer.record(test_user.id, test_product.p_id)
+        buffer.stop()
+        assert db_session.query(ProductView).count() == 1
+
+    def test_first_view_in_window(self, buffer, test_user, other_user, test_product):
+        """SUCCESS: Only the first view per user in the window is flagged"""
+        assert buffer.record(test_user.id, test_product.p_id) is True
+        assert buffer.record(test_user.id, test_product.p_id) is False
+        assert buffer.record(other_user.id, test_product.p_id) is True
+
+    def test_window_expiry(self, test_db_session, test_user, test_product):
+        """EDGE: A view after the window has passed counts as first again"""
+        from view_buffer import ViewBuffer
+
+        buffer = ViewBuffer(test_db_session, flush_size=100, flush_interval=60, window_minutes=0)
+        assert buffer.record(test_user.id, test_product.p_id) is True
+        assert buffer.record(test_user.id, test_product.p_id) is True
+
+    def test_product_detail_records_view(self, token_client, test_product):
+        """SUCCESS: Logged-in product view goes through the buffer"""
+        import main
+
+        recorded = main.view_buffer.stats()["recorded"]
+        response = token_client.get(f"/product/{test_product.p_id}")
+        assert response.status_code == 200
+        assert main.view_buffer.stats()["recorded"] == recorded + 1
+
+    def test_failed_flush_logged_and_kept(self, caplog, test_user, test_product):
+        """FAIL: A failed flush logs the traceback and keeps the rows for the next attempt"""
+        import logging
+        from view_buffer import ViewBuffer
+
+        class BrokenSession:
+            def execute(self, *args):
+                raise RuntimeError("database is locked")
+
+            def rollback(self):
+                pass
+
+            def close(self):
+                pass
+
+        buffer = ViewBuffer(BrokenSession, flush_size=100, flush_interval=60)
+        buffer.record(test_user.id, test_product.p_id)
+        with caplog.at_level(logging.ERROR, logger="views"):
+            assert buffer.flush() == 0
+        assert caplog.records[0].exc_info[1].args == ("database is locked",)
+        assert buffer.stats()["pending"] == 1
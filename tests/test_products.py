@@ -133,4 +133,71 @@ class TestProducts:
         }, files={
             "image": ("test.jpg", test_image, "image/jpeg")
         })
-        assert response.status_code in [200, 422]
\ No newline at end of file
+        assert response.status_code in [200, 422]
+
+@pytest.mark.products
+class TestCatalogPagination:
+    """Test cases for keyset pagination of the catalog"""
+
+    @pytest.fixture
+    def many_products(self, db_session):
+        from db import Products
+
+        products = [
+            Products(
+                title=f"Paged Product {i}",
+                description="Description",
+                price=100,
+                discount=20,
+                image="uploads/test.jpg",
+                category="Electronics" if i % 2 else "Books"
+            )
+            for i in range(7)
+        ]
+        db_session.add_all(products)
+        db_session.commit()
+        return [p.p_id for p in products]
+
+    def test_first_page_has_next_cursor(self, client, many_products):
+        """SUCCESS: First page returns limit items and a next cursor"""
+        response = client.get("/api/products?limit=3")
+        assert response.status_code == 200
+        data = response.json()
+        assert [p["p_id"] for p in data["items"]] == many_products[:3]
+        assert data["next_cursor"] == many_products[2]
+        assert data["prev_cursor"] is None
+
+    def test_walk_forward_and_back(self, client, many_products):
+        """SUCCESS: Next and prev cursors walk the whole catalog"""
+        data = client.get(f"/api/products?limit=3&after={many_products[2]}").json()
+        assert [p["p_id"] for p in data["items"]] == many_products[3:6]
+
+        back = client.get(f"/api/products?limit=3&before={data['prev_cursor']}").json()
+        assert [p["p_id"] for p in back["items"]] == many_products[:3]
+        assert back["prev_cursor"] is None
+
+    def test_last_page_has_no_next_cursor(self, client, many_products):
+        """SUCCESS: Last page has no next cursor"""
+        data = client.get(f"/api/products?limit=3&after={many_products[5]}").json()
+        assert [p["p_id"] for p in data["items"]] == many_products[6:]
+        assert data["next_cursor"] is None
+
+    def test_category_filter(self, client, many_products):
+        """SUCCESS: Category filter only returns matching products"""
+        data = client.get("/api/products?category=Books&limit=10").json()
+        assert data["items"]
+        assert all(p["category"] == "Books" for p in data["items"])
+
+    def test_limit_is_clamped(self, client, many_products):
+        """EDGE: Oversized limit is clamped to the maximum page size"""
+        from main import CATALOG_MAX_PAGE_SIZE
+
+        response = client.get(f"/api/products?limit={CATALOG_MAX_PAGE_SIZE * 10}")
+        assert response.status_code == 200
+        assert len(response.json()["items"]) == len(many_products)
+
+    def test_home_page_renders_next_link(self, client, many_products):
+        """SUCCESS: Home page renders a next link when more products exist"""
+        response = client.get("/?limit=3")
+        assert response.status_code == 200
+        assert f"after={many_products[2]}".encode() in response.content
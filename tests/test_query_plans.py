@@ -0,0 +1,143 @@
+"""
+Query Plan Tests
+Runs EXPLAIN QUERY PLAN on the SQL issued by the hot endpoints and fails on full table scans
+"""
+
+import re
+import pytest
+from sqlalchemy import event
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?! VIRTUAL TABLE)")
+
+
+@pytest.fixture
+def captured_sql(test_engine, test_async_engine):
+    """Record every statement the app sends to the test database, sync and async"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            statements.append((statement, parameters))
+
+    engines = [test_engine, test_async_engine.sync_engine]
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def query_plan(engine, statement, parameters=()):
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+
+def assert_no_full_scans(engine, statements):
+    assert statements, "no statements captured"
+    scans = []
+    for statement, parameters in statements:
+        for detail in query_plan(engine, statement, parameters):
+            if FULL_SCAN.match(detail):
+                scans.append(f"{detail}\n    {' '.join(statement.split())}")
+    assert not scans, "full table scans:\n" + "\n".join(scans)
+
+
+@pytest.mark.integration
+class TestQueryPlans:
+    """Every hot-path query must be served by an index"""
+
+    def test_cart_queries(self, token_client, test_engine, captured_sql, test_product, test_user, db_session):
+        """SUCCESS: Ordering, batch ordering and checkout use indexes"""
+        from db import Products
+
+        other = Products(title="Other", description="Other", price=50, discount=10, image="uploads/o.jpg", category="Books")
+        db_session.add(other)
+        db_session.commit()
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 1}, follow_redirects=False)
+        token_client.post("/orders/batch", json={"items": [{"product_id": other.p_id, "quantity": 1}]})
+        token_client.post("/checkout/start", follow_redirects=False)
+        cart = token_client.get(f"/api/orders/{test_user.id}")
+        assert cart.status_code == 200
+        assert len(cart.json()["items"]) == 2
+        assert_no_full_scans(test_engine, captured_sql)
+
+    def test_payment_queries(self, token_client, test_engine, captured_sql, test_order, fake_stripe):
+        """SUCCESS: Payment page and COD settlement use indexes"""
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+        token_client.post("/payment", data={"method": "COD", "csrf_token": "test-csrf-token"}, follow_redirects=False)
+        assert_no_full_scans(test_engine, captured_sql)
+
+    def test_post_purchase_queries(self, token_client, test_engine, captured_sql, test_order, test_user, db_session):
+        """SUCCESS: Delivery, review and purchase checks use indexes"""
+        test_order.payment_status = "PAID"
+        db_session.commit()
+
+        token_client.put(f"/updatedeliver/{test_order.p_id}")
+        token_client.post("/add-review", data={
+            "product_id": test_order.p_id, "rating": 5, "comment": "Great", "csrf_token": "test-csrf-token"
+        }, follow_redirects=False)
+        token_client.get(f"/check-purchase?user_id={test_user.id}&product_id={test_order.p_id}")
+        token_client.get(f"/check-email-log?user_id={test_user.id}")
+        assert_no_full_scans(test_engine, captured_sql)
+
+    def test_cancel_queries(self, token_client, test_engine, captured_sql, test_order):
+        """SUCCESS: Cancelling an order uses indexes"""
+        token_client.post(f"/orders/cancel/{test_order.o_id}", data={"csrf_token": "test-csrf-token"}, follow_redirects=False)
+        assert_no_full_scans(test_engine, captured_sql)
+
+    def test_payment_event_queries(self, test_engine, test_db_session, captured_sql, test_order):
+        """SUCCESS: Webhook ingestion and the event worker use indexes"""
+        from payments import PaymentEventWorker, store_payment_event, succeeded_intent
+
+        session = test_db_session()
+        try:
+            store_payment_event(session, {"id": "evt_1", "type": "payment_intent.succeeded", "data": {"object": {
+                "id": "pi_1", "amount": 8000, "status": "succeeded",
+                "metadata": {"user_id": str(test_order.c_id), "order_ids": str(test_order.o_id)}
+            }}})
+            succeeded_intent(session, "pi_1")
+        finally:
+            session.close()
+        PaymentEventWorker(test_db_session).process_batch()
+        assert_no_full_scans(test_engine, captured_sql)
+
+    def test_product_views_by_user(self, test_engine):
+        """SUCCESS: A user's recent views are read from the (user_id, viewed_at) index"""
+        plan = query_plan(
+            test_engine,
+            "SELECT product_id FROM product_views WHERE user_id = ? AND viewed_at >= ? ORDER BY viewed_at DESC",
+            (1, "2024-01-01"),
+        )
+        assert any("idx_product_views_user_time" in detail for detail in plan)
+
+    def test_detector_flags_scans(self, test_engine):
+        """EDGE: An unindexed predicate is reported as a full scan"""
+        with pytest.raises(AssertionError, match="SCAN orders"):
+            assert_no_full_scans(test_engine, [("SELECT o_id FROM orders WHERE quantity = ?", (1,))])
+
+    def test_orders_use_composite_indexes(self, test_engine):
+        """SUCCESS: Cart and purchase predicates pick the matching composite index"""
+        pending = query_plan(test_engine, "SELECT o_id FROM orders WHERE c_id = ? AND payment_status = ?", (1, "pending"))
+        assert any("idx_orders_customer_status" in detail for detail in pending)
+
+        purchased = query_plan(
+            test_engine,
+            "SELECT count(*) FROM orders WHERE c_id = ? AND p_id = ? AND payment_status IN (?, ?)",
+            (1, 1, "PAID", "COD"),
+        )
+        assert any("COVERING INDEX idx_orders_customer_product" in detail for detail in purchased)
+
+    def test_reservation_sweep_queries(self, token_client, test_engine, test_db_session, captured_sql, test_product, db_session):
+        """SUCCESS: Expiring holds finds them through the expiry index"""
+        import datetime
+        from db import StockReservation
+        from inventory import ReservationSweeper
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 1}, follow_redirects=False)
+        db_session.query(StockReservation).update({"expires_at": datetime.datetime(2000, 1, 1)})
+        db_session.commit()
+        captured_sql.clear()
+        ReservationSweeper(test_db_session).sweep()
+        assert_no_full_scans(test_engine, captured_sql)
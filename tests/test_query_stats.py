@@ -0,0 +1,143 @@
+"""
+SQL Instrumentation Tests
+Tests for per-request query counts, Server-Timing headers, N+1 detection and query budgets
+"""
+
+import json
+import logging
+import pytest
+
+
+def add_products(db_session, count):
+    from db import Products
+
+    products = [
+        Products(title=f"Budget {i}", description="Budget", price=100, discount=10, image="uploads/b.jpg", category="Budget")
+        for i in range(count)
+    ]
+    db_session.add_all(products)
+    db_session.commit()
+    return products
+
+
+@pytest.mark.integration
+class TestQueryBudgets:
+    """Query budgets per endpoint; each holds regardless of how many rows the page shows"""
+
+    def test_home_page(self, token_client, db_session, query_budget):
+        """SUCCESS: Catalog page stays within budget with a full page of products"""
+        add_products(db_session, 30)
+        query_budget(token_client.get("/"), 3)
+        query_budget(token_client.get("/?limit=24"), 2)
+
+    def test_product_detail(self, token_client, test_product, query_budget):
+        """SUCCESS: Product page stays within budget for a logged-in user"""
+        query_budget(token_client.get(f"/product/{test_product.p_id}"), 3)
+
+    def test_order_history(self, token_client, db_session, test_user, query_budget):
+        """SUCCESS: Cart page does not query per order"""
+        from db import Order
+
+        products = add_products(db_session, 20)
+        db_session.add_all([Order(c_id=test_user.id, p_id=p.p_id, total_price=90, quantity=1, payment_status="pending") for p in products])
+        db_session.commit()
+        query_budget(token_client.get(f"/products/get-orders/{test_user.id}"), 2)
+
+    def test_batch_order(self, token_client, db_session, query_budget):
+        """SUCCESS: Lookups are batched; only the stock update and ordered insert run per line"""
+        products = add_products(db_session, 20)
+        response = token_client.post("/orders/batch", json={"items": [{"product_id": p.p_id, "quantity": 1} for p in products]})
+        assert response.json()["created"] == 20
+        query_budget(response, 2 * 20 + 4)
+
+
+@pytest.mark.utility
+class TestQueryStats:
+    """Test cases for the engine hooks and the request middleware"""
+
+    def test_statements_counted(self, test_engine):
+        """SUCCESS: Statements run inside track_queries are counted and timed"""
+        from sqlalchemy import text
+        from query_stats import track_queries
+
+        with track_queries() as stats, test_engine.connect() as conn:
+            for _ in range(3):
+                conn.execute(text("SELECT 1"))
+        assert stats.count == 3
+        assert stats.slowest <= stats.total
+        assert stats.slowest_statement == "SELECT 1"
+
+    def test_untracked_statements_ignored(self, test_engine):
+        """EDGE: Statements outside a request are not recorded anywhere"""
+        from sqlalchemy import text
+        from query_stats import track_queries
+
+        with test_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            with track_queries() as stats:
+                pass
+        assert stats.count == 0
+
+    def test_normalize(self):
+        """SUCCESS: Statements differing only in literals or IN list length normalize together"""
+        from query_stats import normalize
+
+        assert normalize("SELECT * FROM t WHERE id IN (?, ?, ?)") == normalize("SELECT * FROM t\n WHERE id IN (?,?)")
+        assert normalize("SELECT * FROM t WHERE id = 5") == normalize("SELECT * FROM t WHERE id = 12")
+        assert normalize("SELECT * FROM t WHERE name = 'a'") == "SELECT * FROM t WHERE name = ?"
+
+    def test_n_plus_one_detected(self, test_engine):
+        """FAIL: A statement repeated more than K times is flagged"""
+        from sqlalchemy import text
+        from query_stats import track_queries
+
+        with track_queries(n_plus_one_threshold=3) as stats, test_engine.connect() as conn:
+            for i in range(5):
+                conn.execute(text("SELECT :i"), {"i": i})
+            conn.execute(text("SELECT 1, 2"))
+        assert stats.summary()["n_plus_one"] == [{"sql": "SELECT ?", "count": 5}]
+
+    def test_n_plus_one_off_by_default(self, test_engine):
+        """EDGE: Without a threshold nothing is flagged"""
+        from sqlalchemy import text
+        from query_stats import track_queries
+
+        with track_queries(n_plus_one_threshold=0) as stats, test_engine.connect() as conn:
+            for _ in range(5):
+                conn.execute(text("SELECT 1"))
+        assert stats.summary()["n_plus_one"] == []
+
+    def test_async_engine_counted(self, client, test_product):
+        """SUCCESS: Queries on the async engine show up in the Server-Timing header"""
+        from query_stats import parse_server_timing
+
+        timing = parse_server_timing(client.get(f"/product/{test_product.p_id}").headers["server-timing"])
+        assert timing["db"]["desc"] == "2 queries"
+        assert float(timing["db"]["dur"]) >= 0
+        assert "db-slowest" in timing
+
+    def test_middleware_logs(self, test_engine, caplog, monkeypatch):
+        """SUCCESS: The middleware logs one JSON line per request and warns on N+1"""
+        import query_stats
+        from sqlalchemy import text
+        from starlette.applications import Starlette
+        from starlette.responses import PlainTextResponse
+        from starlette.routing import Route
+        from starlette.testclient import TestClient
+
+        def loop(request):
+            with test_engine.connect() as conn:
+                for i in range(4):
+                    conn.execute(text("SELECT :i"), {"i": i})
+            return PlainTextResponse("ok")
+
+        monkeypatch.setattr(query_stats, "N_PLUS_ONE_THRESHOLD", 2)
+        app = query_stats.QueryStatsMiddleware(Starlette(routes=[Route("/loop", loop)]), log_requests=True)
+        with caplog.at_level(logging.INFO, logger="sql"):
+            response = TestClient(app).get("/loop")
+        assert 'desc="4 queries"' in response.headers["server-timing"]
+        lines = [json.loads(r.message) for r in caplog.records if r.name == "sql"]
+        warning = next(line for line in lines if line["event"] == "n_plus_one")
+        assert warning["statements"] == [{"sql": "SELECT ?", "count": 4}]
+        summary = next(line for line in lines if line["event"] == "request_sql")
+        assert summary["path"] == "/loop" and summary["status"] == 200 and summary["queries"] == 4
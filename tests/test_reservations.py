@@ -0,0 +1,176 @@
+"""
+Stock Reservation Tests
+Tests for expiring stock holds on pending orders
+"""
+
+import datetime
+import pytest
+
+
+def expire_all(db_session):
+    from db import StockReservation
+
+    db_session.query(StockReservation).update({"expires_at": datetime.datetime.utcnow() - datetime.timedelta(minutes=1)})
+    db_session.commit()
+
+
+@pytest.mark.orders
+class TestStockReservations:
+    """Test cases for the reservation ledger and sweeper"""
+
+    def test_order_places_hold(self, token_client, test_product, db_session):
+        """SUCCESS: Adding to cart takes stock and records an expiring hold"""
+        from db import StockReservation
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 3}, follow_redirects=False)
+        hold = db_session.query(StockReservation).one()
+        assert hold.quantity == 3
+        assert hold.expires_at > datetime.datetime.utcnow() + datetime.timedelta(minutes=25)
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 97
+
+    def test_batch_places_holds(self, token_client, test_product, db_session):
+        """SUCCESS: Batch orders hold stock per line"""
+        from db import StockReservation
+
+        token_client.post("/orders/batch", json={"items": [{"product_id": test_product.p_id, "quantity": 2}]})
+        assert db_session.query(StockReservation).one().quantity == 2
+
+    def test_cancel_returns_stock(self, token_client, test_product, db_session):
+        """SUCCESS: Cancelling a pending order releases its stock"""
+        from db import Order, StockReservation
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 4}, follow_redirects=False)
+        order = db_session.query(Order).one()
+        token_client.post(f"/orders/cancel/{order.o_id}", data={"csrf_token": "test-csrf-token"}, follow_redirects=False)
+
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 100
+        assert db_session.query(StockReservation).count() == 0
+
+    def test_payment_commits_stock(self, token_client, test_product, db_session):
+        """SUCCESS: Paying keeps the stock and clears the hold"""
+        from db import StockReservation
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 2}, follow_redirects=False)
+        token_client.post("/payment", data={"method": "COD", "csrf_token": "test-csrf-token"}, follow_redirects=False)
+
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 98
+        assert db_session.query(StockReservation).count() == 0
+
+    def test_sweeper_expires_abandoned_carts(self, token_client, test_product, db_session, test_db_session):
+        """SUCCESS: Expired holds return stock and drop the abandoned orders"""
+        from db import Order
+        from inventory import ReservationSweeper
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 5}, follow_redirects=False)
+        expire_all(db_session)
+
+        assert ReservationSweeper(test_db_session).sweep() == 1
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 100
+        assert db_session.query(Order).count() == 0
+
+    def test_sweeper_leaves_live_holds(self, token_client, test_product, db_session, test_db_session):
+        """EDGE: Holds that have not expired are untouched"""
+        from db import Order
+        from inventory import ReservationSweeper
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 5}, follow_redirects=False)
+        assert ReservationSweeper(test_db_session).sweep() == 0
+        assert db_session.query(Order).count() == 1
+
+    def test_sweeper_batches(self, db_session, test_db_session, test_user, test_product):
+        """SUCCESS: Many expired holds are released across several batches"""
+        from db import Order
+        from inventory import ReservationSweeper, hold_stock
+
+        orders = [Order(c_id=test_user.id, p_id=test_product.p_id, total_price=10, payment_status="pending", quantity=1) for _ in range(5)]
+        db_session.add_all(orders)
+        db_session.flush()
+        hold_stock(db_session, [(o.o_id, test_product.p_id, 1) for o in orders])
+        db_session.commit()
+        expire_all(db_session)
+
+        sweeper = ReservationSweeper(test_db_session, batch_size=2)
+        assert sweeper.sweep() == 5
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 105
+
+    def test_sweeper_errors_logged(self, caplog):
+        """FAIL: A failing sweep is logged with its traceback and the sweeper keeps running"""
+        import logging
+        import time
+        from inventory import ReservationSweeper
+
+        def broken_session():
+            raise RuntimeError("database is locked")
+
+        sweeper = ReservationSweeper(broken_session, interval=0.01)
+        with caplog.at_level(logging.ERROR, logger="reservations"):
+            sweeper.start()
+            deadline = time.monotonic() + 5
+            while len(caplog.records) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            sweeper.stop()
+        assert caplog.records[0].getMessage() == "Reservation sweeper error"
+        assert caplog.records[1].exc_info[1].args == ("database is locked",)
+
+    def test_payment_page_extends_holds(self, token_client, test_product, db_session, fake_stripe):
+        """EDGE: Reaching the payment page keeps the cart held"""
+        from db import StockReservation
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 1}, follow_redirects=False)
+        expire_all(db_session)
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+
+        db_session.expire_all()
+        assert db_session.query(StockReservation).one().expires_at > datetime.datetime.utcnow()
+
+    def test_late_payment_after_hold_expired(self, token_client, test_product, db_session, test_db_session, fake_stripe):
+        """SUCCESS: An expired hold on a cart with an open intent is kept, so a late payment still settles"""
+        from db import Order, StockReservation, Transactions
+        from inventory import ReservationSweeper
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 2}, follow_redirects=False)
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+        expire_all(db_session)
+
+        ReservationSweeper(test_db_session).sweep()
+        db_session.expire_all()
+        assert db_session.query(Order).one().payment_status == "pending"
+        assert db_session.query(StockReservation).one().expires_at > datetime.datetime.utcnow()
+
+        fake_stripe.succeed("pi_fake_1")
+        token_client.post("/payment", data={
+            "method": "CARD",
+            "payment_intent_id": "pi_fake_1",
+            "csrf_token": "test-csrf-token"
+        }, follow_redirects=False)
+
+        db_session.expire_all()
+        assert db_session.query(Order).one().payment_status == "PAID"
+        assert db_session.query(Transactions).one().status == "success"
+        assert db_session.query(StockReservation).count() == 0
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 98
+
+    def test_stale_intent_does_not_pin_stock(self, token_client, test_product, db_session, test_db_session, fake_stripe):
+        """EDGE: An intent older than the grace window no longer keeps its cart from being swept"""
+        from db import Order, PaymentIntentOrder
+        from inventory import ReservationSweeper, INTENT_GRACE
+
+        token_client.post("/order", data={"product_id": test_product.p_id, "quantity": 2}, follow_redirects=False)
+        token_client.post("/checkout/start", follow_redirects=False)
+        token_client.get("/payment")
+        db_session.query(PaymentIntentOrder).update({"created_at": datetime.datetime.utcnow() - INTENT_GRACE - datetime.timedelta(minutes=1)})
+        db_session.commit()
+        expire_all(db_session)
+
+        ReservationSweeper(test_db_session).sweep()
+        assert db_session.query(Order).count() == 0
+        db_session.refresh(test_product)
+        assert test_product.stock_quantity == 100
@@ -0,0 +1,65 @@
+"""
+Review Tests
+Tests for adding reviews and the denormalized rating stats
+"""
+
+import pytest
+
+
+@pytest.mark.products
+class TestRatingStats:
+    """Test cases for product_rating_stats maintenance"""
+
+    def add_review(self, client, product_id, rating):
+        return client.post("/add-review", data={
+            "product_id": product_id,
+            "rating": rating,
+            "comment": "Nice",
+            "csrf_token": "test-csrf-token"
+        }, follow_redirects=False)
+
+    def test_add_review_updates_stats(self, token_client, paid_order, test_product, db_session):
+        """SUCCESS: Review updates sum, count and histogram in the same commit"""
+        from db import ProductRatingStats
+
+        response = self.add_review(token_client, test_product.p_id, 4)
+        assert response.status_code == 303
+
+        stats = db_session.get(ProductRatingStats, test_product.p_id)
+        assert stats.rating_sum == 4
+        assert stats.rating_count == 1
+        assert stats.histogram == {1: 0, 2: 0, 3: 0, 4: 1, 5: 0}
+
+    def test_review_without_purchase_leaves_stats_untouched(self, token_client, test_product, db_session):
+        """FAIL: Rejected review does not touch stats"""
+        from db import ProductRatingStats
+
+        self.add_review(token_client, test_product.p_id, 5)
+        assert db_session.get(ProductRatingStats, test_product.p_id) is None
+
+    def test_product_detail_reads_stats(self, client, test_product, db_session):
+        """SUCCESS: Product detail shows the aggregate from the stats table"""
+        from db import ProductRatingStats
+
+        db_session.add(ProductRatingStats(product_id=test_product.p_id, rating_sum=9, rating_count=2, star_4=1, star_5=1))
+        db_session.commit()
+
+        response = client.get(f"/product/{test_product.p_id}")
+        assert response.status_code == 200
+        assert b'Number("4.5' in response.content
+
+    def test_rebuild_matches_reviews(self, db_session, test_product, test_user, other_user):
+        """SUCCESS: Rebuild backfills stats from existing reviews"""
+        from db import Review, ProductRatingStats
+        from ratings import rebuild_rating_stats
+
+        db_session.add_all([
+            Review(user_id=test_user.id, product_id=test_product.p_id, rating=5),
+            Review(user_id=other_user.id, product_id=test_product.p_id, rating=2),
+        ])
+        db_session.commit()
+
+        assert rebuild_rating_stats(db_session) == 1
+        stats = db_session.get(ProductRatingStats, test_product.p_id)
+        assert (stats.rating_sum, stats.rating_count, stats.star_5, stats.star_2) == (7, 2, 1, 1)
+        assert stats.avg_rating == 3.5
@@ -0,0 +1,72 @@
+"""
+Search Tests
+Tests for the FTS5-backed product search
+"""
+
+import pytest
+
+
+@pytest.mark.products
+class TestSearch:
+    """Test cases for product search"""
+
+    @pytest.fixture
+    def catalog(self, db_session):
+        from db import Products
+
+        products = [
+            Products(title="Red Running Shoes", description="Lightweight trainers", price=100, discount=20, image="uploads/a.jpg", category="Footwear"),
+            Products(title="Leather Wallet", description="Slim wallet for running errands", price=50, discount=10, image="uploads/b.jpg", category="Accessories"),
+            Products(title="Coffee Mug", description="Ceramic mug", price=20, discount=10, image="uploads/c.jpg", category="Kitchen"),
+        ]
+        db_session.add_all(products)
+        db_session.commit()
+        return products
+
+    def test_title_match_ranks_first(self, client, catalog):
+        """SUCCESS: Title hits outrank description hits"""
+        data = client.get("/api/search?q=running").json()
+        titles = [p["title"] for p in data["items"]]
+        assert titles == ["Red Running Shoes", "Leather Wallet"]
+
+    def test_prefix_match(self, client, catalog):
+        """SUCCESS: Last term matches as a prefix"""
+        data = client.get("/api/search?q=cera").json()
+        assert [p["title"] for p in data["items"]] == ["Coffee Mug"]
+
+    def test_category_match(self, client, catalog):
+        """SUCCESS: Category is searchable"""
+        data = client.get("/api/search?q=footwear").json()
+        assert [p["title"] for p in data["items"]] == ["Red Running Shoes"]
+
+    def test_pagination(self, client, catalog):
+        """SUCCESS: Results are paginated"""
+        first = client.get("/api/search?q=running&limit=1").json()
+        second = client.get("/api/search?q=running&limit=1&page=2").json()
+        assert first["has_more"] is True
+        assert second["has_more"] is False
+        assert first["items"][0]["p_id"] != second["items"][0]["p_id"]
+
+    def test_fts_syntax_is_escaped(self, client, catalog):
+        """EDGE: FTS operators in the query do not raise"""
+        response = client.get('/api/search?q=" OR NEAR( mug*')
+        assert response.status_code == 200
+
+    def test_empty_query(self, client, catalog):
+        """EDGE: Empty query returns no results"""
+        assert client.get("/api/search?q=").json()["items"] == []
+
+    def test_index_follows_updates(self, client, catalog, db_session):
+        """SUCCESS: Category updates are reflected in the index"""
+        catalog[2].category = "Drinkware"
+        db_session.commit()
+        data = client.get("/api/search?q=drinkware").json()
+        assert [p["title"] for p in data["items"]] == ["Coffee Mug"]
+        assert client.get("/api/search?q=kitchen").json()["items"] == []
+
+    def test_search_page_renders(self, client, catalog):
+        """SUCCESS: HTML search page renders matches"""
+        response = client.get("/search?q=wallet")
+        assert response.status_code == 200
+        assert b"Leather Wallet" in response.content
+        assert b"Coffee Mug" not in response.content
@@ -0,0 +1,188 @@
+"""
+Stripe Webhook Tests
+Tests for signed webhook ingestion and background settlement
+"""
+
+import hashlib
+import hmac
+import json
+import time
+import pytest
+
+SECRET = "whsec_test"
+
+
+def signed(event, secret=SECRET, timestamp=None):
+    payload = json.dumps(event).encode()
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return payload, {"Stripe-Signature": f"t={timestamp},v1={signature}", "Content-Type": "application/json"}
+
+
+def succeeded_event(event_id, intent_id, user_id, order_ids, amount=8000):
+    return {
+        "id": event_id,
+        "type": "payment_intent.succeeded",
+        "data": {"object": {
+            "id": intent_id,
+            "amount": amount,
+            "status": "succeeded",
+            "metadata": {"user_id": str(user_id), "order_ids": ",".join(str(o) for o in order_ids)}
+        }}
+    }
+
+
+@pytest.fixture
+def webhook_client(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "STRIPE_WEBHOOK_SECRET", SECRET)
+    return client
+
+
+@pytest.fixture
+def worker(test_db_session):
+    from payments import PaymentEventWorker
+
+    return PaymentEventWorker(test_db_session, batch_size=10)
+
+
+@pytest.mark.payment
+class TestStripeWebhook:
+    """Test cases for the /stripe/webhook endpoint and event worker"""
+
+    def test_valid_event_is_stored(self, webhook_client, db_session, test_order):
+        """SUCCESS: Signed event is persisted and acknowledged"""
+        from db import PaymentEvent
+
+        payload, headers = signed(succeeded_event("evt_1", "pi_1", test_order.c_id, [test_order.o_id]))
+        response = webhook_client.post("/stripe/webhook", content=payload, headers=headers)
+        assert response.status_code == 200
+        assert db_session.query(PaymentEvent).filter(PaymentEvent.event_id == "evt_1").count() == 1
+
+    def test_duplicate_delivery_is_ignored(self, webhook_client, db_session, test_order):
+        """SUCCESS: Redelivered event id is stored once"""
+        from db import PaymentEvent
+
+        payload, headers = signed(succeeded_event("evt_1", "pi_1", test_order.c_id, [test_order.o_id]))
+        webhook_client.post("/stripe/webhook", content=payload, headers=headers)
+        response = webhook_client.post("/stripe/webhook", content=payload, headers=headers)
+        assert response.status_code == 200
+        assert db_session.query(PaymentEvent).count() == 1
+
+    def test_bad_signature_rejected(self, webhook_client):
+        """FAIL: Tampered signature is rejected"""
+        payload, headers = signed({"id": "evt_x", "type": "ping"}, secret="wrong")
+        assert webhook_client.post("/stripe/webhook", content=payload, headers=headers).status_code == 400
+
+    def test_malformed_event_rejected(self, webhook_client):
+        """FAIL: A signed payload without an event id or type is a 400, not a 500"""
+        for event in ({"type": "ping"}, {"id": "evt_x"}, ["evt_x"]):
+            payload, headers = signed(event)
+            assert webhook_client.post("/stripe/webhook", content=payload, headers=headers).status_code == 400
+
+    def test_stale_timestamp_rejected(self, webhook_client):
+        """FAIL: Replayed event outside the tolerance window is rejected"""
+        payload, headers = signed({"id": "evt_x", "type": "ping"}, timestamp=int(time.time()) - 3600)
+        assert webhook_client.post("/stripe/webhook", content=payload, headers=headers).status_code == 400
+
+    def test_worker_settles_orders(self, db_session, worker, test_order):
+        """SUCCESS: Worker applies succeeded events to orders and transactions"""
+        from db import Transactions, Payment, PaymentEvent
+        from payments import store_payment_event
+
+        store_payment_event(db_session, succeeded_event("evt_1", "pi_1", test_order.c_id, [test_order.o_id]))
+        assert worker.process_batch() == 1
+
+        db_session.expire_all()
+        assert test_order.payment_status == "PAID"
+        assert db_session.query(Transactions).filter(Transactions.stripe_intent_id == "pi_1").count() == 1
+        assert db_session.query(Payment).filter(Payment.o_id == test_order.o_id).count() == 1
+        assert db_session.query(PaymentEvent).first().processed_at is not None
+
+    def test_worker_is_idempotent_per_intent(self, db_session, worker, test_order):
+        """SUCCESS: Two events for one intent settle it once"""
+        from db import Transactions
+        from payments import store_payment_event
+
+        store_payment_event(db_session, succeeded_event("evt_1", "pi_1", test_order.c_id, [test_order.o_id]))
+        store_payment_event(db_session, succeeded_event("evt_2", "pi_1", test_order.c_id, [test_order.o_id]))
+        assert worker.process_batch() == 2
+        assert db_session.query(Transactions).count() == 1
+
+    def test_worker_only_settles_intent_cart(self, db_session, worker, test_order, test_user, test_product):
+        """EDGE: Orders added after the intent was created stay pending"""
+        from db import Order
+        from payments import store_payment_event
+
+        later = Order(c_id=test_user.id, p_id=test_product.p_id, total_price=10, payment_status="pending", quantity=1)
+        db_session.add(later)
+        db_session.commit()
+
+        store_payment_event(db_session, succeeded_event("evt_1", "pi_1", test_order.c_id, [test_order.o_id]))
+        worker.process_batch()
+        db_session.expire_all()
+        assert test_order.payment_status == "PAID"
+        assert later.payment_status == "pending"
+
+    def test_recorded_cart_wins_without_metadata(self, db_session, worker, test_order, test_user, test_product):
+        """EDGE: With the order_ids metadata dropped, only the orders recorded for the intent are settled"""
+        from db import Order
+        from payments import record_intent, store_payment_event
+
+        record_intent(db_session, "pi_1", [test_order.o_id])
+        later = Order(c_id=test_user.id, p_id=test_product.p_id, total_price=10, payment_status="pending", quantity=1)
+        db_session.add(later)
+        db_session.commit()
+
+        event = succeeded_event("evt_1", "pi_1", test_user.id, [])
+        del event["data"]["object"]["metadata"]["order_ids"]
+        store_payment_event(db_session, event)
+        worker.process_batch()
+        db_session.expire_all()
+        assert test_order.payment_status == "PAID"
+        assert later.payment_status == "pending"
+
+    def test_unknown_cart_settles_nothing(self, db_session, worker, test_order, test_user):
+        """FAIL: An intent with no recorded orders and no order_ids never settles the current cart"""
+        from payments import store_payment_event
+
+        event = succeeded_event("evt_1", "pi_unknown", test_user.id, [])
+        del event["data"]["object"]["metadata"]["order_ids"]
+        store_payment_event(db_session, event)
+        worker.process_batch()
+        db_session.expire_all()
+        assert test_order.payment_status == "pending"
+
+    def test_failed_event_logged_and_retried(self, db_session, worker, test_order, monkeypatch, caplog):
+        """FAIL: An event that raises is logged with its traceback and left for a later attempt"""
+        import logging
+        import payments
+        from db import PaymentEvent
+
+        def broken(db, event):
+            raise RuntimeError("settlement exploded")
+
+        monkeypatch.setattr(payments, "apply_payment_event", broken)
+        payments.store_payment_event(db_session, succeeded_event("evt_1", "pi_1", test_order.c_id, [test_order.o_id]))
+        with caplog.at_level(logging.ERROR, logger="payments"):
+            assert worker.process_batch() == 1
+        assert caplog.records[0].exc_info[1].args == ("settlement exploded",)
+        db_session.expire_all()
+        event = db_session.query(PaymentEvent).one()
+        assert event.attempts == 1 and event.processed_at is None
+
+    def test_browser_confirm_uses_stored_event(self, token_client, fake_stripe, db_session, test_order):
+        """SUCCESS: Post-back settles from the stored event without calling Stripe"""
+        from payments import store_payment_event
+
+        store_payment_event(db_session, succeeded_event("evt_1", "pi_local", test_order.c_id, [test_order.o_id]))
+        response = token_client.post("/payment", data={
+            "method": "CARD",
+            "payment_intent_id": "pi_local",
+            "csrf_token": "test-csrf-token"
+        }, follow_redirects=False)
+        assert response.status_code == 303
+        assert fake_stripe.calls == []
+        db_session.refresh(test_order)
+        assert test_order.payment_status == "PAID"
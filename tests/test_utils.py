@@ -3,6 +3,7 @@ Utility Functions Tests
 Tests for helper functions like password hashing and verification
 """
 
+import os
 import pytest
 from main import hash_password, verify_password
 
@@ -94,4 +95,218 @@ class TestUtilityFunctions:
         hashed = hash_password(password)
         assert verify_password("testpassword", hashed) is False
         assert verify_password("TESTPASSWORD", hashed) is False
-        assert verify_password("TestPassword", hashed) is True
\ No newline at end of file
+        assert verify_password("TestPassword", hashed) is True
+
+@pytest.mark.utility
+class TestBcryptPool:
+    """Test cases for the dedicated bcrypt executor"""
+
+    def test_saturated_pool_rejects(self):
+        """FAIL: Work beyond workers + queue limit is rejected"""
+        import threading
+        from hashing import BcryptPool, PoolSaturated
+
+        pool = BcryptPool(workers=1, queue_limit=0)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=pool.run, args=(block,))
+        worker.start()
+        started.wait(5)
+        try:
+            with pytest.raises(PoolSaturated):
+                pool.run(lambda: None)
+            assert pool.stats()["rejected"] == 1
+        finally:
+            release.set()
+            worker.join()
+        assert pool.run(lambda: 42) == 42
+
+    def test_saturation_maps_to_503(self, monkeypatch):
+        """FAIL: Saturated pool surfaces as HTTP 503"""
+        import main
+        from fastapi import HTTPException
+        from hashing import PoolSaturated
+
+        class FullPool:
+            def run(self, fn, *args):
+                raise PoolSaturated()
+
+        monkeypatch.setattr(main, "bcrypt_pool", FullPool())
+        with pytest.raises(HTTPException) as exc:
+            hash_password("password123")
+        assert exc.value.status_code == 503
+
+    def test_login_rehashes_outdated_cost(self, client, db_session):
+        """SUCCESS: Login transparently upgrades a hash with a different cost"""
+        from passlib.context import CryptContext
+        from hashing import BCRYPT_ROUNDS
+        from db import User
+
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("password123")
+        user = User(email="legacy@example.com", password=old_hash)
+        db_session.add(user)
+        db_session.commit()
+
+        client.cookies.set("csrf_token", "test-csrf-token")
+        response = client.post("/login", data={
+            "email": "legacy@example.com",
+            "password": "password123",
+            "csrf_token": "test-csrf-token"
+        }, follow_redirects=False)
+        assert response.status_code == 303
+
+        db_session.refresh(user)
+        assert user.password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+        assert verify_password("password123", user.password)
+
+    def test_sync_pages_responsive_while_saturated(self, client, test_user, monkeypatch):
+        """EDGE: Logins waiting on bcrypt do not take the threadpool away from sync pages"""
+        import asyncio
+        import threading
+        import anyio.to_thread
+        import httpx
+        import main
+        from hashing import BcryptPool
+
+        release = threading.Event()
+
+        class SlowHash:
+            def verify_and_update(self, *args):
+                release.wait(10)
+                return False, None
+
+        monkeypatch.setattr(main, "pwd", SlowHash())
+        monkeypatch.setattr(main, "bcrypt_pool", BcryptPool(workers=1, queue_limit=16))
+
+        async def scenario():
+            anyio.to_thread.current_default_thread_limiter().total_tokens = 4
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver", cookies={"csrf_token": "t"}) as http:
+                logins = [asyncio.create_task(http.post("/login", data={"email": test_user.email, "password": "x", "csrf_token": "t"})) for _ in range(8)]
+                for _ in range(500):
+                    if main.bcrypt_pool.in_flight >= 8:
+                        break
+                    await asyncio.sleep(0.01)
+                try:
+                    page = await asyncio.wait_for(http.get("/register"), timeout=5)
+                finally:
+                    release.set()
+                    responses = await asyncio.gather(*logins)
+            return page, responses
+
+        page, responses = asyncio.run(scenario())
+        assert page.status_code == 200
+        assert all(r.status_code == 200 for r in responses)
+
+
+@pytest.mark.utility
+class TestEngineFactory:
+    """Test cases for the SQLite performance profile applied by create_db_engine"""
+
+    def test_pragmas_applied(self, test_engine):
+        """SUCCESS: Every connection gets the configured pragmas"""
+        with test_engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+            assert conn.exec_driver_sql("PRAGMA temp_store").scalar() == 2
+
+    def test_app_engine_uses_test_database(self):
+        """EDGE: The app's own engine never points at the main database during tests"""
+        from db import engine, async_engine
+
+        assert engine.url.database == "./test_suite.db"
+        assert async_engine.url.database == "./test_suite.db"
+
+    def test_pool_sized(self, test_engine):
+        """SUCCESS: Pool matches the request threadpool"""
+        from db import DB_POOL_SIZE
+
+        assert test_engine.pool.size() == DB_POOL_SIZE
+
+    def test_custom_pragmas(self, tmp_path):
+        """EDGE: Callers can override the profile"""
+        from db import create_db_engine
+
+        engine = create_db_engine(f"sqlite:///{tmp_path}/custom.db", pragmas={"journal_mode": "DELETE", "synchronous": "FULL"})
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "delete"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 2
+        engine.dispose()
+
+    def test_memory_database(self):
+        """EDGE: In-memory URLs work without pool sizing"""
+        from db import create_db_engine
+
+        engine = create_db_engine("sqlite://")
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("SELECT 1").scalar() == 1
+
+
+@pytest.mark.utility
+class TestStartup:
+    """Test cases for the explicit schema setup and startup phase"""
+
+    def test_import_has_no_side_effects(self, tmp_path):
+        """SUCCESS: Importing the app neither creates nor opens the database"""
+        import subprocess
+        import sys
+
+        path = tmp_path / "lazy.db"
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}"}
+        subprocess.run([sys.executable, "-c", "import main"], env=env, check=True, capture_output=True)
+        assert not path.exists()
+
+    def test_init_db_creates_declared_indexes(self, tmp_path):
+        """SUCCESS: init_db builds tables, search index and every model index"""
+        from sqlalchemy import inspect
+        from db import create_db_engine, init_db, check_schema
+
+        engine = create_db_engine(f"sqlite:///{tmp_path}/init.db")
+        assert "missing table users" in check_schema(engine)
+        init_db(engine)
+        assert check_schema(engine) == []
+        indexes = {i["name"] for t in ("product_views", "email_logs") for i in inspect(engine).get_indexes(t)}
+        assert {"idx_user_product_view", "idx_email_user_time"} <= indexes
+        engine.dispose()
+
+    def test_check_schema_reports_drift(self, tmp_path):
+        """FAIL: A dropped index is reported and restored by init_db"""
+        from db import create_db_engine, init_db, check_schema
+
+        engine = create_db_engine(f"sqlite:///{tmp_path}/drift.db")
+        init_db(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX idx_email_user_time")
+        assert check_schema(engine) == ["missing index idx_email_user_time on email_logs"]
+        init_db(engine)
+        assert check_schema(engine) == []
+        engine.dispose()
+
+    def test_check_mode_refuses_drift(self, monkeypatch, test_engine):
+        """FAIL: STARTUP_SCHEMA=check stops the app from starting on a drifted schema"""
+        import main
+        from fastapi.testclient import TestClient
+
+        monkeypatch.setattr(main, "STARTUP_SCHEMA", "check")
+        with test_engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX idx_user_product_view")
+        with pytest.raises(RuntimeError, match="idx_user_product_view"):
+            with TestClient(main.app):
+                pass
+
+    def test_startup_timings_reported(self, monkeypatch):
+        """SUCCESS: Each startup step is timed and exposed in the stats"""
+        import main
+        from fastapi.testclient import TestClient
+
+        monkeypatch.setattr(main, "STARTUP_SCHEMA", "check")
+        monkeypatch.setattr(main, "INTERNAL_API_KEY", "ops-key")
+        with TestClient(main.app) as client:
+            timings = client.get("/internal/stats", headers={"x-internal-key": "ops-key"}).json()["startup_ms"]
+        assert {"schema", "templates", "total"} <= set(timings)
+        assert main.templates.env.cache
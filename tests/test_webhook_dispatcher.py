@@ -0,0 +1,109 @@
+"""
+Webhook Dispatcher Tests
+Tests for background delivery of product-view webhooks
+"""
+
+import time
+import pytest
+from stubs import WebhookStub
+
+
+def make_dispatcher(url, **kwargs):
+    from dispatcher import WebhookDispatcher
+    from resilience import CircuitBreaker
+
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    return WebhookDispatcher(url, timeout=1, **kwargs)
+
+
+@pytest.mark.utility
+class TestWebhookDispatcher:
+    """Test cases for the webhook dispatcher"""
+
+    def test_events_are_delivered(self):
+        """SUCCESS: Submitted events reach the receiver"""
+        with WebhookStub() as stub:
+            dispatcher = make_dispatcher(stub.url)
+            dispatcher.start()
+            dispatcher.submit({"user_id": 1})
+            assert stub.wait_for(1)
+            dispatcher.stop()
+        assert stub.received == [{"user_id": 1}]
+        assert dispatcher.stats()["sent"] == 1
+
+    def test_batching(self):
+        """SUCCESS: Queued events are posted together when batching is on"""
+        with WebhookStub() as stub:
+            dispatcher = make_dispatcher(stub.url, batch_size=10)
+            for i in range(3):
+                dispatcher.submit({"user_id": i})
+            dispatcher.start()
+            assert stub.wait_for(1)
+            dispatcher.stop()
+        assert stub.received == [[{"user_id": 0}, {"user_id": 1}, {"user_id": 2}]]
+
+    def test_retry_then_success(self):
+        """SUCCESS: Failed posts are retried with backoff"""
+        with WebhookStub(fail_first=1) as stub:
+            dispatcher = make_dispatcher(stub.url, retries=3, breaker=None)
+            dispatcher.start()
+            dispatcher.submit({"user_id": 1})
+            deadline = time.monotonic() + 5
+            while dispatcher.stats()["sent"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            dispatcher.stop()
+        assert len(stub.received) == 2
+        assert dispatcher.stats()["retried"] >= 1
+        assert dispatcher.stats()["sent"] == 1
+
+    def test_circuit_opens_on_failures(self):
+        """FAIL: Repeated failures open the circuit and stop calling out"""
+        with WebhookStub(status=500) as stub:
+            dispatcher = make_dispatcher(stub.url, retries=5)
+            dispatcher.start()
+            dispatcher.submit({"user_id": 1})
+            deadline = time.monotonic() + 5
+            while dispatcher.stats()["short_circuited"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            dispatcher.stop()
+        assert dispatcher.stats()["breaker"] == "open"
+        assert len(stub.received) == 2
+
+    def test_exhausted_retries_logged(self, caplog):
+        """FAIL: A post that fails every attempt is logged with its traceback"""
+        import logging
+
+        with WebhookStub(status=500) as stub:
+            dispatcher = make_dispatcher(stub.url, retries=0, breaker=None)
+            with caplog.at_level(logging.ERROR, logger="webhooks"):
+                assert dispatcher._send([{"user_id": 1}]) is False
+        assert caplog.records[0].getMessage() == "Webhook failed after 1 attempts"
+        assert caplog.records[0].exc_info is not None
+        assert dispatcher.stats()["failed"] == 1
+
+    def test_full_queue_drops(self):
+        """EDGE: Events beyond the queue bound are dropped and counted"""
+        dispatcher = make_dispatcher("http://127.0.0.1:9/unused", maxsize=2)
+        results = [dispatcher.submit({"n": i}) for i in range(3)]
+        assert results == [True, True, False]
+        assert dispatcher.stats()["dropped"] == 1
+        assert dispatcher.stats()["queue_depth"] == 2
+
+    def test_page_latency_independent_of_webhook(self, token_client, test_product, test_db_session, monkeypatch):
+        """SUCCESS: A slow receiver does not slow the product page"""
+        import main
+        from view_buffer import ViewBuffer
+
+        monkeypatch.setattr(main, "view_buffer", ViewBuffer(test_db_session, flush_size=100, flush_interval=60))
+        with WebhookStub(delay=2) as stub:
+            dispatcher = make_dispatcher(stub.url)
+            monkeypatch.setattr(main, "webhook_dispatcher", dispatcher)
+            dispatcher.start()
+            started = time.perf_counter()
+            response = token_client.get(f"/product/{test_product.p_id}")
+            elapsed = time.perf_counter() - started
+            assert stub.wait_for(1)
+            dispatcher.stop()
+        assert response.status_code == 200
+        assert elapsed < 1
+        assert stub.received[0]["product_id"] == test_product.p_id
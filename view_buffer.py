@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+import datetime
+import logging
+from collections import OrderedDict
+
+from sqlalchemy import insert
+
+from db import ProductView
+
+logger = logging.getLogger("views")
+
+
+class ViewBuffer:
+    # Product views are buffered in memory and written with one executemany per flush,
+    # so page views no longer queue behind each other on the SQLite write lock.
+    def __init__(self, session_factory, flush_size: int, flush_interval: float, window_minutes: int = 30, max_users: int = 100000, max_pending: int = 50000):
+        self.session_factory = session_factory
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.window = window_minutes * 60
+        self.max_users = max_users
+        self.max_pending = max_pending
+        self._pending = []
+        self._last_seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.recorded = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.dropped = 0
+
+    def record(self, user_id: int, product_id: int) -> bool:
+        # Returns True when this is the user's first view in the sliding window
+        now = time.monotonic()
+        with self._lock:
+            self._pending.append({"user_id": user_id, "product_id": product_id, "viewed_at": datetime.datetime.utcnow()})
+            self.recorded += 1
+            last = self._last_seen.pop(user_id, None)
+            self._last_seen[user_id] = now
+            if len(self._last_seen) > self.max_users:
+                self._last_seen.popitem(last=False)
+            full = len(self._pending) >= self.flush_size
+        if full:
+            if self._thread is not None:
+                self._wake.set()
+            else:
+                self.flush()
+        return last is None or now - last >= self.window
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            db = self.session_factory()
+            try:
+                db.execute(insert(ProductView), rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.exception("View flush failed")
+                with self._lock:
+                    # Keep the newest rows for the next attempt, drop the overflow
+                    combined = rows + self._pending
+                    self.dropped += max(0, len(combined) - self.max_pending)
+                    self._pending = combined[-self.max_pending:]
+                return 0
+            finally:
+                db.close()
+            self.flushed += len(rows)
+            self.flushes += 1
+            return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="view-buffer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "tracked_users": len(self._last_seen),
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+        }
+
+
+def create_view_buffer(session_factory):
+    return ViewBuffer(
+        session_factory,
+        flush_size=int(os.getenv("VIEW_FLUSH_SIZE", "200")),
+        flush_interval=float(os.getenv("VIEW_FLUSH_INTERVAL", "2")),
+    )